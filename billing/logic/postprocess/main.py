@@ -3,24 +3,38 @@ from pathlib import Path
 from typing import List
 
 from .utils.db_utils import get_db_connection
+from .utils.data_validation import get_approved_unpaid_bills, advance_bill_checkpoint
 from .utils.validation import validate_bill_data
 from .jobs.eobr_generator import generate_eobr
 from .jobs.excel_generator import generate_excel
 from .jobs.historical_logger import update_historical_log
 from .jobs.payment_updater import mark_bills_as_paid
 
+from billing.logic.process.utils.bill_journal import POSTPROCESS_CONSUMER
+
 logger = logging.getLogger(__name__)
 
-def get_approved_unpaid_bills():
-    """Fetch bills that are approved but not yet paid."""
-    # TODO: Implement the query to get approved unpaid bills
-    pass
+def handled_checkpoint(bills: List[dict], valid_bills: List[dict]) -> int:
+    """
+    Highest journal event the postprocess checkpoint can move to.
+    
+    Bills that failed validation stay after the checkpoint so the next run
+    picks them up again; the mark stops just before the oldest of them.
+    """
+    valid_ids = {bill['id'] for bill in valid_bills}
+    skipped = [bill['journal_event_id'] for bill in bills if bill['id'] not in valid_ids]
+    if skipped:
+        return min(skipped) - 1
+    return max(bill['journal_event_id'] for bill in bills)
 
 def process_bills(bill_ids: List[int]):
     """Main function to process a batch of bills."""
     try:
-        # 1. Get approved unpaid bills
-        bills = get_approved_unpaid_bills()
+        # 1. Get approved unpaid bills that changed since the last postprocess run
+        bills = get_approved_unpaid_bills(consumer=POSTPROCESS_CONSUMER)
+        if not bills:
+            logger.info("No newly approved bills since the last postprocess run")
+            return
         
         # 2. Validate data
         valid_bills = validate_bill_data(bills)
@@ -37,6 +51,9 @@ def process_bills(bill_ids: List[int]):
         # 6. Mark bills as paid
         mark_bills_as_paid(valid_bills)
         
+        # 7. Move the journal checkpoint past the handled bills
+        advance_bill_checkpoint(POSTPROCESS_CONSUMER, handled_checkpoint(bills, valid_bills))
+        
         logger.info(f"Successfully processed {len(valid_bills)} bills")
         
     except Exception as e:
@@ -6,6 +6,7 @@ import re
 from typing import List, Dict, Any, Tuple, Optional
 from pathlib import Path
 from datetime import datetime, date
+from functools import lru_cache
 from decimal import Decimal, InvalidOperation
 
 logger = logging.getLogger(__name__)
@@ -168,6 +169,8 @@ def clean_currency_amount(amount: Any) -> Optional[Decimal]:
     
     return None
 
+# The same DOB, injury and service dates repeat across bills
+@lru_cache(maxsize=8192)
 def standardize_date_format(date_str: str) -> Optional[str]:
     """
     Standardize date strings to YYYY-MM-DD format.
@@ -2,10 +2,15 @@
 
 import logging
 import sqlite3
+import sys
 from typing import List, Dict, Any, Tuple, Optional
 from pathlib import Path
 from datetime import datetime
 
+# The bill_events journal is owned by the process stage
+sys.path.append(str(Path(__file__).resolve().parents[4]))
+from billing.logic.process.utils.bill_journal import ensure_bill_journal, advance_checkpoint
+
 logger = logging.getLogger(__name__)
 
 # Get the absolute path to the monolith root directory
@@ -78,12 +83,16 @@ def inspect_bill_line_item_table():
     finally:
         conn.close()
 
-def get_approved_unpaid_bills(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+def get_approved_unpaid_bills(limit: Optional[int] = None, consumer: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Fetch bills that are approved and not yet paid.
     
     Args:
         limit: Optional maximum number of bills to fetch
+        consumer: Optional checkpoint name in bill_event_checkpoints. If given,
+            only bills that became REVIEWED after that checkpoint in the
+            bill_events journal are returned, oldest change first, each with a
+            journal_event_id for advance_bill_checkpoint()
         
     Returns:
         List of bill dictionaries with full details
@@ -92,9 +101,31 @@ def get_approved_unpaid_bills(limit: Optional[int] = None) -> List[Dict[str, Any
     cursor = conn.cursor()
     
     try:
-        query = """
+        journal_column = ""
+        journal_join = ""
+        order_by = "pb.created_at ASC"
+        params = []
+        
+        if consumer:
+            # Read the bill_events journal instead of re-reading every REVIEWED bill
+            ensure_bill_journal(conn)
+            conn.commit()
+            journal_column = "e.journal_event_id,"
+            journal_join = """
+            INNER JOIN (
+                SELECT bill_id, MAX(id) AS journal_event_id
+                FROM bill_events
+                WHERE new_status = 'REVIEWED'
+                AND id > COALESCE((SELECT last_event_id FROM bill_event_checkpoints WHERE consumer = ?), 0)
+                GROUP BY bill_id
+            ) e ON e.bill_id = pb.id"""
+            order_by = "e.journal_event_id ASC"
+            params.append(consumer)
+        
+        query = f"""
             SELECT 
                 pb.*,
+                {journal_column}
                 o.Order_ID,
                 o.FileMaker_Record_Number,
                 o.PatientName,
@@ -133,19 +164,19 @@ def get_approved_unpaid_bills(limit: Optional[int] = None) -> List[Dict[str, Any
                 p."Provider Network" as provider_network,
                 p.Phone as provider_phone,
                 p."Fax Number" as provider_fax
-            FROM ProviderBill pb
+            FROM ProviderBill pb{journal_join}
             INNER JOIN orders o ON pb.claim_id = o.Order_ID
             INNER JOIN providers p ON o.provider_id = p.PrimaryKey
             WHERE pb.status = 'REVIEWED'
             AND pb.action = 'apply_rate'
             AND (pb.bill_paid IS NULL OR pb.bill_paid = 'N')
-            ORDER BY pb.created_at ASC
+            ORDER BY {order_by}
         """
         
         if limit:
             query += f" LIMIT {limit}"
             
-        cursor.execute(query)
+        cursor.execute(query, params)
         bills = [dict(row) for row in cursor.fetchall()]
         
         # Debug logging
@@ -167,6 +198,24 @@ def get_approved_unpaid_bills(limit: Optional[int] = None) -> List[Dict[str, Any
     finally:
         conn.close()
 
+def advance_bill_checkpoint(consumer: str, event_id: int) -> None:
+    """
+    Record that a consumer has handled every bill_events entry up to event_id.
+    
+    Args:
+        consumer: Checkpoint name passed to get_approved_unpaid_bills
+        event_id: Highest journal_event_id among the bills that were handled
+    """
+    conn = get_db_connection()
+    
+    try:
+        ensure_bill_journal(conn)
+        advance_checkpoint(conn, consumer, event_id)
+        conn.commit()
+        logger.info(f"Advanced {consumer} checkpoint to bill event {event_id}")
+    finally:
+        conn.close()
+
 def get_bill_line_items(bill_id: str) -> List[Dict[str, Any]]:
     """
     Get all line items for a specific bill.
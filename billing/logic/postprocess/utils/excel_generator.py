@@ -9,6 +9,8 @@ import logging
 import re
 from decimal import Decimal
 
+from .ledger_store import EOBRLedger, open_ledger
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,82 +23,47 @@ class ExcelBatchGenerator:
     """
     Generator for Excel batch files and historical log updates.
     Handles duplicate detection, EOBR numbering, and business day calculations.
+    Historical records live in an indexed SQLite ledger (see ledger_store.py);
+    the historical Excel file is imported once and exported on demand.
     """
     
-    def __init__(self, historical_excel_path: Path = None):
+    def __init__(self, historical_excel_path: Path = None, ledger_path: Path = None):
         """
         Initialize the Excel batch generator.
         
         Args:
-            historical_excel_path: Path to the Historical_EOBR_Data.xlsx file
+            historical_excel_path: Path to the Historical_EOBR_Data.xlsx file; imported into
+                the ledger the first time, and the default target of export_historical_excel()
+            ledger_path: Path to the SQLite EOBR ledger (defaults to Historical_EOBR_Ledger.db
+                next to the historical Excel file)
         """
         if historical_excel_path is None:
             historical_excel_path = Path(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolith\billing\logic\postprocess\batch_outputs\Historical_EOBR_Data copy.xlsx")
+        if ledger_path is None:
+            ledger_path = historical_excel_path.with_name("Historical_EOBR_Ledger.db")
         
         self.historical_excel_path = historical_excel_path
-        self.historical_df = None
+        self.ledger: EOBRLedger = open_ledger(ledger_path, seed_excel_path=historical_excel_path)
         self.us_holidays = None
         self.current_batch_keys = set()  # Track keys from current batch
-        self._load_historical_data()
         self._init_holidays()
     
-    def _load_historical_data(self):
-        """Load historical Excel data or create empty DataFrame."""
-        try:
-            if self.historical_excel_path.exists():
-                # Read Excel with explicit dtype handling for numeric columns
-                self.historical_df = pd.read_excel(
-                    self.historical_excel_path,
-                    dtype={
-                        'Release Payment': 'str',
-                        'Duplicate Check': 'str', 
-                        'Full Duplicate Key': 'str',
-                        'Input File': 'str',
-                        'EOBR Number': 'str',
-                        'Vendor': 'str',
-                        'Mailing Address': 'str',
-                        'Terms': 'str',
-                        'Bill Date': 'str',
-                        'Due Date': 'str',
-                        'Category': 'str',
-                        'Description': 'str',
-                        'Memo': 'str'
-                        # Amount and Total will be converted below
-                    }
-                )
-                
-                # Convert Amount and Total columns to numeric, handling any errors
-                for col in ['Amount', 'Total']:
-                    if col in self.historical_df.columns:
-                        self.historical_df[col] = pd.to_numeric(
-                            self.historical_df[col], 
-                            errors='coerce'  # Convert invalid values to NaN
-                        ).fillna(0.0)  # Replace NaN with 0.0
-                
-                logger.info(f"Loaded historical data: {len(self.historical_df)} records")
-                
-                # Log column types for debugging
-                logger.debug("Historical data column types:")
-                for col, dtype in self.historical_df.dtypes.items():
-                    logger.debug(f"  {col}: {dtype}")
-                    
-            else:
-                logger.info("Historical file not found, creating new DataFrame")
-                self._create_empty_historical_df()
-                
-        except Exception as e:
-            logger.error(f"Error loading historical data: {str(e)}")
-            self._create_empty_historical_df()
+    @property
+    def historical_df(self) -> pd.DataFrame:
+        """Full historical data as a DataFrame (reads the whole ledger; for inspection and exports)."""
+        return self.ledger.to_dataframe()
     
-    def _create_empty_historical_df(self):
-        """Create empty DataFrame with required columns including Order ID."""
-        columns = [
-            'Release Payment', 'Duplicate Check', 'Full Duplicate Key',
-            'Input File', 'Order ID', 'EOBR Number', 'Vendor', 'Mailing Address',
-            'Terms', 'Bill Date', 'Due Date', 'Category', 'Description',
-            'Amount', 'Memo', 'Total'
-        ]
-        self.historical_df = pd.DataFrame(columns=columns)
+    def export_historical_excel(self, excel_path: Path = None) -> Path:
+        """
+        Write the historical ledger out as an Excel file on demand.
+        
+        Args:
+            excel_path: Destination path (defaults to historical_excel_path)
+            
+        Returns:
+            Path of the written Excel file
+        """
+        return self.ledger.export_excel(excel_path or self.historical_excel_path)
     
     def _init_holidays(self):
         """Initialize US federal holidays for current and next year."""
@@ -195,27 +162,18 @@ class ExcelBatchGenerator:
             Tuple of (is_duplicate, duplicate_type)
             duplicate_type can be: "exact", "same_order_different_cpts", "none"
         """
-        if self.historical_df.empty and not self.current_batch_keys:
-            return False, "none"
-        
         current_order_id = bill.get('order_id', '').strip()
         
         logger.info(f"Enhanced duplicate check for key: {full_duplicate_key}")
         logger.info(f"Current order_id: {current_order_id}")
         
-        # Check exact duplicate first (order_id + CPT combination)
-        existing_keys = []
-        if not self.historical_df.empty and 'Full Duplicate Key' in self.historical_df.columns:
-            existing_keys = self.historical_df['Full Duplicate Key'].fillna('').tolist()
-        
-        # Check historical data for exact match
-        historical_exact_match = full_duplicate_key in existing_keys
-        if historical_exact_match:
-            matching_row = self.historical_df[self.historical_df['Full Duplicate Key'] == full_duplicate_key].iloc[0]
-            row_num = self.historical_df[self.historical_df['Full Duplicate Key'] == full_duplicate_key].index[0] + 1
+        # Check historical data for exact match (order_id + CPT combination)
+        matching_row = self.ledger.find_by_duplicate_key(full_duplicate_key)
+        if matching_row:
+            row_num = matching_row['Row']
             logger.info(f"Found EXACT duplicate in historical data at row {row_num}:")
             logger.info(f"  EOBR Number: {matching_row['EOBR Number']}")
-            logger.info(f"  Order ID: {matching_row.get('Order ID', 'N/A')}")
+            logger.info(f"  Order ID: {matching_row.get('Order ID') or 'N/A'}")
             logger.info(f"  Description: {matching_row['Description']}")
             
             # Safely handle Amount formatting
@@ -238,19 +196,16 @@ class ExcelBatchGenerator:
             logger.info(f"Checking for same order_id with different CPTs...")
             
             # Check historical data for same order_id
-            if not self.historical_df.empty and 'Order ID' in self.historical_df.columns:
-                same_order_matches = self.historical_df[
-                    self.historical_df['Order ID'] == current_order_id
-                ]
+            same_order_matches = self.ledger.find_by_order_id(current_order_id)
+            
+            if same_order_matches:
+                logger.warning(f"Found {len(same_order_matches)} records with same order_id but different CPTs:")
+                for match_row in same_order_matches:
+                    logger.warning(f"  Row {match_row['Row']}: {match_row.get('Full Duplicate Key') or 'N/A'}")
+                    logger.warning(f"    EOBR: {match_row.get('EOBR Number') or 'N/A'}")
                 
-                if not same_order_matches.empty:
-                    logger.warning(f"Found {len(same_order_matches)} records with same order_id but different CPTs:")
-                    for idx, match_row in same_order_matches.iterrows():
-                        logger.warning(f"  Row {idx + 1}: {match_row.get('Full Duplicate Key', 'N/A')}")
-                        logger.warning(f"    EOBR: {match_row.get('EOBR Number', 'N/A')}")
-                    
-                    # This is a yellow flag - same order but different services
-                    return True, "same_order_different_cpts"
+                # This is a yellow flag - same order but different services
+                return True, "same_order_different_cpts"
         
         # No duplicates found
         logger.debug(f"No duplicates found for: {full_duplicate_key}")
@@ -268,14 +223,8 @@ class ExcelBatchGenerator:
             Next EOBR number in format: "FM_RECORD-X"
         """
         try:
-            if self.historical_df.empty:
-                return f"{fm_record_number}-1"
-            
             # Find all existing EOBR numbers for this FM record
-            eobr_pattern = f"{re.escape(fm_record_number)}-"
-            existing_eobrs = self.historical_df[
-                self.historical_df['EOBR Number'].str.contains(eobr_pattern, na=False)
-            ]['EOBR Number'].tolist()
+            existing_eobrs = self.ledger.eobr_numbers_for(fm_record_number)
             
             if not existing_eobrs:
                 next_number = f"{fm_record_number}-1"
@@ -653,7 +602,7 @@ class ExcelBatchGenerator:
                         batch_output_dir: Path,
                         batch_filename: str = "batch_payment_data.xlsx") -> Tuple[Path, int, int, int]:
         """
-        Generate batch Excel file and update historical data.
+        Generate batch Excel file and append its new records to the historical ledger.
         
         Args:
             bills: List of bill dictionaries
@@ -702,15 +651,11 @@ class ExcelBatchGenerator:
             new_records = batch_df[batch_df['Duplicate Check'] != 'Y'].copy()
             
             if not new_records.empty:
-                # Append to historical DataFrame
-                self.historical_df = pd.concat([self.historical_df, new_records], ignore_index=True)
-                
-                # Save updated historical file
-                self.historical_excel_path.parent.mkdir(parents=True, exist_ok=True)
-                self.historical_df.to_excel(self.historical_excel_path, index=False)
-                logger.info(f"Updated historical file with {len(new_records)} new records")
+                # Append to the historical ledger in one transaction
+                added = self.ledger.append_rows(new_records.to_dict('records'))
+                logger.info(f"Added {added} new records to historical ledger {self.ledger.ledger_path}")
             else:
-                logger.info("No new records to add to historical file")
+                logger.info("No new records to add to historical ledger")
             
             logger.info(f"Excel generation complete: {len(excel_rows)} total, "
                     f"{new_records_count} new, {duplicate_count} exact duplicates, "
@@ -0,0 +1,243 @@
+# billing/logic/postprocess/utils/ledger_store.py
+
+import sqlite3
+import logging
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Historical EOBR workbook column -> ledger column, in workbook order
+LEDGER_COLUMNS = {
+    'Release Payment': 'release_payment',
+    'Duplicate Check': 'duplicate_check',
+    'Full Duplicate Key': 'full_duplicate_key',
+    'Input File': 'input_file',
+    'Order ID': 'order_id',
+    'EOBR Number': 'eobr_number',
+    'Vendor': 'vendor',
+    'Mailing Address': 'mailing_address',
+    'Terms': 'terms',
+    'Bill Date': 'bill_date',
+    'Due Date': 'due_date',
+    'Category': 'category',
+    'Description': 'description',
+    'Amount': 'amount',
+    'Memo': 'memo',
+    'Total': 'total',
+}
+NUMERIC_COLUMNS = ('Amount', 'Total')
+
+
+def _cell(value: Any, numeric: bool = False) -> Any:
+    """Workbook/DataFrame value as stored in SQLite: NaN -> NULL, text as str."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return 0.0 if numeric else None
+    if numeric:
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return 0.0
+    return str(value)
+
+
+class EOBRLedger:
+    """
+    SQLite ledger of every EOBR row ever released, replacing the historical workbook.
+
+    Rows are appended per batch in one transaction, and duplicate and EOBR
+    numbering lookups use indexes on Full Duplicate Key, Order ID and EOBR
+    Number, so neither startup nor a batch save reads or rewrites the whole
+    payment history. The workbook is produced on demand with export_excel().
+    """
+
+    def __init__(self, ledger_path: Path):
+        """
+        Open (creating if needed) the ledger database.
+
+        Args:
+            ledger_path: Path to the SQLite ledger file
+        """
+        self.ledger_path = Path(ledger_path)
+        self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.ledger_path), timeout=30.0)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ',\n'.join(
+            f"    {col} {'REAL' if name in NUMERIC_COLUMNS else 'TEXT'}"
+            for name, col in LEDGER_COLUMNS.items()
+        )
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS eobr_ledger (
+                row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {columns},
+                recorded_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+            CREATE INDEX IF NOT EXISTS idx_eobr_ledger_duplicate_key ON eobr_ledger (full_duplicate_key);
+            CREATE INDEX IF NOT EXISTS idx_eobr_ledger_order_id ON eobr_ledger (order_id);
+            CREATE INDEX IF NOT EXISTS idx_eobr_ledger_eobr_number ON eobr_ledger (eobr_number);
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM eobr_ledger").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM eobr_ledger LIMIT 1").fetchone() is None
+
+    def append_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Append rows keyed by workbook column name, all in one transaction.
+
+        Returns:
+            Number of rows appended
+        """
+        names = list(LEDGER_COLUMNS)
+        values = [
+            tuple(_cell(row.get(name), name in NUMERIC_COLUMNS) for name in names)
+            for row in rows
+        ]
+        if not values:
+            return 0
+
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO eobr_ledger ({', '.join(LEDGER_COLUMNS.values())}) "
+                f"VALUES ({', '.join('?' * len(names))})",
+                values
+            )
+        return len(values)
+
+    def find_by_duplicate_key(self, full_duplicate_key: str) -> Optional[Dict[str, Any]]:
+        """First ledger row with this Full Duplicate Key (with its 1-based row number), or None."""
+        row = self.conn.execute(
+            "SELECT * FROM eobr_ledger WHERE full_duplicate_key = ? ORDER BY row_id LIMIT 1",
+            (full_duplicate_key,)
+        ).fetchone()
+        return self._to_record(row) if row else None
+
+    def find_by_order_id(self, order_id: str) -> List[Dict[str, Any]]:
+        """All ledger rows for an Order ID, oldest first."""
+        rows = self.conn.execute(
+            "SELECT * FROM eobr_ledger WHERE order_id = ? ORDER BY row_id",
+            (order_id,)
+        ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def eobr_numbers_for(self, fm_record_number: str) -> List[str]:
+        """
+        EOBR numbers issued for a FileMaker record ("FM_RECORD-X").
+
+        A prefix range on the EOBR Number index, so only that record's rows are read.
+        """
+        prefix = f"{fm_record_number}-"
+        # '-' + 1 is '.', so [prefix, FM_RECORD.) covers exactly the keys starting with prefix
+        upper = f"{fm_record_number}."
+        rows = self.conn.execute(
+            "SELECT eobr_number FROM eobr_ledger WHERE eobr_number >= ? AND eobr_number < ?",
+            (prefix, upper)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _to_record(self, row: sqlite3.Row) -> Dict[str, Any]:
+        record = {name: row[col] for name, col in LEDGER_COLUMNS.items()}
+        record['Row'] = row['row_id']
+        return record
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """The whole ledger with workbook column names (a full read; used for exports)."""
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(LEDGER_COLUMNS.values())} FROM eobr_ledger ORDER BY row_id",
+            self.conn
+        )
+        return df.rename(columns={col: name for name, col in LEDGER_COLUMNS.items()})
+
+    def import_excel(self, excel_path: Path) -> int:
+        """
+        Load a historical EOBR workbook into the ledger.
+
+        Args:
+            excel_path: Path to the Historical_EOBR_Data.xlsx file
+
+        Returns:
+            Number of rows imported
+        """
+        df = pd.read_excel(
+            excel_path,
+            dtype={name: 'str' for name in LEDGER_COLUMNS if name not in NUMERIC_COLUMNS}
+        )
+        imported = self.append_rows(df.to_dict('records'))
+        logger.info(f"Imported {imported} historical records from {excel_path} into {self.ledger_path}")
+        return imported
+
+    def export_excel(self, excel_path: Path) -> Path:
+        """
+        Write the ledger out as a historical EOBR workbook.
+
+        Args:
+            excel_path: Destination .xlsx path
+
+        Returns:
+            Path of the written workbook
+        """
+        excel_path = Path(excel_path)
+        excel_path.parent.mkdir(parents=True, exist_ok=True)
+        df = self.to_dataframe()
+        df.to_excel(excel_path, index=False)
+        logger.info(f"Exported {len(df)} ledger records to {excel_path}")
+        return excel_path
+
+
+def open_ledger(ledger_path: Path, seed_excel_path: Optional[Path] = None) -> EOBRLedger:
+    """
+    Open a ledger, importing the historical workbook the first time.
+
+    A failed import raises rather than leaving an empty ledger behind, which
+    would miss every historical duplicate. The import is one transaction, so
+    the ledger stays empty and the next open retries it.
+
+    Args:
+        ledger_path: Path to the SQLite ledger file
+        seed_excel_path: Historical workbook loaded once while the ledger is empty
+
+    Returns:
+        The opened EOBRLedger
+    """
+    ledger = EOBRLedger(ledger_path)
+    if seed_excel_path is not None and ledger.is_empty() and Path(seed_excel_path).exists():
+        try:
+            ledger.import_excel(seed_excel_path)
+        except Exception as e:
+            logger.error(f"Error importing historical workbook {seed_excel_path}: {str(e)}")
+            ledger.close()
+            raise
+    return ledger
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Import or export the historical EOBR ledger")
+    parser.add_argument("ledger", type=Path, help="Path to the SQLite ledger file")
+    parser.add_argument("--import-excel", type=Path, help="Append the rows of a historical workbook")
+    parser.add_argument("--export-excel", type=Path, help="Write the ledger out as a workbook")
+    args = parser.parse_args()
+
+    ledger = EOBRLedger(args.ledger)
+    try:
+        if args.import_excel:
+            ledger.import_excel(args.import_excel)
+        if args.export_excel:
+            ledger.export_excel(args.export_excel)
+        print(f"Ledger {args.ledger}: {ledger.count()} records")
+    finally:
+        ledger.close()
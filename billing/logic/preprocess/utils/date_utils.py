@@ -6,19 +6,70 @@ All dates are standardized to YYYY-MM-DD format for consistency across the syste
 """
 
 import re
+import time
+import random
 import logging
-from datetime import datetime, date
-from typing import Optional, Tuple, Union
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# Distinct raw strings remembered per standardizer; DOS values repeat heavily across bills
+DATE_CACHE_SIZE = 8192
+
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$')
+NON_DATE_PREFIX_RE = re.compile(r'^[^0-9]+')
+DIGIT_RE = re.compile(r'\d')
+
+# Shape of a date string or format: a 4-digit run (%Y) becomes Y, a 1-2 digit
+# run (%m, %d, %y) becomes n, any other digit run (%Y%m%d) becomes 9 and letter
+# runs become A, so '01/17/2024' and '%m/%d/%Y' both read 'n/n/Y'
+_SHAPE_DIGITS_RE = re.compile(r'\d+')
+_SHAPE_LETTERS_RE = re.compile(r'[A-Za-z]+')
+_FORMAT_NUMBER_RE = re.compile(r'(?:%[Ymdy])+')
+_FORMAT_NAME_RE = re.compile(r'%[BbAa]')
+
+
+def _digit_run_shape(match: re.Match) -> str:
+    length = len(match.group())
+    return 'Y' if length == 4 else 'n' if length <= 2 else '9'
+
+
+def _format_run_shape(match: re.Match) -> str:
+    run = match.group()
+    return 'Y' if run == '%Y' else 'n' if len(run) == 2 else '9'
+
+
+REGEX_DATE_PATTERNS = [
+    (re.compile(r'(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2,4})'), 'mdy'),  # MM/DD/YY
+    (re.compile(r'(\d{4})[\/\-\.](\d{1,2})[\/\-\.](\d{1,2})'), 'ymd'),     # YYYY/MM/DD
+    (re.compile(r'(\d{1,2})\s+(\d{1,2})\s+(\d{2,4})'), 'mdy'),            # MM DD YY
+]
+
+
+def date_shape(value: str) -> str:
+    """Reduce a date string to its shape, e.g. '12/26/24' -> 'n/n/n'."""
+    return _SHAPE_DIGITS_RE.sub(_digit_run_shape, _SHAPE_LETTERS_RE.sub('A', value))
+
+
+def format_shape(fmt: str) -> str:
+    """Reduce a strptime format to the shape of the strings it accepts, e.g. '%m/%d/%Y' -> 'n/n/Y'."""
+    return _FORMAT_NAME_RE.sub('A', _FORMAT_NUMBER_RE.sub(_format_run_shape, fmt))
+
+
 class DateStandardizer:
     """
     Standardizes various date formats to YYYY-MM-DD format.
     Handles both single dates and date ranges commonly found in medical billing.
     """
     
-    def __init__(self):
+    def __init__(self, fast_path: bool = True, cache_size: int = DATE_CACHE_SIZE):
+        """
+        Args:
+            fast_path: Only try the formats whose shape matches the input
+            cache_size: Raw strings to remember results for; 0 disables the cache
+        """
         # Define supported input formats in order of preference
         self.input_formats = [
             # ISO and year-first formats
@@ -61,10 +112,40 @@ class DateStandardizer:
             '–',      # En dash without spaces
             '—',      # Em dash without spaces
         ]
+
+        # Formats grouped by shape, each group in preference order. A format can
+        # only match strings of its own shape, so trying just that group picks
+        # the same format as trying the full list.
+        self.fast_path = fast_path
+        self.formats_by_shape: Dict[str, List[str]] = {}
+        for fmt in self.input_formats:
+            self.formats_by_shape.setdefault(format_shape(fmt), []).append(fmt)
+
+        if cache_size:
+            self._standardize = lru_cache(maxsize=cache_size)(self._standardize_uncached)
+        else:
+            self._standardize = self._standardize_uncached
+
+    def candidate_formats(self, date_str: str) -> List[str]:
+        """
+        Formats worth trying for a date string, in preference order.
+
+        Strings whose shape no format has (e.g. extra spaces, which strptime
+        tolerates) get the full list.
+        """
+        if self.fast_path:
+            formats = self.formats_by_shape.get(date_shape(date_str))
+            if formats:
+                return formats
+        return self.input_formats
+
+    def cache_info(self):
+        """lru_cache statistics for standardize_date(), or None if caching is off."""
+        return self._standardize.cache_info() if hasattr(self._standardize, 'cache_info') else None
     
     def is_iso_date(self, date_str: str) -> bool:
         """Check if string is already in YYYY-MM-DD format."""
-        return bool(re.match(r'^\d{4}-\d{1,2}-\d{1,2}$', date_str.strip()))
+        return bool(ISO_DATE_RE.match(date_str.strip()))
     
     def extract_date_range(self, date_str: str) -> Optional[Tuple[str, str]]:
         """
@@ -88,7 +169,7 @@ class DateStandardizer:
             if len(parts) == 2:
                 left, right = parts[0].strip(), parts[1].strip()
                 # Both parts should look like dates
-                if (re.search(r'\d', left) and re.search(r'\d', right) and
+                if (DIGIT_RE.search(left) and DIGIT_RE.search(right) and
                     (any(char in left for char in ['/', '.']) or 
                      any(char in right for char in ['/', '.']))):
                     return left, right
@@ -111,10 +192,10 @@ class DateStandardizer:
         date_str = str(date_str).strip()
         
         # Remove any non-date prefixes (like "MX" or other text)
-        date_str = re.sub(r'^[^0-9]+', '', date_str)
+        date_str = NON_DATE_PREFIX_RE.sub('', date_str)
         
-        # Try each format
-        for fmt in self.input_formats:
+        # Try each format that can match
+        for fmt in self.candidate_formats(date_str):
             try:
                 parsed_date = datetime.strptime(date_str, fmt).date()
                 
@@ -137,14 +218,8 @@ class DateStandardizer:
     
     def _parse_with_regex(self, date_str: str) -> Optional[date]:
         """Parse using regex patterns for edge cases."""
-        patterns = [
-            (r'(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2,4})', 'mdy'),  # MM/DD/YY
-            (r'(\d{4})[\/\-\.](\d{1,2})[\/\-\.](\d{1,2})', 'ymd'),     # YYYY/MM/DD
-            (r'(\d{1,2})\s+(\d{1,2})\s+(\d{2,4})', 'mdy'),            # MM DD YY
-        ]
-        
-        for pattern, order in patterns:
-            match = re.match(pattern, date_str)
+        for pattern, order in REGEX_DATE_PATTERNS:
+            match = pattern.match(date_str)
             if match:
                 part1, part2, part3 = match.groups()
                 
@@ -184,7 +259,11 @@ class DateStandardizer:
         if not date_str:
             return None
         
-        date_str = str(date_str).strip()
+        return self._standardize(str(date_str))
+    
+    def _standardize_uncached(self, date_str: str) -> Optional[str]:
+        """standardize_date() for a non-empty string, behind the LRU cache."""
+        date_str = date_str.strip()
         
         # If already in standard format, validate and return
         if self.is_iso_date(date_str):
@@ -340,5 +419,75 @@ def test_date_standardizer():
         print()
 
 
+def dos_benchmark_corpus(size: int = 50000, distinct_days: int = 730, seed: int = 7) -> List[str]:
+    """
+    Build DOS strings shaped like the ones extracted from HCFA forms.
+
+    A couple of years of service dates written in the usual formats, ranges
+    and OCR noise, drawn with repetition the way the same dates recur across
+    line items and bills.
+    """
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    writers = [
+        (lambda d: d.strftime('%m/%d/%Y'), 40),
+        (lambda d: d.strftime('%m/%d/%y'), 20),
+        (lambda d: f"{d.strftime('%m/%d/%y')} - {d.strftime('%m/%d/%y')}", 15),
+        (lambda d: d.strftime('%Y-%m-%d'), 10),
+        (lambda d: f"{d.strftime('%m/%d/%Y')}-{d.strftime('%m/%d/%Y')}", 5),
+        (lambda d: d.strftime('%m %d %y'), 4),
+        (lambda d: 'MX' + d.strftime('%m/%d/%Y'), 3),
+        (lambda d: d.strftime('%m%d%Y'), 2),
+        (lambda d: 'unknown', 1),
+    ]
+    funcs = [func for func, _ in writers]
+    weights = [weight for _, weight in writers]
+    return [
+        rng.choices(funcs, weights)[0](start + timedelta(days=rng.randrange(distinct_days)))
+        for _ in range(size)
+    ]
+
+
+def benchmark_date_standardizer(size: int = 50000) -> Dict[str, float]:
+    """
+    Time standardize_date() over a realistic DOS corpus with and without the fast path and cache.
+
+    Also checks that every configuration returns the same dates as the plain
+    format-by-format scan.
+
+    Returns:
+        Dict with seconds per configuration and the speedup of the default one
+    """
+    corpus = dos_benchmark_corpus(size)
+    configs = [
+        ('baseline', DateStandardizer(fast_path=False, cache_size=0)),
+        ('fast_path', DateStandardizer(fast_path=True, cache_size=0)),
+        ('fast_path_cached', DateStandardizer()),
+    ]
+
+    results = {}
+    expected = None
+    for name, standardizer in configs:
+        start = time.perf_counter()
+        output = [standardizer.standardize_date(value) for value in corpus]
+        results[name] = time.perf_counter() - start
+        if expected is None:
+            expected = output
+        elif output != expected:
+            raise AssertionError(f"{name} disagrees with the baseline standardizer")
+
+    results['speedup'] = results['baseline'] / results['fast_path_cached']
+    print(f"Standardized {len(corpus)} DOS strings ({len(set(corpus))} distinct):")
+    for name, _ in configs:
+        print(f"  {name:18} {results[name]:.3f}s")
+    print(f"  speedup            {results['speedup']:.1f}x")
+    return results
+
+
 if __name__ == "__main__":
-    test_date_standardizer()
\ No newline at end of file
+    import sys
+
+    if '--benchmark' in sys.argv:
+        benchmark_date_standardizer()
+    else:
+        test_date_standardizer()
\ No newline at end of file
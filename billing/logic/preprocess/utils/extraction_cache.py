@@ -0,0 +1,146 @@
+# billing/logic/preprocess/utils/extraction_cache.py
+"""
+Content-addressed cache of raw LLM extraction results.
+
+Results are keyed by (SHA-256 of the PDF bytes or OCR text, prompt version,
+model), so re-extracting a bill that was moved back out of the archive, or
+re-running after a database-side failure, replays the stored function-call
+JSON instead of paying for another API round trip. The prompt version is a
+hash of the prompt itself, so editing a prompt invalidates its entries.
+
+Only extractions that passed validation are stored (see has_service_lines),
+so bills that came out INVALID are re-extracted rather than replayed.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+#   …/monolith/billing/logic/preprocess/utils/extraction_cache.py → …/monolith/billing/cache
+EXTRACTION_CACHE_PATH = Path(os.getenv(
+    "EXTRACTION_CACHE_PATH",
+    str(Path(__file__).resolve().parents[3] / "cache" / "extraction_cache.db")
+))
+
+
+def content_hash(content: Union[bytes, str]) -> str:
+    """SHA-256 of a PDF's bytes or of OCR text."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def prompt_version(*parts) -> str:
+    """Short hash identifying a prompt; parts that are not strings are JSON-encoded."""
+    text = "\x1f".join(part if isinstance(part, str) else json.dumps(part, sort_keys=True) for part in parts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def has_service_lines(raw_output: str) -> bool:
+    """True if raw function-call JSON has service lines that all carry a CPT code and a charge."""
+    try:
+        service_lines = json.loads(raw_output).get("service_lines") or []
+    except (ValueError, AttributeError):
+        return False
+    return bool(service_lines) and all(
+        isinstance(line, dict) and line.get("cpt_code") and line.get("charge_amount")
+        for line in service_lines
+    )
+
+
+class ExtractionCache:
+    """SQLite-backed store of raw extraction output with hit/miss counters."""
+
+    def __init__(self, path: Union[str, Path] = EXTRACTION_CACHE_PATH, bypass: bool = False):
+        """
+        Args:
+            path: SQLite file holding the cache
+            bypass: Skip lookups and always call the LLM; fresh results still replace stored ones
+        """
+        self.path = Path(path)
+        self.bypass = bypass
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    content_hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    raw_output TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                    PRIMARY KEY (content_hash, prompt_version, model)
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, digest: str, version: str, model: str) -> Optional[str]:
+        """Stored raw output for a key, or None on a miss or when bypassing."""
+        with self._lock:
+            if self.bypass:
+                self.stats["bypassed"] += 1
+                return None
+            row = self._connection().execute("""
+                SELECT raw_output FROM extraction_cache
+                WHERE content_hash = ? AND prompt_version = ? AND model = ?
+            """, (digest, version, model)).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+            return row[0] if row else None
+
+    def put(self, digest: str, version: str, model: str, raw_output: str):
+        """Store (or replace) the raw output for a key."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("""
+                INSERT OR REPLACE INTO extraction_cache (content_hash, prompt_version, model, raw_output)
+                VALUES (?, ?, ?, ?)
+            """, (digest, version, model, raw_output))
+            conn.commit()
+            self.stats["stores"] += 1
+
+    def get_or_extract(self, content: Union[bytes, str], version: str, model: str,
+                       extract: Callable[[], str],
+                       accept: Callable[[str], bool] = has_service_lines) -> str:
+        """
+        Raw output for `content`, calling `extract` only on a cache miss.
+
+        Args:
+            content: PDF bytes or OCR text the extraction runs on
+            version: prompt_version() of the prompt used
+            model: Model name
+            extract: Makes the LLM call and returns its raw output
+            accept: Only outputs it returns True for are stored or replayed
+        """
+        digest = content_hash(content)
+        cached = self.get(digest, version, model)
+        if cached is not None and accept(cached):
+            logger.info(f"Extraction cache hit for {digest[:12]}")
+            return cached
+
+        raw_output = extract()
+        if accept(raw_output):
+            self.put(digest, version, model, raw_output)
+        else:
+            logger.info(f"Not caching extraction for {digest[:12]}: it did not pass validation")
+        return raw_output
+
+    def summary(self) -> str:
+        return (f"Extraction cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['bypassed']} bypassed, {self.stats['stores']} stored")
+
+
+# Process-wide cache shared by the vision and OCR-text extractors
+extraction_cache = ExtractionCache(bypass=os.getenv("EXTRACTION_CACHE_BYPASS", "").lower() in ("1", "true", "yes"))
@@ -6,7 +6,14 @@ Debug script to find where ProviderBill IDs from the database are located in S3.
 Queries monolith.db for distinct ProviderBill IDs and searches the entire S3 bucket
 to locate where each file is stored.
 
-OPTIMIZED VERSION: Fetches all S3 objects once, then does in-memory searches.
+Reconciles the local S3 object index against the bill stage prefixes, then
+answers every lookup from the index instead of listing the bucket. Files
+misplaced outside those prefixes are only found with --full-scan, which
+lists the entire bucket once.
+
+Usage:
+    python file_id_debug.py
+    python file_id_debug.py --full-scan
 """
 
 import os
@@ -24,25 +31,13 @@ sys.path.append(str(PROJECT_ROOT))
 load_dotenv(PROJECT_ROOT / ".env")
 
 # Import S3 utilities
-from config.s3_utils import list_objects
+from config.s3_utils import list_objects, reconcile_index
+from config.s3_index import object_index
 
 # S3 Configuration
 S3_BUCKET = os.getenv("S3_BUCKET", "bill-review-prod")
 DB_PATH = PROJECT_ROOT / "monolith.db"
 
-# Common S3 prefixes to search
-S3_PREFIXES = [
-    "data/ProviderBills/pdf/",
-    "data/ProviderBills/pdf/archive/",
-    "data/ProviderBills/txt/",
-    "data/ProviderBills/txt/archive/",
-    "data/ProviderBills/json/",
-    "data/ProviderBills/json/archive/",
-    "logs/",
-    "backup_pdfs/",
-    "backup_ocr_files/"
-]
-
 def get_distinct_provider_bill_ids():
     """Get all distinct ProviderBill IDs from the database."""
     try:
@@ -59,61 +54,43 @@ def get_distinct_provider_bill_ids():
         print(f"❌ Database error: {e}")
         return []
 
-def fetch_all_s3_objects():
-    """Fetch all S3 objects from relevant prefixes in one go."""
-    print("🔍 Fetching all S3 objects...")
-    all_objects = {}
-    
-    for prefix in S3_PREFIXES:
-        try:
-            print(f"   📁 Fetching: {prefix}")
-            objects = list_objects(prefix)
-            if objects:
-                all_objects[prefix] = set(objects)
-                print(f"      Found {len(objects)} objects")
-            else:
-                all_objects[prefix] = set()
-                print(f"      No objects found")
-        except Exception as e:
-            print(f"   ⚠️  Error fetching {prefix}: {e}")
-            all_objects[prefix] = set()
-    
-    # Also fetch entire bucket as fallback
+def fetch_indexed_pdf_locations():
+    """Sync the S3 object index with the stage prefixes and map each bill ID to its PDF keys."""
+    print("🔍 Reconciling S3 object index...")
     try:
-        print(f"   📁 Fetching entire bucket (fallback)...")
-        all_bucket_objects = list_objects("")
-        if all_bucket_objects:
-            all_objects["ENTIRE_BUCKET"] = set(all_bucket_objects)
-            print(f"      Found {len(all_bucket_objects)} total objects")
-        else:
-            all_objects["ENTIRE_BUCKET"] = set()
+        counts = reconcile_index(bucket=S3_BUCKET)
+        print(f"   Listed {counts['listed']} objects: {counts['added']} added, "
+              f"{counts['updated']} updated, {counts['removed']} removed")
     except Exception as e:
-        print(f"   ⚠️  Error fetching entire bucket: {e}")
-        all_objects["ENTIRE_BUCKET"] = set()
+        print(f"   ⚠️  Error reconciling index, using indexed state as is: {e}")
     
-    return all_objects
+    locations = object_index.locations(S3_BUCKET, suffix='.pdf')
+    print(f"   {sum(len(keys) for keys in locations.values())} PDFs indexed for {len(locations)} bills")
+    return locations
 
-def find_bill_locations(bill_id, s3_objects):
-    """Find all PDF locations for a specific bill ID using pre-fetched S3 objects."""
-    locations = []
-    
-    # Search in common prefixes first
-    for prefix, objects in s3_objects.items():
-        if prefix == "ENTIRE_BUCKET":
-            continue  # Skip for now, use as fallback
-        
-        for obj in objects:
-            if bill_id in obj and obj.endswith('.pdf'):
-                locations.append(obj)
-    
-    # If not found in common prefixes, search entire bucket
-    if not locations and "ENTIRE_BUCKET" in s3_objects:
-        for obj in s3_objects["ENTIRE_BUCKET"]:
-            if bill_id in obj and obj.endswith('.pdf'):
-                locations.append(obj)
-    
+def fetch_full_scan_pdf_locations(bill_ids):
+    """List the entire bucket and map each bill ID to every PDF key containing it."""
+    print("🔍 Fetching entire bucket (full scan)...")
+    pdf_keys = [key for key in list_objects("", bucket=S3_BUCKET) if key.endswith('.pdf')]
+    print(f"   Found {len(pdf_keys)} PDFs")
+    
+    # Keys named after the bill match on their file name; anything else
+    # (renamed or prefixed copies) falls back to a substring search
+    by_name = {}
+    for key in pdf_keys:
+        by_name.setdefault(Path(key).stem, []).append(key)
+    
+    locations = {}
+    for bill_id in bill_ids:
+        keys = by_name.get(bill_id) or [key for key in pdf_keys if bill_id in key]
+        if keys:
+            locations[bill_id] = keys
     return locations
 
+def find_bill_locations(bill_id, pdf_locations):
+    """Find all PDF locations for a specific bill ID in the indexed locations."""
+    return pdf_locations.get(bill_id, [])
+
 def analyze_bill_locations(bill_id, locations):
     """Analyze where PDF files are located and provide status."""
     if not locations:
@@ -132,6 +109,13 @@ def analyze_bill_locations(bill_id, locations):
 def main():
     """Main function to debug file locations."""
     import csv
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Find where ProviderBill PDFs are stored in S3")
+    parser.add_argument("--full-scan", action="store_true",
+                        help="List the entire bucket instead of the indexed stage prefixes, "
+                             "to find PDFs stored anywhere else")
+    args = parser.parse_args()
     
     print("🔍 ProviderBill ID Debug Tool - PDF ONLY")
     print(f"📦 S3 Bucket: {S3_BUCKET}")
@@ -148,8 +132,11 @@ def main():
     
     print(f"📊 Found {len(bill_ids)} distinct ProviderBill IDs")
     
-    # Fetch all S3 objects once
-    s3_objects = fetch_all_s3_objects()
+    # Sync the index (or list the bucket) once; every lookup below is a dict access
+    if args.full_scan:
+        pdf_locations = fetch_full_scan_pdf_locations(bill_ids)
+    else:
+        pdf_locations = fetch_indexed_pdf_locations()
     
     # Prepare CSV output and collect data for summary
     csv_filename = f"provider_bill_locations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -174,8 +161,8 @@ def main():
             if i % 50 == 0:  # Progress indicator every 50 items (much faster now)
                 print(f"   Progress: {i}/{len(bill_ids)}")
             
-            # Find locations using pre-fetched S3 objects
-            locations = find_bill_locations(bill_id, s3_objects)
+            # Find locations in the indexed PDF keys
+            locations = find_bill_locations(bill_id, pdf_locations)
             
             # Analyze results
             status, locations_str = analyze_bill_locations(bill_id, locations)
@@ -24,12 +24,15 @@ PROJECT_ROOT = Path(__file__).resolve().parents[4]
 sys.path.append(str(PROJECT_ROOT))
 
 # Import S3 utilities
-from config.s3_utils import list_objects
+from config.s3_utils import find_bill_keys, reconcile_index
+from config.s3_index import object_index
 
 # Configuration
 S3_BUCKET = os.getenv("S3_BUCKET", "bill-review-prod")
 INPUT_PREFIX = "data/ProviderBills/pdf/"
 ARCHIVE_PREFIX = "data/ProviderBills/pdf/archive/"
+# Reuse an archive relist from the last few minutes instead of listing again
+INDEX_MAX_AGE_SECONDS = int(os.getenv("S3_INDEX_MAX_AGE_SECONDS", "300"))
 DB_PATH = r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolith\monolith.db"
 
 def find_bills_by_status(status_filter: str = None) -> list[str]:
@@ -110,7 +113,8 @@ def find_bills_with_errors() -> list[str]:
 def find_archived_bills() -> list[str]:
     """Find bills that are in archive."""
     try:
-        archive_objects = list_objects(ARCHIVE_PREFIX)
+        reconcile_index([ARCHIVE_PREFIX], bucket=S3_BUCKET, max_age_seconds=INDEX_MAX_AGE_SECONDS)
+        archive_objects = object_index.keys_in_stage("pdf_archive", S3_BUCKET)
         return [obj.replace(ARCHIVE_PREFIX, "").replace(".pdf", "") 
                 for obj in archive_objects if obj.endswith(".pdf")]
     except Exception as exc:
@@ -143,13 +147,10 @@ def check_bill_processing_status(bill_id: str) -> dict:
         
         line_count = cur.fetchone()[0]
         
-        # Check if in archive
-        archive_objects = list_objects(ARCHIVE_PREFIX)
-        in_archive = f"{bill_id}.pdf" in [obj.replace(ARCHIVE_PREFIX, "") for obj in archive_objects]
-        
-        # Check if in input
-        input_objects = list_objects(INPUT_PREFIX)
-        in_input = f"{bill_id}.pdf" in [obj.replace(INPUT_PREFIX, "") for obj in input_objects]
+        # Check archive and input from the S3 object index
+        pdf_keys = find_bill_keys(bill_id, stages=["pdf", "pdf_archive"], suffix=".pdf", bucket=S3_BUCKET)
+        in_archive = f"{ARCHIVE_PREFIX}{bill_id}.pdf" in pdf_keys
+        in_input = f"{INPUT_PREFIX}{bill_id}.pdf" in pdf_keys
         
         return {
             "exists": True,
@@ -7,7 +7,6 @@ Processes OCR text from ProviderBills through LLM to extract structured data.
 import os
 import sys
 import logging
-import tempfile
 import json
 import sqlite3
 from pathlib import Path
@@ -26,7 +25,8 @@ DB_ROOT = Path(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolit
 load_dotenv(DB_ROOT / '.env')
 
 # Import S3 helper functions
-from config.s3_utils import list_objects, download, upload, move
+from config.s3_utils import list_objects, move, get_json, put_json, S3LogWriter
+from extraction_cache import extraction_cache, has_service_lines, prompt_version
 
 # S3 prefixes
 INPUT_PREFIX = 'data/ProviderBills/txt/'
@@ -40,6 +40,7 @@ PROMPT_PATH = Path(__file__).resolve().parent / 'gpt41_prompt.txt'
 
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+LLM_MODEL = "gpt-4.1-mini"
 
 # Helper to clean charge strings
 def clean_charge(charge: str) -> str:
@@ -68,17 +69,26 @@ def fix_all_charges(data: dict) -> dict:
 
 
 def extract_data_via_llm(prompt_text: str, ocr_text: str) -> str:
+    """Raw model output for the OCR text, replayed from the extraction cache when possible."""
+    return extraction_cache.get_or_extract(ocr_text, prompt_version(prompt_text), LLM_MODEL,
+                                           lambda: call_text_llm(prompt_text, ocr_text),
+                                           accept=lambda raw: has_service_lines(clean_gpt_output(raw)))
+
+
+def call_text_llm(prompt_text: str, ocr_text: str) -> str:
     messages = [
         {"role": "system", "content": "You are an AI assistant that extracts structured data from CMS-1500 medical claim forms."},
         {"role": "user", "content": prompt_text + "\n---\n" + ocr_text}
     ]
     response = client.chat.completions.create(
-        model="gpt-4.1-mini",
+        model=LLM_MODEL,
         messages=messages,
         temperature=0.0,
         max_tokens=2000
     )
-    return response.choices[0].message.content
+    content = response.choices[0].message.content
+    json.loads(clean_gpt_output(content))  # never cache output that does not parse
+    return content
 
 
 def clean_gpt_output(raw: str) -> str:
@@ -217,97 +227,70 @@ def process_llm_s3(limit=None):
     if limit:
         json_keys = json_keys[:int(limit)]
 
-    for key in json_keys:
-        print(f"→ Processing s3://{S3_BUCKET}/{key}")
-        local_json = None
-        temp_output = None
-        try:
-            # Download the file to a temporary location
-            temp_dir = tempfile.gettempdir()
-            local_json = os.path.join(temp_dir, os.path.basename(key))
-            download(key, local_json)
-            
-            # Read the OCR JSON file
-            with open(local_json, 'r', encoding='utf-8') as f:
-                ocr_data = json.load(f)
-            
-            # Extract the OCR text
-            ocr_text = ocr_data.get('ocr_text', '')
-            provider_bill_id = ocr_data.get('provider_bill_id', '')
-            
-            # Process with LLM
-            extracted_json = extract_data_via_llm(prompt, ocr_text)
-            extracted_data = json.loads(clean_gpt_output(extracted_json))
-            
-            # Clean up charge amounts
-            extracted_data = fix_all_charges(extracted_data)
-            
-            # Update database
-            if update_provider_bill_record(provider_bill_id, extracted_data):
-                # Save to S3
-                output_key = f"{OUTPUT_PREFIX}{provider_bill_id}.json"
-                temp_output = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False)
-                json.dump(extracted_data, temp_output, indent=2)
-                temp_output.close()  # Close the file before uploading
+    with S3LogWriter(LOG_PREFIX) as error_log:
+        for key in json_keys:
+            print(f"→ Processing s3://{S3_BUCKET}/{key}")
+            try:
+                # Read the OCR JSON straight from S3
+                ocr_data = get_json(key)
+                if ocr_data is None:
+                    raise Exception(f"Could not read {key}")
+                
+                # Extract the OCR text
+                ocr_text = ocr_data.get('ocr_text', '')
+                provider_bill_id = ocr_data.get('provider_bill_id', '')
+                
+                # Process with LLM
+                extracted_json = extract_data_via_llm(prompt, ocr_text)
+                extracted_data = json.loads(clean_gpt_output(extracted_json))
                 
-                upload(temp_output.name, output_key)
-                os.unlink(temp_output.name)  # Clean up temp file
+                # Clean up charge amounts
+                extracted_data = fix_all_charges(extracted_data)
                 
-                # Create local backup before archiving (if we have the original file)
-                if local_json and os.path.exists(local_json):
+                # Update database
+                if update_provider_bill_record(provider_bill_id, extracted_data):
+                    # Save to S3
+                    output_key = f"{OUTPUT_PREFIX}{provider_bill_id}.json"
+                    if not put_json(extracted_data, output_key):
+                        raise Exception(f"Failed to upload {output_key}")
+                    
+                    # Keep a local backup of the OCR input before archiving
                     backup_dir = Path("backup_ocr_files")
                     backup_dir.mkdir(exist_ok=True)
                     backup_path = backup_dir / f"{provider_bill_id}.json"
                     
                     try:
-                        # Copy the local OCR JSON to backup location
-                        import shutil
-                        shutil.copy2(local_json, backup_path)
+                        with open(backup_path, 'w', encoding='utf-8') as f:
+                            json.dump(ocr_data, f, indent=2)
                         print(f" 📁 Local backup: {backup_path}")
                     except Exception as backup_exc:
                         print(f" ⚠ Local backup failed: {backup_exc}")
-                
-                # Archive the input file
-                try:
-                    archive_key = f"{ARCHIVE_PREFIX}{os.path.basename(key)}"
-                    move(key, archive_key)
-                    print(f"✓ Processed and archived: {key}")
                     
-                    # If S3 archive succeeded, we can optionally remove local backup
-                    # Uncomment the next line if you want to auto-cleanup successful backups
-                    # backup_path.unlink(missing_ok=True)
-                    
-                except Exception as archive_exc:
-                    print(f" ⚠ Archive failed: {archive_exc}")
-                    if 'backup_path' in locals():
+                    # Archive the input file
+                    archive_key = f"{ARCHIVE_PREFIX}{os.path.basename(key)}"
+                    if move(key, archive_key):
+                        print(f"✓ Processed and archived: {key}")
+                    else:
+                        print(f" ⚠ Archive failed: {key}")
                         print(f" 💾 Local backup preserved at: {backup_path}")
-                    # Log the archiving failure
-                    err = tempfile.mktemp(suffix=".log")
-                    with open(err, "w") as f:
-                        f.write(f"{datetime.now()}: {key} – Archive failed: {archive_exc}\n")
-                    upload(err, LOG_PREFIX)
-            else:
-                print(f"❌ Database update failed for: {key}")
-                
-        except Exception as e:
-            print(f"❌ Extraction error {key}: {str(e)}")
-            # Write error to log file
-            temp_log = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False)
-            temp_log.write(f"Error processing {key}: {str(e)}\n")
-            temp_log.close()  # Close the file before uploading
-            
-            upload(temp_log.name, LOG_PREFIX)
-            os.unlink(temp_log.name)  # Clean up temp file
-        finally:
-            # Clean up the downloaded file
-            if local_json and os.path.exists(local_json):
-                try:
-                    os.unlink(local_json)
-                except Exception as e:
-                    print(f"Warning: Could not delete temporary file {local_json}: {str(e)}")
+                        error_log.write(f"{datetime.now()}: {key} – Archive failed")
+                else:
+                    print(f"❌ Database update failed for: {key}")
+                    
+            except Exception as e:
+                print(f"❌ Extraction error {key}: {str(e)}")
+                error_log.write(f"Error processing {key}: {str(e)}")
 
+    print(extraction_cache.summary())
     print("LLM processing complete")
 
 
 if __name__ == '__main__':
-    process_llm_s3()
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract HCFA-1500 data from OCR text with the LLM")
+    parser.add_argument("--limit", type=int, help="Process only N files for testing")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Call the LLM even when a cached extraction exists (fresh results are still stored)")
+    args = parser.parse_args()
+    extraction_cache.bypass = args.no_cache or extraction_cache.bypass
+    process_llm_s3(limit=args.limit)
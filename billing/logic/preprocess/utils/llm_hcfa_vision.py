@@ -35,7 +35,8 @@ load_dotenv(PROJECT_ROOT / ".env")   # OPENAI_API_KEY, S3_BUCKET, etc.
 #  S3 helpers  –  keep your existing utils
 # ─────────────────────────────────────────────────────────────────────────────
 sys.path.insert(0, str(PROJECT_ROOT))
-from config.s3_utils import list_objects, download, upload, move
+from config.s3_utils import list_objects, download, move, put_json, S3LogWriter
+from extraction_cache import extraction_cache, prompt_version
 
 INPUT_PREFIX   = "data/ProviderBills/pdf/"
 OUTPUT_PREFIX  = "data/ProviderBills/json/"
@@ -52,6 +53,7 @@ with open(PROMPT_FN, "r", encoding="utf-8") as f:
 SYSTEM_PROMPT = _PROMPT_JSON["system"]
 USER_HINT     = _PROMPT_JSON["user_hint"]
 FUNCTIONS     = _PROMPT_JSON["functions"]
+PROMPT_VERSION = prompt_version(SYSTEM_PROMPT, USER_HINT, FUNCTIONS)
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  OpenAI client
@@ -149,7 +151,8 @@ def normalise_charges(data: dict) -> dict:
 # ─────────────────────────────────────────────────────────────────────────────
 #  Vision LLM call
 # ─────────────────────────────────────────────────────────────────────────────
-def extract_via_llm(pdf_path: str) -> dict:
+def call_vision_llm(pdf_path: str) -> str:
+    """Send the rendered pages to the model and return the raw function-call arguments."""
     images_b64 = pdf_to_b64_images(pdf_path)
 
     user_parts = [
@@ -174,7 +177,16 @@ def extract_via_llm(pdf_path: str) -> dict:
         max_tokens    = 2048
     )
 
-    extracted_data = json.loads(resp.choices[0].message.function_call.arguments)
+    arguments = resp.choices[0].message.function_call.arguments
+    json.loads(arguments)                        # never cache output that does not parse
+    return arguments
+
+def extract_via_llm(pdf_path: str) -> dict:
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    raw = extraction_cache.get_or_extract(pdf_bytes, PROMPT_VERSION, OPENAI_MODEL,
+                                          lambda: call_vision_llm(pdf_path))
+    extracted_data = json.loads(raw)
     
     # Validate service lines were extracted
     service_lines = extracted_data.get("service_lines", [])
@@ -294,6 +306,7 @@ def process_s3(limit: int | None = None):
     db_path = r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolith\monolith.db"
     conn = sqlite3.connect(db_path, timeout=30.0)
     cur = conn.cursor()
+    error_log = S3LogWriter(LOG_PREFIX)   # flushed in batches and at the end of the run
     
     try:
         # Get all bills with status 'RECEIVED'
@@ -309,20 +322,19 @@ def process_s3(limit: int | None = None):
             print("No bills with status 'RECEIVED' found. Nothing to process.")
             return
         
+        # One paginated listing of the input folder for the whole run
+        s3_objects = set(list_objects(INPUT_PREFIX))
+        
         for bill_id in bill_ids:
             # Check if PDF exists in S3 input folder
             pdf_key = f"{INPUT_PREFIX}{bill_id}.pdf"
             
             # Check if PDF exists in S3
             try:
-                s3_objects = list_objects(INPUT_PREFIX)
                 if pdf_key not in s3_objects:
                     print(f" ❌ PDF not found in S3 for bill {bill_id}: {pdf_key}")
                     # Log this as an error
-                    err = tempfile.mktemp(suffix=".log")
-                    with open(err, "w") as f:
-                        f.write(f"{datetime.now()}: {bill_id} – PDF not found in S3: {pdf_key}\n")
-                    upload(err, LOG_PREFIX)
+                    error_log.write(f"{datetime.now()}: {bill_id} – PDF not found in S3: {pdf_key}")
                     continue
             except Exception as s3_exc:
                 print(f" ❌ Error checking S3 for bill {bill_id}: {s3_exc}")
@@ -340,10 +352,7 @@ def process_s3(limit: int | None = None):
                 if not service_lines:
                     print(f" ❌ ERROR: No service lines found after extraction for {bill_id}")
                     # Log this as an error
-                    err = tempfile.mktemp(suffix=".log")
-                    with open(err, "w") as f:
-                        f.write(f"{datetime.now()}: {bill_id} – No service lines extracted\n")
-                    upload(err, LOG_PREFIX)
+                    error_log.write(f"{datetime.now()}: {bill_id} – No service lines extracted")
                     continue
                 
                 # Validate that service lines have required fields
@@ -356,10 +365,7 @@ def process_s3(limit: int | None = None):
                 
                 if not valid_service_lines:
                     print(f" ❌ ERROR: No valid service lines found for {bill_id}")
-                    err = tempfile.mktemp(suffix=".log")
-                    with open(err, "w") as f:
-                        f.write(f"{datetime.now()}: {bill_id} – No valid service lines (missing CPT or charge)\n")
-                    upload(err, LOG_PREFIX)
+                    error_log.write(f"{datetime.now()}: {bill_id} – No valid service lines (missing CPT or charge)")
                     continue
                 
                 # Update data with validated service lines
@@ -368,11 +374,7 @@ def process_s3(limit: int | None = None):
 
                 if update_provider_bill(bill_id, data):
                     # push JSON
-                    tmp_json = tempfile.mktemp(suffix=".json")
-                    with open(tmp_json, "w", encoding="utf-8") as f:
-                        json.dump(data, f, indent=2)
-                    upload(tmp_json, f"{OUTPUT_PREFIX}{bill_id}.json")
-                    os.unlink(tmp_json)
+                    put_json(data, f"{OUTPUT_PREFIX}{bill_id}.json")
 
                     # Create local backup before archiving
                     backup_dir = Path("backup_pdfs")
@@ -400,19 +402,13 @@ def process_s3(limit: int | None = None):
                         print(f" ⚠ Archive failed: {archive_exc}")
                         print(f" 💾 Local backup preserved at: {backup_path}")
                         # Log the archiving failure
-                        err = tempfile.mktemp(suffix=".log")
-                        with open(err, "w") as f:
-                            f.write(f"{datetime.now()}: {bill_id} – Archive failed: {archive_exc}\n")
-                        upload(err, LOG_PREFIX)
+                        error_log.write(f"{datetime.now()}: {bill_id} – Archive failed: {archive_exc}")
                         # Note: Data is still processed and in database, but PDF remains in input
                 else:
                     print(" ⚠ DB update failed")
             except Exception as exc:
                 print(f" ❌ {exc}")
-                err = tempfile.mktemp(suffix=".log")
-                with open(err, "w") as f:
-                    f.write(f"{datetime.now()}: {bill_id} – {exc}\n")
-                upload(err, LOG_PREFIX)
+                error_log.write(f"{datetime.now()}: {bill_id} – {exc}")
             finally:
                 if os.path.exists(tmp_pdf):
                     os.unlink(tmp_pdf)
@@ -421,7 +417,9 @@ def process_s3(limit: int | None = None):
         print(f" ❌ Database error: {db_exc}")
     finally:
         conn.close()
+        error_log.close()
 
+    print(extraction_cache.summary())
     print("Done – vision extraction complete.")
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -429,5 +427,8 @@ if __name__ == "__main__":
     import argparse
     ap = argparse.ArgumentParser(description="Extract HCFA-1500 PDFs with GPT-4o-vision")
     ap.add_argument("--limit", type=int, help="Process only N PDFs for testing")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Call the LLM even when a cached extraction exists (fresh results are still stored)")
     args = ap.parse_args()
+    extraction_cache.bypass = args.no_cache or extraction_cache.bypass
     process_s3(limit=args.limit)
@@ -10,21 +10,25 @@ Enhanced version with:
 • Database transaction safety
 • Performance monitoring
 • Automatic recovery mechanisms
+• Concurrent extraction under a shared RPM/TPM rate limiter (--concurrency)
+
+Set OPENAI_BASE_URL to point the client at a local fake chat-completions
+server for testing.
 
 Required:
     pip install pymupdf pillow openai python-dotenv
 """
 
 from __future__ import annotations
-import os, json, base64, tempfile, sqlite3, sys, time, logging
+import os, json, base64, tempfile, sqlite3, sys, time, logging, threading
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import traceback
 
-import fitz                                 # PyMuPDF
 from dotenv import load_dotenv
 from openai import OpenAI
 from openai import RateLimitError, APIError, APITimeoutError
@@ -40,7 +44,9 @@ load_dotenv(PROJECT_ROOT / ".env")
 
 # Import S3 utilities
 sys.path.insert(0, str(PROJECT_ROOT))
-from config.s3_utils import list_objects, download, upload, move
+from config.s3_utils import list_objects, download, move, put_json, S3LogWriter
+from page_image_cache import page_cache
+from extraction_cache import extraction_cache, content_hash, prompt_version
 
 # Configuration
 INPUT_PREFIX   = "data/ProviderBills/pdf/"
@@ -67,11 +73,90 @@ with open(PROMPT_FN, "r", encoding="utf-8") as f:
 SYSTEM_PROMPT = _PROMPT_JSON["system"]
 USER_HINT     = _PROMPT_JSON["user_hint"]
 FUNCTIONS     = _PROMPT_JSON["functions"]
+PROMPT_VERSION = prompt_version(SYSTEM_PROMPT, USER_HINT, FUNCTIONS)
 
 # OpenAI client with retry configuration
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+# Account quota shared by all in-flight requests in --concurrency mode
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+
+MAX_COMPLETION_TOKENS = 2048
+IMAGE_TOKENS_PER_PAGE = 765                 # high-detail image, 2x2 tiles
+PROMPT_TOKENS = len(SYSTEM_PROMPT + USER_HINT + json.dumps(FUNCTIONS)) // 4
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests-per-minute and tokens-per-minute quotas.
+
+    Both buckets refill continuously. A 429 from any worker pauses every
+    worker; the pause doubles with each consecutive 429 and resets on the
+    next success.
+    """
+
+    def __init__(self, rpm: int, tpm: int, base_backoff: float = 2.0, max_backoff: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._backoff = base_backoff
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+        self._updated = now
+
+    def acquire(self, tokens: int):
+        """Block until one request and `tokens` tokens are available, then take them."""
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait = max((1 - self._requests) * 60.0 / self.rpm,
+                               (tokens - self._tokens) * 60.0 / self.tpm)
+            time.sleep(max(wait, 0.01))
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the token bucket once the real usage of a request is known."""
+        if actual is None:
+            return
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + estimated - actual)
+
+    def on_rate_limit(self, retry_after: Optional[float] = None):
+        """Pause all workers after a 429."""
+        with self._lock:
+            delay = max(self._backoff, retry_after or 0)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+        logger.warning(f"Rate limited, pausing all workers for {delay:.1f}s")
+
+    def on_success(self):
+        with self._lock:
+            self._backoff = self.base_backoff
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    """Seconds from the Retry-After header of a 429, if present."""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 @dataclass
 class ExtractionResult:
     """Structured result for extraction operations."""
@@ -320,36 +405,25 @@ class EnhancedExtractor:
         self.db_manager = DatabaseManager(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolith\monolith.db")
         self.max_retries = 3
         self.retry_delay = 2.0
+        self.llm = client
+        self.limiter: Optional[RateLimiter] = None
+        self.error_log = S3LogWriter(LOG_PREFIX)
     
     def pdf_to_b64_images(self, pdf_path: str, max_dim_px: int = 2200, jpeg_q: int = 80) -> List[str]:
-        """Render each PDF page to base64-encoded JPEG with error handling."""
+        """
+        Render each PDF page to base64-encoded JPEG with error handling.
+        
+        Pages come from the shared page image cache, so retries of the same PDF
+        do not rasterize it again and each page is rendered once, already
+        scaled to max_dim_px.
+        """
         try:
-            doc = fitz.open(pdf_path)
-            pages = []
-            
-            for pg_num, pg in enumerate(doc):
-                try:
-                    pix = pg.get_pixmap(dpi=200)
-                    if pix.width > max_dim_px:
-                        scale = max_dim_px / pix.width
-                        pix = pg.get_pixmap(matrix=fitz.Matrix(scale, scale))
-                    
-                    jpeg_data = pix.tobytes("jpg", jpg_quality=jpeg_q)
-                    b64_data = base64.b64encode(jpeg_data).decode()
-                    pages.append(b64_data)
-                    
-                    logger.debug(f"Processed page {pg_num + 1}/{len(doc)}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing page {pg_num + 1}: {e}")
-                    # Continue with other pages
-                    continue
+            rendered = page_cache.render_pages(pdf_path, dpi=200, jpeg_quality=jpeg_q, max_width_px=max_dim_px)
             
-            doc.close()
-            
-            if not pages:
+            if not rendered:
                 raise ValueError("No pages could be processed from PDF")
             
+            pages = [base64.b64encode(jpeg_data).decode() for jpeg_data in rendered.values()]
             logger.info(f"Successfully processed {len(pages)} pages from PDF")
             return pages
             
@@ -361,6 +435,21 @@ class EnhancedExtractor:
         """Extract data via LLM with comprehensive retry logic."""
         start_time = time.time()
         
+        # Replay a stored result for this exact PDF, prompt and model
+        with open(pdf_path, "rb") as f:
+            pdf_hash = content_hash(f.read())
+        cached = extraction_cache.get(pdf_hash, PROMPT_VERSION, OPENAI_MODEL)
+        if cached is not None:
+            extracted_data = json.loads(cached)
+            # Entries stored before results were validated may be empty; re-extract those
+            if not DataValidator.validate_extracted_data(extracted_data):
+                logger.info(f"Using cached extraction for {Path(pdf_path).name}")
+                return ExtractionResult(
+                    success=True,
+                    data=extracted_data,
+                    processing_time=time.time() - start_time
+                )
+        
         for attempt in range(self.max_retries):
             try:
                 logger.info(f"LLM extraction attempt {attempt + 1}/{self.max_retries}")
@@ -379,20 +468,32 @@ class EnhancedExtractor:
                     {"role": "user", "content": user_parts}
                 ]
                 
-                resp = client.chat.completions.create(
+                estimated_tokens = PROMPT_TOKENS + IMAGE_TOKENS_PER_PAGE * len(images_b64) + MAX_COMPLETION_TOKENS
+                if self.limiter:
+                    self.limiter.acquire(estimated_tokens)
+                
+                resp = self.llm.chat.completions.create(
                     model=OPENAI_MODEL,
                     messages=messages,
                     functions=FUNCTIONS,
                     function_call={"name": "extract_hcfa1500"},
                     temperature=0.0,
-                    max_tokens=2048,
+                    max_tokens=MAX_COMPLETION_TOKENS,
                     timeout=120  # 2 minute timeout
                 )
                 
-                extracted_data = json.loads(resp.choices[0].message.function_call.arguments)
+                if self.limiter:
+                    usage = getattr(resp, "usage", None)
+                    self.limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+                    self.limiter.on_success()
                 
-                # Validate extracted data
+                arguments = resp.choices[0].message.function_call.arguments
+                extracted_data = json.loads(arguments)
+                
+                # Validate extracted data; only clean results are replayed later
                 validation_errors = DataValidator.validate_extracted_data(extracted_data)
+                if not validation_errors:
+                    extraction_cache.put(pdf_hash, PROMPT_VERSION, OPENAI_MODEL, arguments)
                 
                 processing_time = time.time() - start_time
                 
@@ -407,7 +508,11 @@ class EnhancedExtractor:
             except (RateLimitError, APITimeoutError) as e:
                 logger.warning(f"API rate limit/timeout on attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (2 ** attempt))  # Exponential backoff
+                    if self.limiter and isinstance(e, RateLimitError):
+                        # Shared backoff: the next acquire() waits out the pause
+                        self.limiter.on_rate_limit(_retry_after(e))
+                    else:
+                        time.sleep(self.retry_delay * (2 ** attempt))  # Exponential backoff
                     continue
                 else:
                     return ExtractionResult(
@@ -564,22 +669,41 @@ class EnhancedExtractor:
             logger.error(f"Database error for bill {bill_id}: {e}")
             return False
     
+    def download_and_extract(self, key: str) -> ExtractionResult:
+        """Download a PDF from S3 and run LLM extraction on it. Safe to call from worker threads."""
+        tmp_pdf = tempfile.mktemp(suffix=".pdf")
+        try:
+            download(key, tmp_pdf)
+            return self.extract_via_llm_with_retry(tmp_pdf)
+        finally:
+            if os.path.exists(tmp_pdf):
+                os.unlink(tmp_pdf)
+    
     def process_single_bill(self, key: str, stats: ProcessingStats) -> bool:
         """Process a single bill with comprehensive error handling."""
-        tmp_pdf = None
         bill_id = Path(key).stem
         
         try:
             logger.info(f"Processing bill: {bill_id}")
             stats.total_processed += 1
-            
-            # Download PDF
-            tmp_pdf = tempfile.mktemp(suffix=".pdf")
-            download(key, tmp_pdf)
-            
-            # Extract data
-            extraction_result = self.extract_via_llm_with_retry(tmp_pdf)
-            
+            extraction_result = self.download_and_extract(key)
+        except Exception as e:
+            logger.error(f"Unexpected error processing {bill_id}: {e}")
+            stats.failed += 1
+            self._log_error(key, str(e))
+            return False
+        
+        return self.finish_bill(key, extraction_result, stats)
+    
+    def finish_bill(self, key: str, extraction_result: ExtractionResult, stats: ProcessingStats) -> bool:
+        """
+        Write an extraction result to the database, upload its JSON and archive the PDF.
+        
+        Only ever called from one thread, so database writes are serialized.
+        """
+        bill_id = Path(key).stem
+        
+        try:
             if not extraction_result.success:
                 logger.error(f"Extraction failed for {bill_id}: {extraction_result.error_message}")
                 stats.failed += 1
@@ -603,11 +727,7 @@ class EnhancedExtractor:
             # Update database
             if self.update_provider_bill(bill_id, data):
                 # Upload JSON
-                tmp_json = tempfile.mktemp(suffix=".json")
-                with open(tmp_json, "w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=2)
-                upload(tmp_json, f"{OUTPUT_PREFIX}{bill_id}.json")
-                os.unlink(tmp_json)
+                put_json(data, f"{OUTPUT_PREFIX}{bill_id}.json")
                 
                 # Archive PDF
                 try:
@@ -630,24 +750,23 @@ class EnhancedExtractor:
             stats.failed += 1
             self._log_error(key, str(e))
             return False
-            
-        finally:
-            if tmp_pdf and os.path.exists(tmp_pdf):
-                os.unlink(tmp_pdf)
     
     def _log_error(self, key: str, error_message: str):
-        """Log error to S3."""
+        """Add an error line to the S3 error log (uploaded in batches)."""
         try:
-            err = tempfile.mktemp(suffix=".log")
-            with open(err, "w") as f:
-                f.write(f"{datetime.now()}: {key} – {error_message}\n")
-            upload(err, LOG_PREFIX)
-            os.unlink(err)
+            self.error_log.write(f"{datetime.now()}: {key} – {error_message}")
         except Exception as e:
             logger.error(f"Failed to log error: {e}")
     
-    def process_s3(self, limit: Optional[int] = None) -> ProcessingStats:
-        """Process all PDFs in S3 with comprehensive monitoring."""
+    def process_s3(self, limit: Optional[int] = None, concurrency: int = 1,
+                   rpm: int = OPENAI_RPM, tpm: int = OPENAI_TPM) -> ProcessingStats:
+        """
+        Process all PDFs in S3 with comprehensive monitoring.
+        
+        With concurrency > 1, up to that many downloads and LLM calls run in
+        worker threads under a shared RateLimiter sized to rpm/tpm, while this
+        thread writes each result to the database as it completes.
+        """
         stats = ProcessingStats()
         
         logger.info(f"Starting enhanced vision extraction from s3://{S3_BUCKET}/{INPUT_PREFIX}")
@@ -659,6 +778,12 @@ class EnhancedExtractor:
             
             logger.info(f"Found {len(keys)} PDFs to process")
             
+            if concurrency > 1:
+                self._process_concurrently(keys, stats, concurrency, RateLimiter(rpm, tpm))
+                logger.info(f"Processing complete: {stats.get_summary()}")
+                logger.info(extraction_cache.summary())
+                return stats
+            
             for i, key in enumerate(keys, 1):
                 logger.info(f"Processing {i}/{len(keys)}: {Path(key).name}")
                 
@@ -672,12 +797,45 @@ class EnhancedExtractor:
                 time.sleep(0.1)
             
             logger.info(f"Processing complete: {stats.get_summary()}")
+            logger.info(extraction_cache.summary())
             return stats
             
         except Exception as e:
             logger.error(f"Critical error in batch processing: {e}")
             stats.failed += 1
             return stats
+        
+        finally:
+            self.error_log.flush()
+    
+    def _process_concurrently(self, keys: List[str], stats: ProcessingStats,
+                              concurrency: int, limiter: RateLimiter):
+        """Keep `concurrency` extractions in flight and finish each one on this thread."""
+        # 429s go straight to the shared limiter instead of the SDK's per-request retries
+        self.llm = client.with_options(max_retries=0)
+        self.limiter = limiter
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = {pool.submit(self.download_and_extract, key): key for key in keys}
+                for i, future in enumerate(as_completed(futures), 1):
+                    key = futures[future]
+                    logger.info(f"Finishing {i}/{len(keys)}: {Path(key).name}")
+                    stats.total_processed += 1
+                    try:
+                        extraction_result = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected error processing {Path(key).stem}: {e}")
+                        stats.failed += 1
+                        self._log_error(key, str(e))
+                        continue
+                    
+                    self.finish_bill(key, extraction_result, stats)
+                    
+                    if i % 10 == 0 or i == len(keys):
+                        logger.info(f"Progress: {i}/{len(keys)} - {stats.get_summary()}")
+        finally:
+            self.llm = client
+            self.limiter = None
 
 def main():
     """Main entry point with argument parsing."""
@@ -686,14 +844,24 @@ def main():
     parser = argparse.ArgumentParser(description="Enhanced HCFA-1500 PDF extraction with GPT-4o-vision")
     parser.add_argument("--limit", type=int, help="Process only N PDFs for testing")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of LLM extractions to keep in flight (default: 1)")
+    parser.add_argument("--rpm", type=int, default=OPENAI_RPM,
+                        help=f"Requests-per-minute quota shared by all workers (default: {OPENAI_RPM})")
+    parser.add_argument("--tpm", type=int, default=OPENAI_TPM,
+                        help=f"Tokens-per-minute quota shared by all workers (default: {OPENAI_TPM})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Call the LLM even when a cached extraction exists (fresh results are still stored)")
     
     args = parser.parse_args()
+    extraction_cache.bypass = args.no_cache or extraction_cache.bypass
     
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
     extractor = EnhancedExtractor()
-    stats = extractor.process_s3(limit=args.limit)
+    stats = extractor.process_s3(limit=args.limit, concurrency=args.concurrency,
+                                 rpm=args.rpm, tpm=args.tpm)
     
     # Print final summary
     print(f"\n{'='*60}")
@@ -12,9 +12,11 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
-import re
 from difflib import SequenceMatcher
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from order_keys import clean_name, normalize_date, refresh_order_keys
 
 # ─── Config ──────────────────────────────────────────────────────
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -26,47 +28,174 @@ DB_ROOT = Path(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolit
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ─── Utilities ───────────────────────────────────────────────────
+NAME_THRESHOLD = 0.80
+DOS_WINDOW_DAYS = 21
+WEEK_DAYS = 7
+MATCH_TOP_K = 10
+MATCH_CHUNK_SIZE = 500
 
-def clean_name(name: str) -> str:
-    if not name:
-        return ""
-    name = name.lower().replace(",", "").strip()
-    name = re.sub(r'[^a-z\s-]', '', name)
-    suffixes = ['jr', 'sr', 'ii', 'iii', 'iv', 'v', 'phd', 'md', 'do']
-    for sfx in suffixes:
-        name = re.sub(rf'\b{sfx}\b', '', name)
-    name = re.sub(r'\s+', ' ', name)
-    return name.strip()
-
-def normalize_date(date_str: str) -> Optional[datetime.date]:
-    if not date_str:
-        return None
-    date_str = str(date_str).strip()
-    if ' - ' in date_str:
-        date_str = date_str.split(' - ')[0].strip()
-    if ' ' in date_str:
-        date_str = date_str.split(' ')[0]
-    formats = [
-        '%Y-%m-%d', '%m/%d/%Y', '%m-%d-%Y',
-        '%Y/%m/%d', '%m/%d/%y', '%m-%d-%y',
-        '%Y%m%d', '%m%d%Y', '%m%d%y'
-    ]
-    for fmt in formats:
-        try:
-            d = datetime.strptime(date_str, fmt).date()
-            if 2020 <= d.year <= 2035:
-                return d
-        except ValueError:
-            continue
-    return None
+# Characters clean_name() can leave in a name; anything else shares one extra column
+NAME_ALPHABET = 'abcdefghijklmnopqrstuvwxyz -'
+_CHAR_COLUMNS = np.full(256, len(NAME_ALPHABET), dtype=np.intp)
+_CHAR_COLUMNS[np.frombuffer(NAME_ALPHABET.encode(), dtype=np.uint8)] = np.arange(len(NAME_ALPHABET))
+
+# Padding for bills with fewer dates than the widest bill in a chunk
+_NO_DATE = -10 ** 9
+
+# ─── Utilities ───────────────────────────────────────────────────
 
 def similar(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
+def dos_week(d: datetime.date) -> int:
+    return d.toordinal() // WEEK_DAYS
+
+def name_length_range(length: int) -> range:
+    """
+    Order name lengths that can still reach NAME_THRESHOLD against a bill name.
+
+    SequenceMatcher.ratio() is 2*M / (len(a) + len(b)) with M <= min(len(a), len(b)),
+    so any length outside this range scores below the threshold for both name orders.
+    """
+    low = int(length * NAME_THRESHOLD / (2 - NAME_THRESHOLD))
+    high = int(length * (2 - NAME_THRESHOLD) / NAME_THRESHOLD) + 1
+    return range(low, high + 1)
+
+def char_counts(names: List[str]) -> np.ndarray:
+    """Count each character of each name, one row per name."""
+    counts = np.zeros((len(names), len(NAME_ALPHABET) + 1), dtype=np.int32)
+    encoded = [name.encode('ascii', 'replace') for name in names]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.intp, count=len(encoded))
+    if lengths.sum():
+        chars = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        np.add.at(counts, (np.repeat(np.arange(len(names)), lengths), _CHAR_COLUMNS[chars]), 1)
+    return counts
+
+# ─── Candidate Index ─────────────────────────────────────────────
+
+def build_order_index(cursor: sqlite3.Cursor) -> Dict:
+    """
+    Load order lines once per mapping run and block them by DOS week and name length.
+
+    Names and dates come from the materialized keys (see order_keys.py), so
+    call refresh_order_keys() first. Rows keep their query order so ties
+    resolve exactly as a full scan would.
+    """
+    cursor.execute("""
+        SELECT DISTINCT o.Order_ID, o.patient_last_key, o.patient_first_key, oli.DOS, oli.dos_iso
+        FROM Orders o
+        JOIN order_line_items oli ON o.Order_ID = oli.order_id
+        WHERE oli.DOS >= '2024-01-01' AND oli.DOS <= '2025-12-31'
+          AND oli.dos_iso != ''
+    """)
+
+    rows = []
+    blocks = {}
+    for order in cursor.fetchall():
+        order_date = datetime.strptime(order['dos_iso'], '%Y-%m-%d').date()
+        first = order['patient_first_key']
+        last = order['patient_last_key']
+        name = f"{first} {last}"
+        key = (dos_week(order_date), len(name))
+        blocks.setdefault(key, []).append(len(rows))
+        rows.append((order['Order_ID'], name, f"{last} {first}", order_date))
+
+    logger.info(f"📇 Indexed {len(rows)} order lines into {len(blocks)} blocks")
+    names = [row[1] for row in rows]
+    return {
+        'rows': rows,
+        'blocks': {key: np.array(positions, dtype=np.intp) for key, positions in blocks.items()},
+        'char_counts': char_counts(names),
+        'name_lengths': np.array([len(name) for name in names], dtype=np.int64),
+        'ordinals': np.array([row[3].toordinal() for row in rows], dtype=np.int64),
+    }
+
+def match_bills(index: Dict, bills: List[Tuple[str, List[datetime.date]]], top_k: int = MATCH_TOP_K) -> List[List[tuple]]:
+    """
+    Score a chunk of bills against the indexed order lines in one vectorized pass.
+
+    Every (bill, candidate) pair from the bill's blocks gets its DOS gap and an
+    upper bound on SequenceMatcher.ratio() from shared character counts
+    (difflib's quick_ratio) as arrays. Only pairs that pass both are scored
+    exactly, so results match scoring every order line one by one.
+
+    Args:
+        index: From build_order_index()
+        bills: (cleaned patient name, parsed DOS list) per bill
+        top_k: Matches kept per bill
+
+    Returns:
+        Per bill, (order_id, score, order DOS) tuples best first; ties keep
+        index order, so the first is the claim a full scan would pick
+    """
+    window_weeks = -(-DOS_WINDOW_DAYS // WEEK_DAYS)
+    pair_bills = []
+    pair_rows = []
+    for i, (name, dates) in enumerate(bills):
+        weeks = {week for bd in dates for week in range(dos_week(bd) - window_weeks, dos_week(bd) + window_weeks + 1)}
+        blocks = [
+            index['blocks'][(week, length)]
+            for week in weeks for length in name_length_range(len(name))
+            if (week, length) in index['blocks']
+        ]
+        if blocks:
+            positions = np.unique(np.concatenate(blocks))
+            pair_rows.append(positions)
+            pair_bills.append(np.full(len(positions), i, dtype=np.intp))
+
+    matches = [[] for _ in bills]
+    if not pair_rows:
+        return matches
+    pair_bills = np.concatenate(pair_bills)
+    pair_rows = np.concatenate(pair_rows)
+
+    # Distance in days to the nearest DOS on the bill
+    bill_ordinals = np.full((len(bills), max(len(dates) for _, dates in bills)), _NO_DATE, dtype=np.int64)
+    for i, (_, dates) in enumerate(bills):
+        bill_ordinals[i, :len(dates)] = [d.toordinal() for d in dates]
+    gaps = np.abs(bill_ordinals[pair_bills] - index['ordinals'][pair_rows][:, None]).min(axis=1)
+
+    # Same arithmetic as ratio() with the shared character count in place of the matched count
+    bill_counts = char_counts([name for name, _ in bills])
+    shared = np.minimum(bill_counts[pair_bills], index['char_counts'][pair_rows]).sum(axis=1)
+    bound = 2.0 * shared / (bill_counts.sum(axis=1)[pair_bills] + index['name_lengths'][pair_rows])
+
+    keep = (gaps <= DOS_WINDOW_DAYS) & (bound >= NAME_THRESHOLD)
+    rows = index['rows']
+    for i, pos in zip(pair_bills[keep].tolist(), pair_rows[keep].tolist()):
+        order_id, order_name, order_name_flipped, order_date = rows[pos]
+        bill_name = bills[i][0]
+
+        # Try "first last" format first, then "last first"
+        sim = similar(bill_name, order_name)
+        if sim < NAME_THRESHOLD:
+            sim = similar(bill_name, order_name_flipped)
+        if sim >= NAME_THRESHOLD:
+            matches[i].append((order_id, sim, order_date))
+
+    return [sorted(bill_matches, key=lambda x: x[1], reverse=True)[:top_k] for bill_matches in matches]
+
+def match_bill_chunk(cursor: sqlite3.Cursor, index: Dict, bill_ids: List[str]) -> Dict[str, List[tuple]]:
+    """Load names and DOS for a chunk of bills and run match_bills() over them."""
+    placeholders = ', '.join(['?'] * len(bill_ids))
+    cursor.execute(f"SELECT id, patient_name FROM ProviderBill WHERE id IN ({placeholders})", bill_ids)
+    names = {row['id']: clean_name(row['patient_name']) for row in cursor.fetchall()}
+
+    dates = {bill_id: [] for bill_id in names}
+    cursor.execute(f"SELECT provider_bill_id, date_of_service FROM BillLineItem WHERE provider_bill_id IN ({placeholders})", bill_ids)
+    for row in cursor.fetchall():
+        d = normalize_date(row['date_of_service'])
+        if d:
+            dates[row['provider_bill_id']].append(d)
+
+    bill_ids = list(names)
+    scored = match_bills(index, [(names[bill_id], dates[bill_id]) for bill_id in bill_ids])
+    return dict(zip(bill_ids, scored))
+
 # ─── Matching Logic ──────────────────────────────────────────────
 
-def find_matching_claim(bill: dict, cursor: sqlite3.Cursor, is_diagnostic=False) -> str | None:
+def find_matching_claim(bill: dict, cursor: sqlite3.Cursor, is_diagnostic=False, index: Optional[Dict] = None,
+                        matches: Optional[List[tuple]] = None) -> str | None:
     bill_patient_name = clean_name(bill['patient_name'])
     logger.info(f"📌 Cleaned bill name: {bill_patient_name}")
 
@@ -82,39 +211,16 @@ def find_matching_claim(bill: dict, cursor: sqlite3.Cursor, is_diagnostic=False)
         logger.warning("❌ No valid DOS found in BillLineItem")
         return None
 
-    cursor.execute("""
-        SELECT DISTINCT o.Order_ID, o.Patient_Last_Name, o.Patient_First_Name, oli.DOS 
-        FROM Orders o
-        JOIN order_line_items oli ON o.Order_ID = oli.order_id
-        WHERE oli.DOS >= '2024-01-01' AND oli.DOS <= '2025-12-31'
-    """)
-    orders = cursor.fetchall()
-
-    best_match = None
-    best_score = 0.0
-    top_matches = []
-
-    for order in orders:
-        # Try "first last" format first
-        order_name = f"{clean_name(order['Patient_First_Name'])} {clean_name(order['Patient_Last_Name'])}"
-        sim = similar(bill_patient_name, order_name)
-        order_date = normalize_date(order['DOS'])
-        date_close = any(abs((order_date - bd).days) <= 21 for bd in bill_dates if order_date)
-
-        # If no match with "first last", try "last first" format
-        if sim < 0.80 and date_close:
-            order_name_flipped = f"{clean_name(order['Patient_Last_Name'])} {clean_name(order['Patient_First_Name'])}"
-            sim = similar(bill_patient_name, order_name_flipped)
-
-        if sim >= 0.80 and date_close:
-            top_matches.append((order['Order_ID'], sim, order_date))
-            if sim > best_score:
-                best_score = sim
-                best_match = order['Order_ID']
+    if matches is None:
+        if index is None:
+            index = build_order_index(cursor)
+        matches = match_bills(index, [(bill_patient_name, bill_dates)])[0]
+
+    best_match, best_score = (matches[0][0], matches[0][1]) if matches else (None, 0.0)
 
     if is_diagnostic:
         print(f"\n🔍 Top Matching Orders:")
-        for match in sorted(top_matches, key=lambda x: x[1], reverse=True)[:10]:
+        for match in matches:
             print(f"  → Order: {match[0]} | Similarity: {match[1]:.2f} | DOS: {match[2]}")
         print(f"\n🎯 Best Match: {best_match} (Score: {best_score:.2f})")
         if not best_match:
@@ -139,7 +245,8 @@ def find_matching_claim(bill: dict, cursor: sqlite3.Cursor, is_diagnostic=False)
 
 # ─── Mapping Flow ────────────────────────────────────────────────
 
-def map_provider_bill(bill_id: str, cursor: sqlite3.Cursor) -> tuple[str, str, str]:
+def map_provider_bill(bill_id: str, cursor: sqlite3.Cursor, index: Optional[Dict] = None,
+                      matches: Optional[List[tuple]] = None) -> tuple[str, str, str]:
     cursor.execute("SELECT * FROM ProviderBill WHERE id = ?", (bill_id,))
     bill = cursor.fetchone()
     if not bill:
@@ -147,7 +254,7 @@ def map_provider_bill(bill_id: str, cursor: sqlite3.Cursor) -> tuple[str, str, s
     if bill['status'] != 'VALID' or bill['action'] != 'to_map':
         return bill['status'], bill['action'], "Bill not ready for mapping"
 
-    claim_id = find_matching_claim(bill, cursor)
+    claim_id = find_matching_claim(bill, cursor, index=index, matches=matches)
     if claim_id:
         cursor.execute("SELECT FULLY_PAID, BILLS_REC FROM Orders WHERE Order_ID = ?", (claim_id,))
         order_status = cursor.fetchone()
@@ -195,14 +302,25 @@ def process_mapping():
         total = len(bills)
         logger.info(f"🔁 Mapping {total} bills...")
 
-        for (bill_id,) in bills:
-            status, action, error = map_provider_bill(bill_id, cursor)
-            if status == "MAPPED":
-                mapped += 1
-            elif status == "DUPLICATE":
-                duplicate += 1
-            elif status == "UNMAPPED":
-                unmapped += 1
+        # Keys for orders added or edited since the last run; kept even if mapping fails
+        refresh_order_keys(conn)
+        conn.commit()
+
+        # Mapping only writes ProviderBill and BILLS_REC, so one index serves the whole run
+        index = build_order_index(cursor)
+
+        for start in range(0, total, MATCH_CHUNK_SIZE):
+            chunk = [bill_id for (bill_id,) in bills[start:start + MATCH_CHUNK_SIZE]]
+            chunk_matches = match_bill_chunk(cursor, index, chunk)
+
+            for bill_id in chunk:
+                status, action, error = map_provider_bill(bill_id, cursor, index, chunk_matches.get(bill_id))
+                if status == "MAPPED":
+                    mapped += 1
+                elif status == "DUPLICATE":
+                    duplicate += 1
+                elif status == "UNMAPPED":
+                    unmapped += 1
 
         conn.commit()
 
@@ -237,6 +355,8 @@ def run_diagnostic(bill_id: str):
         print(f"Original Name: {bill['patient_name']}")
         print(f"Normalized: {clean_name(bill['patient_name'])}\n")
 
+        refresh_order_keys(conn)
+        conn.commit()
         find_matching_claim(bill, cursor, is_diagnostic=True)
     finally:
         conn.close()
@@ -8,9 +8,12 @@ writes extracted text as JSON back to S3, and archives processed PDFs.
 import os
 import sys
 import logging
-import tempfile
-import json
+import time
+import queue
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 import boto3
 from google.cloud import vision
@@ -30,10 +33,10 @@ print(f"Looking for credentials at: {credentials_path}")
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = str(credentials_path)
 
 # Import S3 helper functions
-from config.s3_utils import list_objects, download, upload, move
+from config.s3_utils import list_objects, get_bytes, put_json, move_many, S3LogWriter
 
-# Initialize Vision API client
-vision_client = vision.ImageAnnotatorClient()
+# Google Vision API client, created on first use so the fake backend runs without credentials
+_vision_client = None
 
 # S3 prefixes
 INPUT_PREFIX = 'data/ProviderBills/pdf/'
@@ -42,34 +45,260 @@ OUTPUT_PREFIX = 'data/ProviderBills/txt/'
 LOG_PREFIX = 'logs/ocr_errors.log'
 S3_BUCKET = os.getenv('S3_BUCKET', 'bill-review-prod')
 
+# batch_annotate_files currently accepts a single AnnotateFileRequest per call
+VISION_MAX_FILES_PER_REQUEST = 1
+
+# Archived PDFs per move_many() call, so sources are deleted in bulk
+ARCHIVE_BATCH_SIZE = 100
+
+# Default number of threads per pipeline stage
+DEFAULT_STAGE_WORKERS = {"download": 4, "ocr": 4, "upload": 4, "archive": 2}
+
+
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    global _vision_client
+    if _vision_client is None:
+        _vision_client = vision.ImageAnnotatorClient()
+    return _vision_client
+
+
+def _file_request(content: bytes) -> types.AnnotateFileRequest:
+    return types.AnnotateFileRequest(
+        input_config=types.InputConfig(content=content, mime_type='application/pdf'),
+        features=[types.Feature(type_=types.Feature.Type.DOCUMENT_TEXT_DETECTION)]
+    )
+
+
+def _file_text(file_resp) -> str:
+    texts = []
+    for page_resp in file_resp.responses:
+        if page_resp.full_text_annotation:
+            texts.append(page_resp.full_text_annotation.text)
+    return "\n".join(texts)
+
 
 def ocr_pdf_with_vision(local_pdf_path: str) -> str:
     """Run Google Vision Document Text Detection on the PDF file."""
     with open(local_pdf_path, 'rb') as f:
         content = f.read()
+    return VisionOcrBackend().ocr_files([content])[0]
 
-    input_config = types.InputConfig(
-        content=content,
-        mime_type='application/pdf'
-    )
-    feature = types.Feature(
-        type_=types.Feature.Type.DOCUMENT_TEXT_DETECTION
-    )
-    request = types.AnnotateFileRequest(
-        input_config=input_config,
-        features=[feature]
-    )
 
-    response = vision_client.batch_annotate_files(requests=[request])
-    texts = []
-    for file_resp in response.responses:
-        for page_resp in file_resp.responses:
-            if page_resp.full_text_annotation:
-                texts.append(page_resp.full_text_annotation.text)
-    return "\n".join(texts)
+class VisionOcrBackend:
+    """Google Vision Document Text Detection, up to max_files_per_request PDFs per call."""
+
+    max_files_per_request = VISION_MAX_FILES_PER_REQUEST
+
+    def ocr_files(self, contents: List[bytes]) -> List[str]:
+        """OCR text for each PDF in `contents`, in the same order."""
+        response = get_vision_client().batch_annotate_files(
+            requests=[_file_request(content) for content in contents]
+        )
+        texts = []
+        for file_resp in response.responses:
+            if file_resp.error.message:
+                raise RuntimeError(f"Vision error: {file_resp.error.message}")
+            texts.append(_file_text(file_resp))
+        return texts
+
+
+class FakeOcrBackend:
+    """Offline stand-in for VisionOcrBackend with a fixed latency per call and per file."""
+
+    def __init__(self, call_latency: float = 0.5, file_latency: float = 0.1, max_files_per_request: int = 16):
+        self.call_latency = call_latency
+        self.file_latency = file_latency
+        self.max_files_per_request = max_files_per_request
+        self.calls = 0
+
+    def ocr_files(self, contents: List[bytes]) -> List[str]:
+        self.calls += 1
+        time.sleep(self.call_latency + self.file_latency * len(contents))
+        return [f"FAKE OCR TEXT ({len(content)} bytes)" for content in contents]
+
+
+@dataclass
+class OcrJob:
+    """One PDF moving through the pipeline."""
+    key: str
+    content: Optional[bytes] = None
+    text: Optional[str] = None
+    json_key: Optional[str] = None
+
+    @property
+    def bill_id(self) -> str:
+        return Path(self.key).stem
+
+
+_STAGE_DONE = object()
+
+
+class OcrPipeline:
+    """
+    Overlapping download → OCR → JSON upload → archive stages, each with its own threads.
+
+    Stages are connected by bounded queues, so a slow OCR call never holds up
+    the next download. The OCR stage groups whatever PDFs are waiting into one
+    request, up to the backend's max_files_per_request. A failed PDF is logged
+    and dropped; it stays in the input prefix for the next run.
+    """
 
+    def __init__(self, backend=None, workers: Optional[Dict[str, int]] = None,
+                 batch_size: Optional[int] = None, batch_wait: float = 0.2,
+                 archive_batch_size: int = ARCHIVE_BATCH_SIZE,
+                 get_fn: Callable = get_bytes, put_json_fn: Callable = put_json,
+                 move_many_fn: Callable = move_many, error_log: Optional[S3LogWriter] = None):
+        """
+        Args:
+            backend: OCR backend; defaults to VisionOcrBackend
+            workers: Threads per stage, keyed download/ocr/upload/archive
+            batch_size: PDFs per OCR request, capped at the backend's limit
+            batch_wait: Seconds the OCR stage waits for more PDFs to fill a batch
+            archive_batch_size: PDFs per archive move_many() call
+            get_fn, put_json_fn, move_many_fn: In-memory storage operations (config.s3_utils by default)
+            error_log: Where failures are appended; an S3LogWriter on LOG_PREFIX by default
+        """
+        self.backend = backend or VisionOcrBackend()
+        self.workers = {**DEFAULT_STAGE_WORKERS, **(workers or {})}
+        limit = self.backend.max_files_per_request
+        self.batch_size = min(batch_size or limit, limit)
+        self.batch_wait = batch_wait
+        self.archive_batch_size = archive_batch_size
+        self.get_fn = get_fn
+        self.put_json_fn = put_json_fn
+        self.move_many_fn = move_many_fn
+        self.logger = logging.getLogger("OCR Processing")
+        self.error_log = error_log or S3LogWriter(LOG_PREFIX)
+        self.errors: List[str] = []
+        self.counts = {"downloaded": 0, "ocr_requests": 0, "ocr_files": 0, "uploaded": 0, "archived": 0, "failed": 0}
+        self._lock = threading.Lock()
 
-def process_ocr_s3():
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _fail(self, job: OcrJob, stage: str, error: Exception):
+        self.logger.error(f"Error processing {Path(job.key).name} ({stage}): {error}")
+        with self._lock:
+            self.counts["failed"] += 1
+            line = f"{datetime.now()}: Error OCR {job.key} ({stage}): {error}"
+            self.errors.append(line)
+        self.error_log.write(line)
+
+    def _download(self, job: OcrJob) -> List[OcrJob]:
+        job.content = self.get_fn(job.key)
+        if job.content is None:
+            raise RuntimeError("download failed")
+        self._count("downloaded")
+        return [job]
+
+    def _ocr(self, batch: List[OcrJob]) -> List[OcrJob]:
+        texts = self.backend.ocr_files([job.content for job in batch])
+        self._count("ocr_requests")
+        self._count("ocr_files", len(batch))
+        for job, text in zip(batch, texts):
+            job.text = text
+            job.content = None
+        return batch
+
+    def _upload(self, job: OcrJob) -> List[OcrJob]:
+        json_data = {
+            "provider_bill_id": job.bill_id,
+            "ocr_text": job.text,
+            "processed_at": datetime.now().isoformat()
+        }
+        job.json_key = f"{OUTPUT_PREFIX}{job.bill_id}.json"
+        if not self.put_json_fn(json_data, job.json_key):
+            raise RuntimeError("upload failed")
+        self.logger.info(f"Saved OCR JSON: {job.json_key}")
+        self._count("uploaded")
+        return [job]
+
+    def _archive(self, batch: List[OcrJob]) -> List[OcrJob]:
+        moved = self.move_many_fn([(job.key, f"{ARCHIVE_PREFIX}{Path(job.key).name}") for job in batch])
+        for job in batch:
+            if moved.get(job.key):
+                self._count("archived")
+            else:
+                self._fail(job, "archive", RuntimeError("archive move failed"))
+        self.logger.info(f"Archived {sum(moved.values())}/{len(batch)} PDFs to: {ARCHIVE_PREFIX}")
+        return []
+
+    def _next_batch(self, inbox: queue.Queue, first: OcrJob, batch_size: int) -> List[OcrJob]:
+        """`first` plus whatever else arrives within batch_wait, up to batch_size."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < batch_size:
+            try:
+                item = inbox.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _STAGE_DONE:
+                inbox.put(_STAGE_DONE)
+                break
+            batch.append(item)
+        return batch
+
+    def _stage(self, name: str, handler: Callable, inbox: queue.Queue,
+               outbox: Optional[queue.Queue], batch_size: Optional[int] = None) -> List[threading.Thread]:
+        def worker():
+            while True:
+                item = inbox.get()
+                if item is _STAGE_DONE:
+                    inbox.put(_STAGE_DONE)      # let sibling workers see it too
+                    return
+                jobs = self._next_batch(inbox, item, batch_size) if batch_size else [item]
+                try:
+                    results = handler(jobs) if batch_size else handler(item)
+                except Exception as e:
+                    for job in jobs:
+                        self._fail(job, name, e)
+                    continue
+                if outbox is not None:
+                    for job in results:
+                        outbox.put(job)
+
+        threads = [threading.Thread(target=worker, name=f"ocr-{name}-{i}", daemon=True)
+                   for i in range(self.workers[name])]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, keys: List[str]) -> Dict[str, int]:
+        """
+        Push every key through the pipeline and wait for it to drain.
+
+        Returns:
+            Per-stage counts, plus ocr_requests and failed
+        """
+        depth = 2 * max(self.workers.values())
+        queues = [queue.Queue(), queue.Queue(maxsize=depth), queue.Queue(maxsize=depth), queue.Queue(maxsize=depth)]
+
+        try:
+            stages = [
+                self._stage("download", self._download, queues[0], queues[1]),
+                self._stage("ocr", self._ocr, queues[1], queues[2], batch_size=self.batch_size),
+                self._stage("upload", self._upload, queues[2], queues[3]),
+                self._stage("archive", self._archive, queues[3], None, batch_size=self.archive_batch_size),
+            ]
+
+            for key in keys:
+                queues[0].put(OcrJob(key))
+            queues[0].put(_STAGE_DONE)
+
+            # Close each stage once the one before it has drained
+            for i, threads in enumerate(stages):
+                for thread in threads:
+                    thread.join()
+                if i + 1 < len(queues):
+                    queues[i + 1].put(_STAGE_DONE)
+        finally:
+            self.error_log.close()
+
+        return dict(self.counts)
+
+
+def process_ocr_s3(workers: Optional[Dict[str, int]] = None, batch_size: Optional[int] = None):
     """Process PDFs with OCR, save JSON output, and archive processed PDFs."""
     logger = logging.getLogger("OCR Processing")
     
@@ -84,54 +313,59 @@ def process_ocr_s3():
 
     logger.info(f"Found {len(pdf_keys)} PDFs to process")
     
-    for key in pdf_keys:
-        pdf_name = Path(key).name
-        logger.info(f"Processing {pdf_name}")
-        
-        try:
-            # Create temp directory for processing
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir)
-                
-                # Download PDF
-                local_pdf = temp_path / pdf_name
-                download(key, str(local_pdf))
-                
-                # Perform OCR
-                extracted = ocr_pdf_with_vision(str(local_pdf))
-                
-                # Create JSON structure
-                base_name = local_pdf.stem  # This will be the ProviderBill ID
-                json_data = {
-                    "provider_bill_id": base_name,
-                    "ocr_text": extracted,
-                    "processed_at": datetime.now().isoformat()
-                }
-                
-                # Write JSON locally
-                local_json = temp_path / f"{base_name}.json"
-                with open(local_json, 'w', encoding='utf-8') as f:
-                    json.dump(json_data, f, indent=2)
-
-                # Upload JSON to S3
-                s3_json_key = f"{OUTPUT_PREFIX}{base_name}.json"
-                upload(str(local_json), s3_json_key)
-                logger.info(f"Saved OCR JSON: {s3_json_key}")
-
-                # Move processed PDF to archived folder
-                archive_key = f"{ARCHIVE_PREFIX}{pdf_name}"
-                move(key, archive_key)
-                logger.info(f"Archived PDF to: {archive_key}")
-
-        except Exception as e:
-            logger.error(f"Error processing {pdf_name}: {str(e)}", exc_info=True)
-            # Write error to log file
-            log_local = temp_path / "error.log"
-            with open(log_local, 'w', encoding='utf-8') as logf:
-                logf.write(f"Error OCR {key}: {str(e)}\n")
-            upload(str(log_local), LOG_PREFIX)
-
-    logger.info("OCR processing complete")
+    counts = OcrPipeline(VisionOcrBackend(), workers, batch_size).run(pdf_keys)
+
+    logger.info(f"OCR processing complete: {counts}")
+
+
+def benchmark_ocr_pipeline(files: int = 40, call_latency: float = 0.5, transfer_latency: float = 0.1) -> Dict[str, float]:
+    """
+    Time a serial run (one worker per stage, one file per OCR call and archive
+    move) against the default pipeline, offline: a FakeOcrBackend and
+    sleep-only storage functions, so nothing touches S3.
+
+    Returns:
+        Dict with seconds per configuration and the speedup
+    """
+    def fake_get(key):
+        time.sleep(transfer_latency)
+        return b"%PDF-1.4 fake"
+
+    def fake_put(*args):
+        time.sleep(transfer_latency)
+        return True
+
+    def fake_move_many(moves):
+        time.sleep(transfer_latency)
+        return {source_key: True for source_key, _ in moves}
+
+    class FakeErrorLog:
+        def write(self, line):
+            print(f"  {line}")
+
+        def close(self):
+            pass
+
+    keys = [f"{INPUT_PREFIX}bench_{i:04d}.pdf" for i in range(files)]
+    configs = {
+        "serial": dict(workers={"download": 1, "ocr": 1, "upload": 1, "archive": 1},
+                       batch_size=1, archive_batch_size=1),
+        "pipelined": dict(),
+    }
+
+    results = {}
+    for name, options in configs.items():
+        pipeline = OcrPipeline(FakeOcrBackend(call_latency), get_fn=fake_get,
+                               put_json_fn=fake_put, move_many_fn=fake_move_many,
+                               error_log=FakeErrorLog(), **options)
+        start = time.perf_counter()
+        counts = pipeline.run(keys)
+        results[name] = time.perf_counter() - start
+        print(f"  {name:10} {results[name]:.2f}s  {counts}")
+
+    results["speedup"] = results["serial"] / results["pipelined"]
+    print(f"  speedup    {results['speedup']:.1f}x")
+    return results
 
 
 if __name__ == '__main__':
@@ -141,4 +375,17 @@ if __name__ == '__main__':
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         handlers=[logging.StreamHandler(sys.stdout)]
     )
-    process_ocr_s3()
+    import argparse
+    parser = argparse.ArgumentParser(description="OCR ProviderBill PDFs with Google Vision")
+    for stage, default in DEFAULT_STAGE_WORKERS.items():
+        parser.add_argument(f"--{stage}-workers", type=int, default=default,
+                            help=f"Threads for the {stage} stage (default: {default})")
+    parser.add_argument("--batch-size", type=int, help="PDFs per OCR request, up to the backend limit")
+    parser.add_argument("--benchmark", action="store_true", help="Time serial vs pipelined runs offline and exit")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_ocr_pipeline()
+    else:
+        workers = {stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_STAGE_WORKERS}
+        process_ocr_s3(workers, args.batch_size)
@@ -0,0 +1,176 @@
+# billing/logic/preprocess/utils/order_keys.py
+"""
+Materialized match keys for orders.
+
+Claim mapping and the bill review order search compare cleaned patient
+names and parsed DOS values. Instead of re-cleaning every order row on every
+bill, the keys are stored next to the source columns:
+
+    orders.patient_first_key / patient_last_key   clean_name() of the names
+    order_line_items.dos_iso                      normalize_date() as YYYY-MM-DD,
+                                                  '' when the DOS cannot be parsed
+
+NULL means "not computed yet". New rows start out NULL and triggers reset
+the keys whenever the source columns are updated, from any connection, so
+refresh_order_keys() only has to fill the NULL rows it finds through the
+key indexes.
+
+The preprocess pipeline owns the schema and the refresh: map_bill runs
+refresh_order_keys() at the start of every mapping run, and running this
+module installs and backfills the keys on a database up front. The bill
+review webapp never writes them: it searches the indexed key columns and
+keys rows that are still NULL on the fly with the same clean_name() and
+normalize_date() rules, registered as SQL functions on its connections
+(bill_review/apps.py). SQLite triggers cannot run these rules, and orders
+are written outside this codebase, so new and edited rows stay NULL until
+the next refresh.
+"""
+
+import re
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ORDER_KEY_COLUMNS = {
+    'orders': ('patient_first_key', 'patient_last_key'),
+    'order_line_items': ('dos_iso',),
+}
+
+ORDER_KEY_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_patient_keys ON orders(patient_last_key, patient_first_key)",
+    "CREATE INDEX IF NOT EXISTS idx_order_line_items_dos_iso ON order_line_items(dos_iso)",
+    """
+    CREATE TRIGGER IF NOT EXISTS orders_patient_keys_update
+    AFTER UPDATE OF Patient_First_Name, Patient_Last_Name ON orders
+    BEGIN
+        UPDATE orders SET patient_first_key = NULL, patient_last_key = NULL WHERE rowid = NEW.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS order_line_items_dos_iso_update
+    AFTER UPDATE OF DOS ON order_line_items
+    BEGIN
+        UPDATE order_line_items SET dos_iso = NULL WHERE rowid = NEW.rowid;
+    END
+    """,
+]
+
+ORDER_KEY_TRIGGERS = ('orders_patient_keys_update', 'order_line_items_dos_iso_update')
+
+
+def clean_name(name: str) -> str:
+    if not name:
+        return ""
+    name = name.lower().replace(",", "").strip()
+    name = re.sub(r'[^a-z\s-]', '', name)
+    suffixes = ['jr', 'sr', 'ii', 'iii', 'iv', 'v', 'phd', 'md', 'do']
+    for sfx in suffixes:
+        name = re.sub(rf'\b{sfx}\b', '', name)
+    name = re.sub(r'\s+', ' ', name)
+    return name.strip()
+
+
+def normalize_date(date_str: str) -> Optional[datetime.date]:
+    if not date_str:
+        return None
+    date_str = str(date_str).strip()
+    if ' - ' in date_str:
+        date_str = date_str.split(' - ')[0].strip()
+    if ' ' in date_str:
+        date_str = date_str.split(' ')[0]
+    formats = [
+        '%Y-%m-%d', '%m/%d/%Y', '%m-%d-%Y',
+        '%Y/%m/%d', '%m/%d/%y', '%m-%d-%y',
+        '%Y%m%d', '%m%d%Y', '%m%d%y'
+    ]
+    for fmt in formats:
+        try:
+            d = datetime.strptime(date_str, fmt).date()
+            if 2020 <= d.year <= 2035:
+                return d
+        except ValueError:
+            continue
+    return None
+
+
+def ensure_order_keys(conn: sqlite3.Connection) -> None:
+    """
+    Add the key columns, their indexes and the reset triggers if they are missing.
+
+    Stays read-only once everything is installed.
+    """
+    installed = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN "
+        f"({', '.join(['?'] * len(ORDER_KEY_TRIGGERS))})",
+        ORDER_KEY_TRIGGERS
+    ).fetchone()[0]
+    if installed == len(ORDER_KEY_TRIGGERS):
+        return
+
+    for table, key_columns in ORDER_KEY_COLUMNS.items():
+        columns = [row[1].lower() for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        for column in key_columns:
+            if column not in columns:
+                logger.info(f"Adding {column} key column to {table}")
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+    for statement in ORDER_KEY_SCHEMA:
+        conn.execute(statement)
+
+
+def refresh_order_keys(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Compute keys for orders and order line items that do not have them yet.
+
+    Cheap when nothing changed: both lookups are index probes for NULL keys.
+    The caller owns the transaction.
+
+    Args:
+        conn: sqlite3 connection to the monolith database
+
+    Returns:
+        Dict with the number of orders and order_line_items rows refreshed
+    """
+    ensure_order_keys(conn)
+
+    orders = conn.execute("""
+        SELECT rowid, Patient_First_Name, Patient_Last_Name
+        FROM orders
+        WHERE patient_last_key IS NULL
+    """).fetchall()
+    conn.executemany(
+        "UPDATE orders SET patient_first_key = ?, patient_last_key = ? WHERE rowid = ?",
+        [(clean_name(first), clean_name(last), rowid) for rowid, first, last in orders]
+    )
+
+    line_items = conn.execute("SELECT rowid, DOS FROM order_line_items WHERE dos_iso IS NULL").fetchall()
+    dos_keys = []
+    for rowid, dos in line_items:
+        d = normalize_date(dos)
+        dos_keys.append((d.isoformat() if d else '', rowid))
+    conn.executemany("UPDATE order_line_items SET dos_iso = ? WHERE rowid = ?", dos_keys)
+
+    if orders or line_items:
+        logger.info(f"Refreshed match keys for {len(orders)} orders and {len(line_items)} order line items")
+    return {'orders': len(orders), 'order_line_items': len(line_items)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Install and backfill the order match keys")
+    parser.add_argument("db", help="Path to monolith.db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        counts = refresh_order_keys(conn)
+        conn.commit()
+        print(f"Refreshed order keys: {counts}")
+    finally:
+        conn.close()
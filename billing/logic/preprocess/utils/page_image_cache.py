@@ -0,0 +1,173 @@
+# billing/logic/preprocess/utils/page_image_cache.py
+"""
+Render-once cache for PDF page images.
+
+Rendered pages are keyed by (PDF content hash, page, dpi, quality, max width),
+so a retry, a re-run or the preview generator asking for the same page of the
+same file gets the stored bytes instead of rasterizing it again. Entries live
+in an in-memory LRU bounded by total size and, when a spill directory is
+configured, are also written to disk so they survive the process.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Rendered bytes held in memory per process; a 200 DPI HCFA page is ~300 KB as JPEG
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+CacheKey = Tuple[str, int, int, Optional[int], Optional[int]]
+
+
+def pdf_content_hash(pdf_bytes: bytes) -> str:
+    """SHA-256 of the PDF file contents."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def page_zoom(page: "fitz.Page", dpi: int, max_width_px: Optional[int] = None) -> float:
+    """Zoom factor that renders `page` at `dpi`, scaled down up front to fit max_width_px."""
+    zoom = dpi / 72
+    if max_width_px and page.rect.width * zoom > max_width_px:
+        zoom = max_width_px / page.rect.width
+    return zoom
+
+
+def render_page(page: "fitz.Page", dpi: int, jpeg_quality: Optional[int] = None,
+                max_width_px: Optional[int] = None) -> bytes:
+    """Rasterize one page exactly once: JPEG bytes at jpeg_quality, or lossless PNG if None."""
+    zoom = page_zoom(page, dpi, max_width_px)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    if jpeg_quality is None:
+        return pix.tobytes("png")
+    return pix.tobytes("jpg", jpg_quality=jpeg_quality)
+
+
+class PageImageCache:
+    """Thread-safe LRU of rendered page images with an optional on-disk spill."""
+
+    def __init__(self, max_bytes: int = PAGE_CACHE_MAX_BYTES,
+                 spill_dir: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            max_bytes: Total size of the image bytes kept in memory
+            spill_dir: Directory to also store rendered pages in; None keeps them in memory only
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "renders": 0}
+
+    def _spill_path(self, key: CacheKey) -> Path:
+        pdf_hash, page_no, dpi, quality, max_width = key
+        suffix = "png" if quality is None else "jpg"
+        return self.spill_dir / f"{pdf_hash}_p{page_no}_{dpi}dpi_q{quality}_w{max_width}.{suffix}"
+
+    def _get(self, key: CacheKey) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return data
+
+        if self.spill_dir:
+            path = self._spill_path(key)
+            if path.exists():
+                data = path.read_bytes()
+                self._remember(key, data)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return data
+        return None
+
+    def _remember(self, key: CacheKey, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _put(self, key: CacheKey, data: bytes):
+        self._remember(key, data)
+        if self.spill_dir:
+            try:
+                path = self._spill_path(key)
+                tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Could not spill page image to {self.spill_dir}: {e}")
+
+    def render_pages(self, pdf_path: Union[str, Path], dpi: int = 200,
+                     jpeg_quality: Optional[int] = 80, max_width_px: Optional[int] = None,
+                     pages: Optional[List[int]] = None) -> Dict[int, bytes]:
+        """
+        Rendered image bytes for pages of a PDF, rasterizing only the ones not cached.
+
+        Pages that fail to render are logged and left out of the result.
+
+        Args:
+            pdf_path: PDF file to render
+            dpi: Target resolution
+            jpeg_quality: JPEG quality, or None for lossless PNG
+            max_width_px: Scale pages down so they are at most this wide
+            pages: Zero-based page numbers; None for every page
+
+        Returns:
+            Dict mapping page number to image bytes, in page order
+        """
+        pdf_bytes = Path(pdf_path).read_bytes()
+        pdf_hash = pdf_content_hash(pdf_bytes)
+
+        doc = None
+        results: Dict[int, bytes] = {}
+        try:
+            if pages is None:
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+                pages = list(range(len(doc)))
+
+            for page_no in pages:
+                key = (pdf_hash, page_no, dpi, jpeg_quality, max_width_px)
+                data = self._get(key)
+                if data is None:
+                    try:
+                        if doc is None:
+                            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+                        data = render_page(doc[page_no], dpi, jpeg_quality, max_width_px)
+                    except Exception as e:
+                        logger.error(f"Error rendering page {page_no + 1} of {pdf_path}: {e}")
+                        continue
+                    with self._lock:
+                        self.stats["renders"] += 1
+                    self._put(key, data)
+                results[page_no] = data
+        finally:
+            if doc is not None:
+                doc.close()
+
+        return results
+
+    def clear(self):
+        """Drop every in-memory entry; spilled files are left in place."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+# Process-wide cache shared by the vision extractor and the preview generator
+page_cache = PageImageCache(spill_dir=os.getenv("PAGE_IMAGE_CACHE_DIR"))
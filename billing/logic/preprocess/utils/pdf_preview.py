@@ -10,8 +10,8 @@ import os
 import sys
 import logging
 import tempfile
+from io import BytesIO
 from pathlib import Path
-import fitz  # PyMuPDF
 import boto3
 from PIL import Image
 from dotenv import load_dotenv
@@ -22,6 +22,7 @@ sys.path.append(str(project_root))
 load_dotenv(project_root / ".env")
 
 from config.s3_utils import download  # Update this if using different helpers
+from page_image_cache import page_cache
 
 def generate_pdf_sections(pdf_filename: str):
     logger = logging.getLogger("PDF Section Generator")
@@ -39,15 +40,11 @@ def generate_pdf_sections(pdf_filename: str):
             s3_client.download_file(bucket, f"{input_prefix}{pdf_filename}", str(pdf_path))
             logger.info(f"Downloaded {pdf_filename}")
 
-            # Open PDF
-            pdf = fitz.open(str(pdf_path))
-            page = pdf[0]
-
-            # Render at 300 DPI
-            zoom = 300 / 72
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            # Render the first page at 300 DPI (lossless), reusing the shared page cache
+            rendered = page_cache.render_pages(pdf_path, dpi=300, jpeg_quality=None, pages=[0])
+            if 0 not in rendered:
+                raise ValueError(f"Could not render first page of {pdf_filename}")
+            image = Image.open(BytesIO(rendered[0])).convert("RGB")
             width, height = image.size
 
             # Set crop boundaries
@@ -73,8 +70,6 @@ def generate_pdf_sections(pdf_filename: str):
                 s3_client.upload_file(str(out_path), bucket, s3_key, ExtraArgs={"ContentType": "image/png"})
                 logger.info(f"Uploaded: {s3_key}")
 
-            pdf.close()
-
     except Exception as e:
         logger.error(f"Failed to process {pdf_filename}: {e}", exc_info=True)
         raise
@@ -54,6 +54,8 @@ def main():
                        help="Show what would be done without making changes")
     parser.add_argument("--run-extraction", action="store_true",
                        help="Run the extraction after reprocessing")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="With --run-extraction, call the LLM again instead of replaying cached extractions")
     
     args = parser.parse_args()
     
@@ -79,7 +81,8 @@ def main():
         return
     
     # Reprocess all bills
-    reprocess_bills(failed_bills, dry_run=False, run_extraction=args.run_extraction)
+    reprocess_bills(failed_bills, dry_run=False, run_extraction=args.run_extraction,
+                    use_cache=not args.no_cache)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -27,7 +27,7 @@ sys.path.append(str(PROJECT_ROOT))
 load_dotenv(PROJECT_ROOT / ".env")
 
 # Import S3 utilities
-from config.s3_utils import list_objects, download, upload, move
+from config.s3_utils import list_objects, move_many
 
 # Configuration
 S3_BUCKET = os.getenv("S3_BUCKET", "bill-review-prod")
@@ -73,106 +73,69 @@ def reset_bill_status(bill_id: str) -> bool:
     finally:
         conn.close()
 
-def move_pdf_from_archive(bill_id: str, dry_run: bool = False) -> bool:
-    """Move PDF from archive back to input folder."""
-    archive_key = f"{ARCHIVE_PREFIX}{bill_id}.pdf"
-    input_key = f"{INPUT_PREFIX}{bill_id}.pdf"
+def move_pdfs_from_archive(bill_ids: list[str], dry_run: bool = False) -> dict[str, bool]:
+    """
+    Move the PDFs of many bills from archive back to the input folder in bulk.
     
-    try:
-        # Debug S3 configuration
-        bucket = os.getenv("S3_BUCKET", "bill-review-prod")
-        aws_key = os.getenv("AWS_ACCESS_KEY_ID")
-        aws_secret = os.getenv("AWS_SECRET_ACCESS_KEY")
-        
-        print(f"   Using S3 bucket: {bucket}")
-        print(f"   AWS credentials: {'✓ Set' if aws_key and aws_secret else '❌ Missing'}")
-        print(f"   Looking for: {archive_key}")
-        
-        # Check if PDF exists in archive
-        try:
-            archive_objects = list_objects(ARCHIVE_PREFIX)
-            print(f"   list_objects returned: {type(archive_objects)} with {len(archive_objects) if archive_objects else 'None'} items")
-        except Exception as list_exc:
-            print(f" ❌ Error calling list_objects: {list_exc}")
-            return False
-            
-        if archive_objects is None:
-            print(f" ❌ Error listing archive objects - S3 connection issue")
-            print(f"   Check AWS credentials and S3_BUCKET environment variable")
-            return False
-        
-        # Check if PDF is in archive
-        if archive_key not in archive_objects:
-            print(f" ❌ PDF not found in archive: {archive_key}")
-            
-            # Check if PDF is already in input folder
-            try:
-                input_objects = list_objects(INPUT_PREFIX)
-                if input_key in input_objects:
-                    print(f"   ✓ PDF found in input folder - no need to move")
-                    return True
-                else:
-                    print(f"   ❌ PDF not found in input folder either")
-            except Exception as input_exc:
-                print(f"   ❌ Error checking input folder: {input_exc}")
-            
-            # Show some archive files to help debug
-            print(f"   Available archive objects: {len(archive_objects)} files")
-            print(f"   First 10 archive files:")
-            for i, obj in enumerate(archive_objects[:10]):
-                print(f"     {i+1}. {obj}")
-            
-            # Look for files that might match the bill ID
-            matching_files = [obj for obj in archive_objects if bill_id in obj]
-            if matching_files:
-                print(f"   Found {len(matching_files)} files containing '{bill_id}':")
-                for obj in matching_files:
-                    print(f"     {obj}")
+    Lists the archive and input folders once and moves every PDF with one
+    move_many() call, instead of relisting the archive for each bill.
+    
+    Returns:
+        Dict mapping bill ID to True if its PDF is (or would be) in the input folder
+    """
+    archive_objects = set(list_objects(ARCHIVE_PREFIX))
+    input_objects = set(list_objects(INPUT_PREFIX))
+    print(f"Archive holds {len(archive_objects)} objects, input holds {len(input_objects)}")
+    
+    results = {}
+    moves = {}
+    for bill_id in bill_ids:
+        archive_key = f"{ARCHIVE_PREFIX}{bill_id}.pdf"
+        input_key = f"{INPUT_PREFIX}{bill_id}.pdf"
+        
+        if archive_key in archive_objects:
+            if dry_run:
+                print(f"   [DRY RUN] Would move {archive_key} → {input_key}")
+                results[bill_id] = True
             else:
-                print(f"   No files found containing '{bill_id}'")
-            
-            return False
-        
-        if dry_run:
-            print(f"   [DRY RUN] Would move {archive_key} → {input_key}")
-            return True
-        
-        # Move from archive to input
-        move(archive_key, input_key)
-        print(f"   ✓ Moved PDF from archive to input")
-        return True
-        
-    except Exception as exc:
-        print(f" ❌ S3 move error for {bill_id}: {exc}")
-        import traceback
-        print(f"   Full error: {traceback.format_exc()}")
-        return False
+                moves[archive_key] = (bill_id, input_key)
+        elif input_key in input_objects:
+            print(f"   ✓ {bill_id}: PDF found in input folder - no need to move")
+            results[bill_id] = True
+        else:
+            print(f" ❌ {bill_id}: PDF not found in archive or input folder")
+            results[bill_id] = False
+    
+    if moves:
+        moved = move_many([(archive_key, input_key) for archive_key, (_, input_key) in moves.items()])
+        for archive_key, (bill_id, _) in moves.items():
+            results[bill_id] = moved[archive_key]
+            if not moved[archive_key]:
+                print(f" ❌ S3 move error for {bill_id}")
+        print(f"   ✓ Moved {sum(moved.values())}/{len(moves)} PDFs from archive to input")
+    
+    return results
 
-def reprocess_bills(bill_ids: list[str], dry_run: bool = False, run_extraction: bool = False):
+def reprocess_bills(bill_ids: list[str], dry_run: bool = False, run_extraction: bool = False,
+                    use_cache: bool = True):
     """Reprocess a list of failed bills."""
     print(f"Reprocessing {len(bill_ids)} bills...")
     print(f"Dry run: {dry_run}")
     print(f"Run extraction: {run_extraction}")
     print("-" * 50)
     
-    successful = 0
-    failed = 0
-    
+    # Step 1: Reset database status
+    reset_ids = []
     for i, bill_id in enumerate(bill_ids, 1):
         print(f"\n[{i}/{len(bill_ids)}] Processing {bill_id}")
-        
-        # Step 1: Reset database status
-        if not reset_bill_status(bill_id):
-            failed += 1
-            continue
-        
-        # Step 2: Move PDF from archive to input
-        if not move_pdf_from_archive(bill_id, dry_run):
-            failed += 1
-            continue
-        
-        successful += 1
-        print(f"   ✓ {bill_id} ready for reprocessing")
+        if reset_bill_status(bill_id):
+            reset_ids.append(bill_id)
+    
+    # Step 2: Move PDFs from archive to input, all at once
+    print()
+    moved = move_pdfs_from_archive(reset_ids, dry_run) if reset_ids else {}
+    successful = sum(moved.values())
+    failed = len(bill_ids) - successful
     
     print(f"\n" + "="*50)
     print(f"SUMMARY:")
@@ -184,8 +147,11 @@ def reprocess_bills(bill_ids: list[str], dry_run: bool = False, run_extraction:
         print(f"\nBills ready for reprocessing: {successful}")
         if run_extraction:
             print("\nRunning extraction...")
-            # Import and run the extraction
+            # Import and run the extraction; unchanged PDFs replay their cached result unless use_cache is off
             from llm_hcfa_vision import process_s3
+            from extraction_cache import extraction_cache
+            if not use_cache:
+                extraction_cache.bypass = True
             process_s3()
         else:
             print(f"\nTo run extraction, use:")
@@ -199,6 +165,8 @@ def main():
                        help="Show what would be done without making changes")
     parser.add_argument("--run-extraction", action="store_true",
                        help="Run the extraction after reprocessing")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="With --run-extraction, call the LLM again instead of replaying cached extractions")
     
     args = parser.parse_args()
     
@@ -218,7 +186,7 @@ def main():
             print("Cancelled.")
             return
     
-    reprocess_bills(bill_ids, args.dry_run, args.run_extraction)
+    reprocess_bills(bill_ids, args.dry_run, args.run_extraction, use_cache=not args.no_cache)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -24,7 +24,8 @@ sys.path.append(str(PROJECT_ROOT))
 load_dotenv(PROJECT_ROOT / ".env")
 
 # Import S3 utilities
-from config.s3_utils import list_objects, upload, move, download
+from config.s3_utils import upload, move, download, reconcile_index
+from config.s3_index import STAGE_PREFIXES, object_index
 
 # S3 Configuration
 S3_BUCKET = os.getenv("S3_BUCKET", "bill-review-prod")
@@ -32,11 +33,14 @@ INPUT_PREFIX = "data/ProviderBills/pdf/"
 ARCHIVE_PREFIX = "data/ProviderBills/pdf/archive/"
 BACKUP_DIR = PROJECT_ROOT / "billing" / "logic" / "preprocess" / "backup_pdfs"
 LOG_PREFIX = "logs/backup_sync_errors.log"
+# Reuse a relist of a prefix from the last few minutes instead of listing again
+INDEX_MAX_AGE_SECONDS = int(os.getenv("S3_INDEX_MAX_AGE_SECONDS", "300"))
 
 def get_s3_files(prefix):
-    """Get list of files in S3 with given prefix."""
+    """Get the set of files directly under a stage prefix, from the S3 object index."""
     try:
-        return set(list_objects(prefix))
+        reconcile_index([prefix], bucket=S3_BUCKET, max_age_seconds=INDEX_MAX_AGE_SECONDS)
+        return set(object_index.keys_in_stage(STAGE_PREFIXES[prefix], S3_BUCKET))
     except Exception as e:
         print(f"❌ Error listing S3 files with prefix {prefix}: {e}")
         return set()
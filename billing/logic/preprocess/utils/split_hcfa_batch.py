@@ -9,11 +9,14 @@ and uploads them to S3 with ProviderBill ID naming format.
 import os
 import sys
 import logging
-import tempfile
 import uuid
 import shutil
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 from pathlib import Path
+from typing import Iterator, List, Tuple
 from PyPDF2 import PdfReader, PdfWriter
 from dotenv import load_dotenv
 import sqlite3
@@ -27,7 +30,7 @@ logger = logging.getLogger(__name__)
 load_dotenv(project_root / '.env')
 
 # Import S3 helper functions
-from config.s3_utils import upload
+from config.s3_utils import put_bytes, delete_many
 
 # Constants
 INPUT_DIR = project_root / 'billing' / 'data' / 'billbatch'  # Fixed path
@@ -38,6 +41,10 @@ S3_BUCKET = os.getenv('S3_BUCKET', 'bill-review-prod')
 # Get the absolute path to the monolith root directory
 DB_ROOT = Path(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolith")
 
+# Concurrent page uploads, and split pages held in memory waiting for an upload slot
+UPLOAD_WORKERS = int(os.getenv('SPLIT_UPLOAD_WORKERS', '8'))
+MAX_PAGES_IN_FLIGHT = 4 * UPLOAD_WORKERS
+
 def ensure_directories():
     """Ensure input and archive directories exist."""
     INPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -46,65 +53,96 @@ def ensure_directories():
     logger.info(f"Input directory: {INPUT_DIR}")
     logger.info(f"Archive directory: {ARCHIVE_DIR}")
 
-def create_provider_bill_entry(source_file: str) -> str:
-    """Create a new entry in the ProviderBill table and return its ID."""
+def create_provider_bill_entries(bill_ids: List[str], source_files: List[str]):
+    """Create the ProviderBill entries for a whole batch PDF in one transaction."""
     db_path = DB_ROOT / 'monolith.db'
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
     
     try:
-        # Generate a UUID for the ID
-        bill_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
-        
-        cursor.execute(
-            """
-            INSERT INTO ProviderBill (
-                id, claim_id, source_file, status, created_at
-            ) VALUES (?, ?, ?, ?, ?)
-            """,
-            (bill_id, None, source_file, 'RECEIVED', now)
-        )
-        conn.commit()
-        return bill_id
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO ProviderBill (
+                    id, claim_id, source_file, status, created_at
+                ) VALUES (?, ?, ?, ?, ?)
+                """,
+                [(bill_id, None, source_file, 'RECEIVED', now)
+                 for bill_id, source_file in zip(bill_ids, source_files)]
+            )
     except sqlite3.Error as e:
-        logger.error(f"Database error creating ProviderBill entry: {str(e)}")
+        logger.error(f"Database error creating ProviderBill entries: {str(e)}")
         raise
     finally:
         conn.close()
 
+def iter_page_pdfs(reader: PdfReader) -> Iterator[Tuple[int, bytes]]:
+    """Yield (1-based page number, single-page PDF bytes) without touching disk."""
+    for page_idx, page in enumerate(reader.pages, start=1):
+        writer = PdfWriter()
+        writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        yield page_idx, buffer.getvalue()
+
 def split_and_upload(pdf_path: Path):
-    """Split a batch PDF into pages, create ProviderBill entries, and upload to S3."""
+    """
+    Split a batch PDF into pages, upload them to S3 and create their ProviderBill entries.
+    
+    Pages are split in memory and uploaded concurrently. The ProviderBill rows
+    for the whole batch are inserted in one transaction only after every page
+    is in S3, so a failed upload leaves no rows pointing at missing PDFs and
+    the batch stays in the input directory to be retried. Pages already
+    uploaded by a failed attempt are deleted again, since the retry gives
+    them new IDs.
+    """
     logger = logging.getLogger("Split HCFA")
     logger.info(f"Processing {pdf_path}")
 
     try:
-        # Read and split PDF pages
         reader = PdfReader(str(pdf_path))
-        for page_idx, page in enumerate(reader.pages, start=1):
-            # Create a new ProviderBill entry for each page
-            source_file = f"{pdf_path.name}_page_{page_idx}"
-            bill_id = create_provider_bill_entry(source_file)
-            
-            writer = PdfWriter()
-            writer.add_page(page)
-
-            # Write page to a temporary file
-            local_out = Path(tempfile.mktemp(suffix=".pdf"))
-            with open(local_out, "wb") as f:
-                writer.write(f)
-
-            # Create filename with ProviderBill ID
-            output_filename = f"{bill_id}.pdf"
-            s3_key = f"{OUTPUT_PREFIX}{output_filename}"
-            
-            # Upload to S3
-            if not upload(str(local_out), s3_key, bucket=S3_BUCKET):
+        page_count = len(reader.pages)
+        # IDs are assigned up front so each page can be uploaded under its final name
+        bill_ids = [str(uuid.uuid4()) for _ in range(page_count)]
+        uploaded_keys: List[str] = []
+        uploaded_lock = threading.Lock()
+
+        def upload_page(page_idx: int, data: bytes) -> str:
+            s3_key = f"{OUTPUT_PREFIX}{bill_ids[page_idx - 1]}.pdf"
+            if not put_bytes(data, s3_key, bucket=S3_BUCKET, content_type='application/pdf'):
                 raise Exception(f"Failed to upload {s3_key} to S3")
-            logger.info(f"Uploaded {s3_key}")
-
-            # Clean up local page file
-            local_out.unlink()
+            with uploaded_lock:
+                uploaded_keys.append(s3_key)
+            return s3_key
+
+        try:
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+                pending = set()
+                try:
+                    for page_idx, data in iter_page_pdfs(reader):
+                        # Bound how many split pages sit in memory ahead of the uploads
+                        if len(pending) >= MAX_PAGES_IN_FLIGHT:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        pending.add(pool.submit(upload_page, page_idx, data))
+                    for future in pending:
+                        future.result()
+                except Exception:
+                    for future in pending:
+                        future.cancel()
+                    raise
+            logger.info(f"Uploaded {page_count} pages from {pdf_path.name}")
+
+            source_files = [f"{pdf_path.name}_page_{page_idx}" for page_idx in range(1, page_count + 1)]
+            create_provider_bill_entries(bill_ids, source_files)
+            logger.info(f"Created {page_count} ProviderBill entries for {pdf_path.name}")
+        except Exception:
+            # The executor has shut down, so no upload is still adding to uploaded_keys
+            if uploaded_keys:
+                logger.warning(f"Removing {len(uploaded_keys)} pages uploaded from {pdf_path.name} before the failure")
+                delete_many(uploaded_keys, bucket=S3_BUCKET)
+            raise
 
         # After successful processing, move the batch file to archive
         archive_path = ARCHIVE_DIR / pdf_path.name
@@ -11,6 +11,7 @@ import logging
 import sqlite3
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List
 from dotenv import load_dotenv
 from date_utils import standardize_and_validate_date_of_service
 
@@ -28,6 +29,91 @@ DB_ROOT = Path(r"C:\Users\ChristopherCato\OneDrive - clarity-dx.com\code\monolit
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def check_date_of_service(date_str) -> tuple[str | None, str | None]:
+    """
+    Standardize and validate one DOS value.
+    Returns (error_message, standardized_date); error_message is None when valid.
+    """
+    try:
+        is_valid, standardized_date, error_msg = standardize_and_validate_date_of_service(date_str)
+        if not is_valid:
+            return f"Date of service error: {error_msg}", None
+        return None, standardized_date
+    except Exception as e:
+        return f"Error processing date: {date_str} - {str(e)}", None
+
+def validate_bills(bills: List[sqlite3.Row], line_items: List[sqlite3.Row]) -> Dict[str, tuple[str, str, str]]:
+    """
+    Validate a set of ProviderBill records against all of their line items at once.
+
+    Each check runs over the whole line item column instead of bill by bill:
+    CPT format, charge amount, DOS (each distinct value parsed once) and the
+    per-bill charge total. Errors are reported in the same order as checking
+    the items of each bill one by one.
+
+    Args:
+        bills: ProviderBill rows
+        line_items: BillLineItem rows for those bills, in rowid order
+
+    Returns:
+        Dict mapping bill ID to (status, action, error_message)
+    """
+    bill_ids = [item['provider_bill_id'] for item in line_items]
+    cpt_codes = [item['cpt_code'] for item in line_items]
+    charges = [item['charge_amount'] for item in line_items]
+    dates = [item['date_of_service'] for item in line_items]
+
+    cpt_errors = [
+        None if code and len(code) == 5 else f"Invalid CPT code format: {code}"
+        for code in cpt_codes
+    ]
+    charge_errors = [
+        None if charge and charge > 0 else f"Invalid charge amount: {charge}"
+        for charge in charges
+    ]
+    date_checks = {date_str: check_date_of_service(date_str) for date_str in set(dates)}
+
+    # Grouped line item totals and per-bill error lists, in line item order
+    totals: Dict[str, float] = {}
+    item_errors: Dict[str, List[str]] = {}
+    for i, bill_id in enumerate(bill_ids):
+        totals[bill_id] = totals.get(bill_id, 0)
+        if charges[i] is not None:
+            totals[bill_id] += charges[i]
+        errors = item_errors.setdefault(bill_id, [])
+        date_error, standardized_date = date_checks[dates[i]]
+        errors.extend(error for error in (cpt_errors[i], charge_errors[i], date_error) if error)
+        if not date_error and dates[i] != standardized_date:
+            logger.info(f"Standardized date for line item {line_items[i]['id']}: '{dates[i]}' -> '{standardized_date}'")
+
+    results = {}
+    for bill in bills:
+        bill_id = bill['id']
+        if bill_id not in totals:
+            results[bill_id] = ('INVALID', 'add_line_items', f"No line items found for ProviderBill {bill_id}")
+            continue
+
+        # Only patient_name and total_charge are required
+        errors = []
+        if not bill['patient_name']:
+            errors.append("Missing Patient name")
+        if not bill['total_charge']:
+            errors.append("Missing Total charge")
+
+        errors.extend(item_errors[bill_id])
+
+        # Allow for small rounding differences
+        total_line_charges = totals[bill_id]
+        if bill['total_charge'] is not None and abs(total_line_charges - bill['total_charge']) > 10.00:
+            errors.append(f"Total charge mismatch: {bill['total_charge']} vs {total_line_charges}")
+
+        if errors:
+            results[bill_id] = ('INVALID', 'to_validate', "; ".join(errors))
+        else:
+            results[bill_id] = ('VALID', 'to_map', None)
+
+    return results
+
 def validate_provider_bill(bill_id: str, cursor: sqlite3.Cursor) -> tuple[str, str, str]:
     """
     Validate a ProviderBill record and its line items.
@@ -39,70 +125,14 @@ def validate_provider_bill(bill_id: str, cursor: sqlite3.Cursor) -> tuple[str, s
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
     
-    # Get the ProviderBill record
-    cursor.execute("""
-        SELECT * FROM ProviderBill WHERE id = ?
-    """, (bill_id,))
+    cursor.execute("SELECT * FROM ProviderBill WHERE id = ?", (bill_id,))
     bill = cursor.fetchone()
     
     if not bill:
         return 'INVALID', 'to_validate', f"ProviderBill {bill_id} not found"
     
-    # Get all line items for this bill
-    cursor.execute("""
-        SELECT * FROM BillLineItem WHERE provider_bill_id = ?
-    """, (bill_id,))
-    line_items = cursor.fetchall()
-    
-    if not line_items:
-        return 'INVALID', 'add_line_items', f"No line items found for ProviderBill {bill_id}"
-    
-    # Validation checks
-    errors = []
-    
-    # 1. Check required fields (only patient_name and total_charge are required)
-    if not bill['patient_name']:
-        errors.append("Missing Patient name")
-    if not bill['total_charge']:
-        errors.append("Missing Total charge")
-    
-    # 2. Validate line items
-    for item in line_items:
-        # Check CPT code format
-        if not item['cpt_code'] or len(item['cpt_code']) != 5:
-            errors.append(f"Invalid CPT code format: {item['cpt_code']}")
-        
-        # Check charge amount
-        if not item['charge_amount'] or item['charge_amount'] <= 0:
-            errors.append(f"Invalid charge amount: {item['charge_amount']}")
-        
-        # Check date of service - UPDATED with date utils
-        try:
-            date_str = item['date_of_service']
-            is_valid, standardized_date, error_msg = standardize_and_validate_date_of_service(date_str)
-            
-            if not is_valid:
-                errors.append(f"Date of service error: {error_msg}")
-            else:
-                # Log if we standardized the format
-                if date_str != standardized_date:
-                    logger.info(f"Standardized date for line item {item['id']}: '{date_str}' -> '{standardized_date}'")
-                    
-        except Exception as e:
-            errors.append(f"Error processing date: {date_str} - {str(e)}")
-    
-    # 3. Check total charge matches sum of line items
-    total_line_charges = sum(item['charge_amount'] for item in line_items)
-    if abs(total_line_charges - bill['total_charge']) > 10.00:  # Allow for small rounding differences
-        errors.append(f"Total charge mismatch: {bill['total_charge']} vs {total_line_charges}")
-    
-    # Determine status and action based on validation results
-    if errors:
-        error_message = "; ".join(errors)
-        return 'INVALID', 'to_validate', error_message
-    
-    # If all validations pass
-    return 'VALID', 'to_map', None
+    cursor.execute("SELECT * FROM BillLineItem WHERE provider_bill_id = ? ORDER BY rowid", (bill_id,))
+    return validate_bills([bill], cursor.fetchall())[bill_id]
 
 def process_validation():
     """Process all ProviderBill records that need validation."""
@@ -112,37 +142,40 @@ def process_validation():
     cursor = conn.cursor()
     
     try:
-        # Get all bills that need validation (status = 'RECEIVED')
+        # Get all bills that need validation (status = 'RECEIVED') and their line items
         cursor.execute("""
-            SELECT id FROM ProviderBill 
+            SELECT * FROM ProviderBill 
             WHERE status = 'RECEIVED'
         """)
         bills = cursor.fetchall()
         
         logger.info(f"Found {len(bills)} bills to validate")
         
-        for bill in bills:  # Changed from (bill_id,) to bill since we're using Row factory
-            bill_id = bill['id']  # Access the id field using dictionary syntax
-            logger.info(f"Validating bill {bill_id}")
-            
-            # Perform validation
-            status, action, error = validate_provider_bill(bill_id, cursor)
-            
-            # Update the record
-            cursor.execute("""
-                UPDATE ProviderBill 
-                SET status = ?,
-                    action = ?,
-                    last_error = ?
-                WHERE id = ?
-            """, (status, action, error, bill_id))
-            
-            logger.info(f"Updated bill {bill_id}: status={status}, action={action}")
+        cursor.execute("""
+            SELECT * FROM BillLineItem
+            WHERE provider_bill_id IN (SELECT id FROM ProviderBill WHERE status = 'RECEIVED')
+            ORDER BY rowid
+        """)
+        line_items = cursor.fetchall()
+        
+        results = validate_bills(bills, line_items)
+        
+        # Write every outcome in one statement, inside one transaction
+        cursor.executemany("""
+            UPDATE ProviderBill 
+            SET status = ?,
+                action = ?,
+                last_error = ?
+            WHERE id = ?
+        """, [(status, action, error, bill_id) for bill_id, (status, action, error) in results.items()])
+        
+        valid = sum(1 for status, _, _ in results.values() if status == 'VALID')
+        for bill_id, (status, action, error) in results.items():
             if error:
-                logger.warning(f"Validation errors: {error}")
+                logger.warning(f"Bill {bill_id} {status}/{action}: {error}")
         
         conn.commit()
-        logger.info("Validation complete")
+        logger.info(f"Validation complete: {valid} VALID, {len(results) - valid} INVALID")
         
     except sqlite3.Error as e:
         conn.rollback()
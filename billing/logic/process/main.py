@@ -1,84 +1,98 @@
 # billing/logic/process/main.py
 
+import json
 import logging
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
 
 # Configure path
 project_root = Path(__file__).resolve().parents[2]
 sys.path.append(str(project_root))
 
 # Import utilities
-from .utils.loader import load_mapped_bills, load_bill_data
-from .utils.validation import validate_provider_info, compare_cpt_codes, validate_units, load_ancillary_codes
-from .utils.db_queries import update_bill_status, update_line_item
-from .utils.db_utils import update_order_line_items_reviewed
-from .utils.arthrogram import check_arthrogram
-from .utils.rate_validation import validate_bill_rates
+from .utils.loader import load_mapped_bills, load_changed_mapped_bills, load_bills_batch
+from .utils.db_queries import (
+    update_bill_status, unit_of_work, savepoint,
+    acquire_connection, release_connection, capture_writes, apply_writes
+)
+from .utils.rules import (
+    DEFAULT_RULES, DEFAULT_RULESET, build_bill_context, preload_line_rates, evaluate_rules,
+    apply_outcome, compile_rules, dry_run_rules, rule_stats
+)
+from .utils.rate_cache import enable_ppo_rate_cache, refresh_ppo_rates_if_stale, ensure_ppo_tin_key
+from .utils.bill_journal import advance_checkpoint, PROCESS_CONSUMER
+from .utils.reference_cache import refresh_reference_data, reference_cache_stats, get_cpt_category_map
+from .utils.metrics import stage, reset_metrics, metrics_snapshot, merge_metrics, write_metrics_report
 
 # Configure logging
+LOG_DIR = project_root / 'logs'
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(project_root / 'logs' / f'process_{datetime.now().strftime("%Y%m%d")}.log'),
+        logging.FileHandler(LOG_DIR / f'process_{datetime.now().strftime("%Y%m%d")}.log'),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Number of bills loaded together by run_processing in batch mode
+DEFAULT_BATCH_SIZE = 200
 
-def process_provider_validation(bill_id: str, bill: Dict, provider: Optional[Dict]) -> bool:
+
+def run_bill_steps(
+    bill_id: str,
+    bill_data: Optional[Tuple] = None,
+    line_rates: Optional[Dict] = None
+) -> Dict:
     """
-    Check if provider information is complete enough to proceed to next validation step.
+    Run the validation rules for a bill and record the outcome.
+    
+    Exceptions are left to the caller; use process_bill() for the
+    error-handling wrapper.
     
     Args:
         bill_id: The provider bill ID
-        bill: The provider bill record
-        provider: The provider record (or None if not found)
+        bill_data: Preloaded (bill, bill_items, order, order_items, provider) tuple
+            from load_bills_batch; loaded from the DB if omitted
+        line_rates: Line item rates from preload_line_rates(); lines missing
+            from it are rated individually
         
     Returns:
-        bool: True if can proceed to next check, False if needs to stop for missing info
+        Dict with processing results
     """
-    logger.info(f"Checking provider information completeness for bill {bill_id}")
-    
-    # If provider record not found, cannot proceed
-    if not provider:
-        error_msg = "Provider information not found"
-        logger.warning(f"Cannot proceed: {error_msg}")
-        update_bill_status(bill_id, "FLAGGED", "update_prov_info", error_msg)
-        return False
+    ctx = build_bill_context(bill_id, bill_data, line_rates)
+    result = evaluate_rules(DEFAULT_RULESET, ctx)
     
-    # Check provider information completeness
-    validation_results = validate_provider_info(bill, provider)
-    
-    if validation_results['is_valid']:
-        logger.info(f"Provider information complete, proceeding to next check")
-        return True
+    if result['status'] in ("SUCCESS", "ARTHROGRAM"):
+        logger.info(f"Bill {bill_id}: {result['message']} (rule {result['rule']})")
     else:
-        # Build error message based on missing fields
-        missing_fields = [
-            field.replace('_present', '').replace('_', ' ').title()
-            for field, is_present in validation_results.items()
-            if field != 'is_valid' and not is_present
-        ]
-            
-        error_msg = "Cannot proceed: Missing required provider fields - " + ", ".join(missing_fields)
-        logger.warning(error_msg)
+        logger.warning(f"Bill {bill_id}: {result['message']} (rule {result['rule']})")
         
-        # Update bill status to indicate provider info needs to be updated
-        update_bill_status(bill_id, "FLAGGED", "update_prov_info", error_msg)
-        return False
+    apply_outcome(ctx, result)
+    return {"status": result['status'], "message": result['message']}
 
 
-def process_bill(bill_id: str) -> Dict:
+def process_bill(
+    bill_id: str,
+    bill_data: Optional[Tuple] = None,
+    line_rates: Optional[Dict] = None
+) -> Dict:
     """
     Process a single bill through all validation steps.
     
+    The bill's writes run inside a savepoint, so when this is called inside
+    unit_of_work() a failure rolls back only this bill before it is marked ERROR.
+    
     Args:
         bill_id: The provider bill ID
+        bill_data: Preloaded (bill, bill_items, order, order_items, provider) tuple
+            from load_bills_batch; loaded from the DB if omitted
+        line_rates: Preloaded line item rates; see run_bill_steps
         
     Returns:
         Dict with processing results
@@ -86,190 +100,177 @@ def process_bill(bill_id: str) -> Dict:
     logger.info(f"Processing bill {bill_id}")
     
     try:
-        # Step 1: Load all needed data
-        bill, bill_items, order, order_items, provider = load_bill_data(bill_id)
-        
-        if not bill:
-            logger.error(f"Bill {bill_id} not found")
-            return {"status": "ERROR", "message": "Bill not found"}
-            
-        if not bill_items:
-            logger.error(f"Bill {bill_id} has no line items")
-            update_bill_status(bill_id, "FLAGGED", "to_review", "No line items found")
-            return {"status": "ERROR", "message": "No line items found"}
-            
-        if not order:
-            logger.error(f"Bill {bill_id} has no associated order")
-            update_bill_status(bill_id, "FLAGGED", "to_review", "No associated order found")
-            return {"status": "ERROR", "message": "No associated order found"}
-        
-        # Step 2: Validate provider information
-        if not process_provider_validation(bill_id, bill, provider):
-            return {"status": "FLAGGED", "message": "Provider validation failed"}
-        
-        # Step 3: Check if this is an arthrogram
-        if check_arthrogram(bill_id, order.get('Order_ID', '')):
-            logger.info(f"Bill {bill_id} is for an arthrogram, routed to specialist processing")
-            return {"status": "ARTHROGRAM", "message": "Routed to arthrogram processing"}
-        
-        # Step 4: Validate units
-        units_validation = validate_units(bill_items)
-        if units_validation['has_violations']:
-            # Build error message with details of violations
-            violations = units_validation['violations']
-            error_msg = "Units validation failed: "
-            error_details = []
-            for v in violations:
-                error_details.append(f"CPT {v['cpt']} has {v['units']} units")
-            error_msg += "; ".join(error_details)
-            
-            logger.warning(f"Bill {bill_id}: {error_msg}")
-            update_bill_status(bill_id, "FLAGGED", "to_review", error_msg)
-            return {"status": "FLAGGED", "message": error_msg}
-            
-        logger.info(f"Bill {bill_id} passed units validation")
-        
-        # Step 5: Validate CPT codes
-        cpt_validation = compare_cpt_codes(bill_items, order_items)
-        ancillary_codes = load_ancillary_codes()
-        
-        # Check for exact match overbilling
-        if cpt_validation['exact_match_overbilling']:
-            overbilling_details = []
-            for match in cpt_validation['exact_match_overbilling']:
-                overbilling_details.append(
-                    f"CPT {match['cpt']}: billed {match['billed_count']} > ordered {match['ordered_count']}"
-                )
-            error_msg = "Exact match overbilling detected: " + "; ".join(overbilling_details)
-            logger.warning(f"Bill {bill_id}: {error_msg}")
-            update_bill_status(bill_id, "FLAGGED", "exact_match_overbilling", error_msg)
-            return {"status": "FLAGGED", "message": error_msg}
-            
-        # Check for category overbilling
-        if cpt_validation['category_overbilling']:
-            overbilling_details = []
-            for match in cpt_validation['category_overbilling']:
-                overbilling_details.append(
-                    f"Category {match['category']}/{match['subcategory']}: "
-                    f"billed {match['billed_count']} > ordered {match['ordered_count']} "
-                    f"(CPTs: {', '.join(match['billed_cpts'])})"
-                )
-            error_msg = "Category overbilling detected: " + "; ".join(overbilling_details)
-            logger.warning(f"Bill {bill_id}: {error_msg}")
-            update_bill_status(bill_id, "FLAGGED", "category_overbilling", error_msg)
-            return {"status": "FLAGGED", "message": error_msg}
-        
-        # Filter out ancillary codes from all matches
-        non_ancillary_exact_matches = [
-            match for match in cpt_validation['exact_matches']
-            if match['cpt'] not in ancillary_codes
-        ]
-        
-        non_ancillary_category_matches = [
-            match for match in cpt_validation['category_matches']
-            if match['billed_cpt'] not in ancillary_codes
-        ]
-        
-        # Case 1: Complete mismatch with order (excluding ancillaries)
-        if not non_ancillary_exact_matches and not non_ancillary_category_matches:
-            error_msg = "Bill CPT codes completely mismatch with order (excluding ancillaries)"
-            logger.warning(f"Bill {bill_id}: {error_msg}")
-            update_bill_status(bill_id, "REVIEW_FLAG", "complete_line_item_mismatch", error_msg)
-            return {"status": "FLAGGED", "message": error_msg}
-            
-        # Case 2: Bill has more non-ancillary line items than order
-        if cpt_validation['billed_not_ordered']:  # compare_cpt_codes already filters ancillaries
-            error_msg = f"Bill contains additional non-ancillary CPT codes not in order: {', '.join(cpt_validation['billed_not_ordered'])}"
-            logger.warning(f"Bill {bill_id}: {error_msg}")
-            update_bill_status(bill_id, "REVIEW_FLAG", "address_line_item_mismatch", error_msg)
-            return {"status": "FLAGGED", "message": error_msg}
-            
-        # Case 3: Exact matches or category matches (excluding ancillaries)
-        if non_ancillary_exact_matches or non_ancillary_category_matches:
-            # Get all matched non-ancillary CPT codes
-            matched_cpts = []
-            
-            # Add exact matches (excluding ancillaries)
-            for match in non_ancillary_exact_matches:
-                matched_cpts.append(match['cpt'])
-                
-            # Add category matches (excluding ancillaries)
-            for match in non_ancillary_category_matches:
-                matched_cpts.append(match['billed_cpt'])
-                
-            # Update order line items as reviewed (only for non-ancillary matches)
-            if matched_cpts and order.get('Order_ID'):
-                update_order_line_items_reviewed(
-                    order_id=order['Order_ID'],
-                    bill_id=bill_id,
-                    cpt_codes=matched_cpts
-                )
-                logger.info(f"Marked {len(matched_cpts)} non-ancillary order line items as reviewed for bill {bill_id}")
-            
-            # Step 6: Validate rates
-            rate_validation = validate_bill_rates(
-                bill_id=bill_id,
-                bill_items=bill_items,
-                provider=provider,
-                order_id=order['Order_ID']
-            )
-            
-            if not rate_validation['is_valid']:
-                logger.warning(f"Bill {bill_id}: {rate_validation['error']}")
-                return {"status": "FLAGGED", "message": rate_validation['error']}
-                
-            logger.info(f"Bill {bill_id} passed rate validation")
-            return {"status": "SUCCESS", "message": "Bill processed successfully"}
-            
-        # If we get here, something unexpected happened
-        error_msg = "Unexpected CPT code validation result"
-        logger.error(f"Bill {bill_id}: {error_msg}")
-        update_bill_status(bill_id, "ERROR", "to_review", error_msg)
-        return {"status": "ERROR", "message": error_msg}
-        
+        with stage('bill'), savepoint():
+            return run_bill_steps(bill_id, bill_data, line_rates)
     except Exception as e:
         logger.exception(f"Error processing bill {bill_id}: {str(e)}")
         update_bill_status(bill_id, "ERROR", "to_review", f"Processing error: {str(e)}")
         return {"status": "ERROR", "message": str(e)}
 
 
-def run_processing(limit: Optional[int] = None):
+def record_checkpoint(event_id: Optional[int]) -> None:
+    """Advance the process checkpoint in the bill_events journal, inside the current unit of work."""
+    if event_id is None:
+        return
+    conn = acquire_connection()
+    advance_checkpoint(conn, PROCESS_CONSUMER, event_id)
+    release_connection(conn)
+
+
+def empty_results(total: int) -> Dict:
+    """Start a run_processing summary for total bills."""
+    return {
+        "total": total,
+        "success": 0,
+        "flagged": 0,
+        "error": 0,
+        "arthrogram": 0
+    }
+
+
+def count_result(results: Dict, result: Dict) -> None:
+    """Add a process_bill result to the run_processing summary counts."""
+    status = result.get("status", "ERROR")
+    
+    if status == "SUCCESS":
+        results["success"] += 1
+    elif status == "FLAGGED":
+        results["flagged"] += 1
+    elif status == "ARTHROGRAM":
+        results["arthrogram"] += 1
+    else:
+        results["error"] += 1
+
+
+def process_chunk(bill_ids: List[str], batch_size: Optional[int]) -> List[Dict]:
+    """
+    Process a chunk of bills inside the caller's unit of work.
+    
+    Args:
+        bill_ids: Bills to process
+        batch_size: Falsy to load and rate each bill individually
+        
+    Returns:
+        process_bill results in the same order as bill_ids
+    """
+    conn = acquire_connection()
+    # Pick up PPO rates and dim_proc rows changed (e.g. from the webapp) since the last chunk
+    refresh_ppo_rates_if_stale(conn)
+    refresh_reference_data(conn)
+    release_connection(conn)
+    
+    with stage('load_batch'):
+        batch = load_bills_batch(bill_ids) if batch_size else {}
+    line_rates = {}
+    if batch:
+        try:
+            line_rates = preload_line_rates(batch)
+        except Exception as e:
+            logger.exception(f"Batch rate resolution failed, rating bills one at a time: {str(e)}")
+    
+    return [
+        process_bill(bill_id, batch.get(bill_id), line_rates)
+        for bill_id in bill_ids
+    ]
+
+
+def prepare_parallel_run() -> None:
+    """Apply schema additions once before fanning out, so workers only ever read."""
+    with unit_of_work() as conn:
+        ensure_ppo_tin_key(conn)
+        get_cpt_category_map(conn)
+
+
+def init_worker(rate_cache: bool) -> None:
+    """Set up a process pool worker for validate_chunk_in_worker()."""
+    enable_ppo_rate_cache(rate_cache)
+
+
+def validate_chunk_in_worker(bill_ids: List[str], batch_size: Optional[int]) -> Tuple[List[Dict], List, Dict]:
+    """
+    Validate a chunk of bills in a pool worker without writing to the database.
+    
+    Returns:
+        Tuple of (process_bill results, queued writes for apply_writes(),
+        stage samples for merge_metrics())
+    """
+    reset_metrics()
+    with unit_of_work():
+        with capture_writes() as writes:
+            chunk_results = process_chunk(bill_ids, batch_size)
+    return chunk_results, writes, metrics_snapshot()
+
+
+def run_processing(
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    rate_cache: bool = True,
+    workers: int = 1,
+    incremental: bool = False
+):
     """
     Run the processing pipeline on all mapped bills.
     
     Args:
         limit: Optional maximum number of bills to process
+        batch_size: Number of bills to bulk-load and rate-validate at a time;
+            0 or None processes each bill individually
+        rate_cache: Load the PPO fee schedule into memory once for the run
+            instead of querying it per line item
+        workers: Number of processes validating chunks in parallel; their
+            writes are funnelled through this process's single connection
+        incremental: Only pick up bills that moved to MAPPED since the last
+            checkpoint in the bill_events journal, advancing it per chunk
     """
     logger.info("Starting bill processing")
+    started_at = datetime.now()
+    reset_metrics()
+    enable_ppo_rate_cache(rate_cache)
     
     # Get bills that need processing
-    bills = load_mapped_bills(limit)
+    bills = load_changed_mapped_bills(limit) if incremental else load_mapped_bills(limit)
     logger.info(f"Found {len(bills)} bills to process")
     
     # Process each bill
-    results = {
-        "total": len(bills),
-        "success": 0,
-        "flagged": 0,
-        "error": 0,
-        "arthrogram": 0
-    }
+    results = empty_results(len(bills))
+    
+    bill_ids = [bill['id'] for bill in bills]
+    step = batch_size or 1
+    chunks = [bill_ids[start:start + step] for start in range(0, len(bill_ids), step)]
     
-    for bill in bills:
-        bill_id = bill['id']
-        result = process_bill(bill_id)
-        status = result.get("status", "ERROR")
+    # Journal high-water mark per chunk, recorded in the chunk's own transaction
+    # so a crashed run resumes right after the last committed chunk
+    event_ids = {bill['id']: bill.get('journal_event_id') for bill in bills}
+    checkpoints = [
+        max(event_ids[bill_id] for bill_id in chunk) if incremental else None
+        for chunk in chunks
+    ]
+    
+    if workers > 1 and len(chunks) > 1:
+        prepare_parallel_run()
         
-        if status == "SUCCESS":
-            results["success"] += 1
-        elif status == "FLAGGED":
-            results["flagged"] += 1
-        elif status == "ARTHROGRAM":
-            results["arthrogram"] += 1
-        else:
-            results["error"] += 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(rate_cache,)) as pool:
+            # map() yields chunks in order, so writes land in the same order as a serial run
+            chunk_outcomes = pool.map(validate_chunk_in_worker, chunks, repeat(batch_size))
+            for (chunk_results, writes, samples), checkpoint in zip(chunk_outcomes, checkpoints):
+                merge_metrics(samples)
+                with stage('apply_writes'), unit_of_work():
+                    apply_writes(writes)
+                    record_checkpoint(checkpoint)
+                for result in chunk_results:
+                    count_result(results, result)
+    else:
+        for chunk, checkpoint in zip(chunks, checkpoints):
+            # One connection and one commit per chunk instead of one per write
+            with unit_of_work():
+                for result in process_chunk(chunk, batch_size):
+                    count_result(results, result)
+                record_checkpoint(checkpoint)
     
     logger.info(f"Processing complete: {results}")
+    logger.info(f"Reference cache stats: {reference_cache_stats()}")
+    logger.info(f"Rule stats: {rule_stats()}")
+    write_metrics_report(LOG_DIR, results, started_at)
     return results
 
 
@@ -279,12 +280,36 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process provider bills')
     parser.add_argument('--limit', type=int, help='Maximum number of bills to process')
     parser.add_argument('--bill', type=str, help='Process a specific bill ID')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Bills to bulk-load per chunk (0 loads bills one at a time)')
+    parser.add_argument('--no-rate-cache', action='store_true',
+                        help='Query the ppo table per line item instead of caching it in memory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes validating bills in parallel')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process bills that became MAPPED since the last checkpoint')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Evaluate the rules over every bill and report status shifts without writing')
+    parser.add_argument('--disable-rule', action='append', default=[],
+                        help='Leave a rule out of the dry run (repeatable)')
+    parser.add_argument('--status', action='append',
+                        help='Only dry-run bills currently in this status (repeatable)')
     
     args = parser.parse_args()
     
-    if args.bill:
-        result = process_bill(args.bill)
+    if args.dry_run:
+        rules = compile_rules(DEFAULT_RULES, disable=args.disable_rule)
+        print(json.dumps(dry_run_rules(rules, statuses=args.status), indent=2))
+    elif args.bill:
+        with unit_of_work():
+            result = process_bill(args.bill)
         print(f"Result: {result}")
     else:
-        results = run_processing(args.limit)
+        results = run_processing(
+            args.limit,
+            batch_size=args.batch_size,
+            rate_cache=not args.no_rate_cache,
+            workers=args.workers,
+            incremental=args.incremental
+        )
         print(f"Results: {results}")
\ No newline at end of file
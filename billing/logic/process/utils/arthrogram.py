@@ -1,18 +1,40 @@
 # billing/logic/process/utils/arthrogram.py
 
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from .db_queries import get_order_details, update_bill_status, get_order_line_items
 import logging
 
 logger = logging.getLogger(__name__)
 
-def check_arthrogram(bill_id: str, order_id: str) -> bool:
+ARTHROGRAM_CPTS = frozenset({'20610', '20611', '77002', '77003', '77021'})
+
+
+def is_arthrogram_order(order: Dict, order_items: List[Dict]) -> bool:
+    """
+    Check an already-loaded order for an arthrogram bundle or arthrogram CPT codes.
+    
+    Same rules as check_arthrogram(), without logging or database access.
+    """
+    bundle_type = order.get('bundle_type', '') or ''
+    if bundle_type.lower() == 'arthrogram':
+        return True
+    return any(item.get('CPT', '').strip() in ARTHROGRAM_CPTS for item in order_items)
+
+
+def check_arthrogram(
+    bill_id: str,
+    order_id: str,
+    order: Optional[Dict] = None,
+    order_items: Optional[List[Dict]] = None
+) -> bool:
     """
     Check if this bill is for an arthrogram procedure.
     
     Args:
         bill_id: The provider bill ID
         order_id: The order ID
+        order: Already-loaded order record; fetched from the DB if omitted
+        order_items: Already-loaded order line items; fetched from the DB if omitted
         
     Returns:
         bool: True if this is an arthrogram, False otherwise
@@ -20,7 +42,8 @@ def check_arthrogram(bill_id: str, order_id: str) -> bool:
     logger.info(f"Checking if bill {bill_id} is for an arthrogram")
     
     # Get order details
-    order = get_order_details(order_id)
+    if order is None:
+        order = get_order_details(order_id)
     if not order:
         logger.warning(f"Order {order_id} not found")
         return False
@@ -32,12 +55,10 @@ def check_arthrogram(bill_id: str, order_id: str) -> bool:
         return True
         
     # Check line items for arthrogram CPT codes
-    line_items = get_order_line_items(order_id)
-    arthrogram_cpts = {'20610', '20611', '77002', '77003', '77021'}
-    
+    line_items = order_items if order_items is not None else get_order_line_items(order_id)
     for item in line_items:
         cpt = item.get('CPT', '').strip()
-        if cpt in arthrogram_cpts:
+        if cpt in ARTHROGRAM_CPTS:
             logger.info(f"Bill {bill_id} contains arthrogram CPT code {cpt}")
             return True
             
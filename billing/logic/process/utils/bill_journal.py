@@ -0,0 +1,134 @@
+# billing/logic/process/utils/bill_journal.py
+
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BILL_JOURNAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS bill_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bill_id TEXT NOT NULL,
+        old_status TEXT,
+        new_status TEXT,
+        changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bill_events_status ON bill_events(new_status, id)",
+    """
+    CREATE TABLE IF NOT EXISTS bill_event_checkpoints (
+        consumer TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS provider_bill_status_insert AFTER INSERT ON ProviderBill
+    BEGIN
+        INSERT INTO bill_events (bill_id, old_status, new_status) VALUES (NEW.id, NULL, NEW.status);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS provider_bill_status_update AFTER UPDATE OF status ON ProviderBill
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO bill_events (bill_id, old_status, new_status) VALUES (NEW.id, OLD.status, NEW.status);
+    END
+    """,
+]
+
+# Checkpoint names used by the pipeline stages
+PROCESS_CONSUMER = 'process'
+POSTPROCESS_CONSUMER = 'postprocess'
+
+
+def ensure_bill_journal(conn: sqlite3.Connection) -> None:
+    """
+    Create the bill_events journal and its triggers if they are missing.
+
+    When the journal is first created it is seeded with one event per
+    existing bill, so the first incremental run sees every bill once.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bill_events'"
+    ).fetchone()
+
+    for statement in BILL_JOURNAL_SCHEMA:
+        conn.execute(statement)
+
+    if not exists:
+        conn.execute("""
+            INSERT INTO bill_events (bill_id, old_status, new_status)
+            SELECT id, NULL, status FROM ProviderBill ORDER BY created_at
+        """)
+        logger.info("Created bill_events journal and seeded it with existing bills")
+
+
+def get_checkpoint(conn: sqlite3.Connection, consumer: str) -> int:
+    """Get the last bill_events id a consumer has fully handled."""
+    row = conn.execute(
+        "SELECT last_event_id FROM bill_event_checkpoints WHERE consumer = ?", (consumer,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def advance_checkpoint(conn: sqlite3.Connection, consumer: str, event_id: int) -> None:
+    """
+    Move a consumer's high-water mark forward to event_id.
+
+    Call this inside the same transaction as the writes for those bills so a
+    crash resumes exactly after the last committed chunk.
+    """
+    conn.execute("""
+        INSERT INTO bill_event_checkpoints (consumer, last_event_id, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(consumer) DO UPDATE SET
+            last_event_id = MAX(last_event_id, excluded.last_event_id),
+            updated_at = excluded.updated_at
+    """, (consumer, event_id))
+
+
+def load_changed_bills(
+    conn: sqlite3.Connection,
+    consumer: str,
+    status: str,
+    limit: Optional[int] = None
+) -> List[Dict]:
+    """
+    Load bills that moved into status since the consumer's checkpoint.
+
+    Only bills still in that status are returned, oldest change first. Each
+    bill carries a journal_event_id to pass to advance_checkpoint() once it
+    has been handled.
+
+    Args:
+        conn: Database connection
+        consumer: Checkpoint name, e.g. PROCESS_CONSUMER
+        status: Status the bills must have moved into, e.g. 'MAPPED'
+        limit: Optional maximum number of bills to load
+
+    Returns:
+        List of ProviderBill dictionaries
+    """
+    ensure_bill_journal(conn)
+    checkpoint = get_checkpoint(conn, consumer)
+
+    query = """
+        SELECT pb.*, MAX(e.id) AS journal_event_id
+        FROM bill_events e
+        JOIN ProviderBill pb ON pb.id = e.bill_id
+        WHERE e.new_status = ? AND e.id > ? AND pb.status = ?
+        GROUP BY pb.id
+        ORDER BY journal_event_id
+    """
+    if limit:
+        query += f" LIMIT {limit}"
+
+    cursor = conn.execute(query, (status, checkpoint, status))
+    columns = [column[0] for column in cursor.description]
+    bills = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    logger.info(f"Loaded {len(bills)} {status} bills changed since event {checkpoint} for {consumer}")
+    return bills
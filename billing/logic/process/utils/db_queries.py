@@ -1,20 +1,158 @@
 # billing/logic/process/utils/db_utils.py
 
 import sqlite3
-from typing import Dict, List, Tuple, Optional, Any, Set
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, Any, Set, Iterator
 import logging
+from .rate_cache import ensure_ppo_tin_key, ppo_rate_cache_enabled, get_cached_ppo_rate
+from .reference_cache import get_cpt_category_map
+from .metrics import timed_query, trace_statement
+
+# Connection shared by every helper while a unit_of_work() is active
+_unit_of_work = threading.local()
 
 
 def get_db_connection(db_path: str = "monolith.db") -> sqlite3.Connection:
     """Get a connection to the SQLite database."""
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row  # Return results as dictionaries
+    conn.set_trace_callback(trace_statement)
     return conn
 
 
+def acquire_connection() -> sqlite3.Connection:
+    """Get the active unit-of-work connection, or a new one if none is active."""
+    conn = getattr(_unit_of_work, 'conn', None)
+    return conn if conn is not None else get_db_connection()
+
+
+def release_connection(conn: sqlite3.Connection) -> None:
+    """Commit and close a connection from acquire_connection() unless it belongs to a unit of work."""
+    if conn is getattr(_unit_of_work, 'conn', None):
+        return
+    conn.commit()
+    conn.close()
+
+
+@contextmanager
+def unit_of_work(db_path: str = "monolith.db", commit: bool = True) -> Iterator[sqlite3.Connection]:
+    """
+    Run every helper in this module on one shared connection and commit once.
+    
+    The database is switched to WAL so readers are not blocked while the
+    transaction is open. Everything is rolled back if the block raises, or
+    always when commit is False. Nested calls reuse the outer unit of work
+    (and its commit setting).
+    
+    Usage:
+        with unit_of_work():
+            for bill_id in chunk:
+                process_bill(bill_id)
+    """
+    if getattr(_unit_of_work, 'conn', None) is not None:
+        yield _unit_of_work.conn
+        return
+        
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.set_trace_callback(trace_statement)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("BEGIN")
+    _unit_of_work.conn = conn
+    
+    try:
+        yield conn
+        conn.execute("COMMIT" if commit else "ROLLBACK")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        _unit_of_work.conn = None
+        conn.close()
+
+
+@contextmanager
+def savepoint(name: str = "bill") -> Iterator[None]:
+    """
+    Scope a group of writes inside the active unit of work.
+    
+    If the block raises, only its own writes are rolled back (or dropped from
+    the capture_writes() buffer) and the rest of the unit of work is kept.
+    Without an active unit of work this is a no-op.
+    """
+    conn = getattr(_unit_of_work, 'conn', None)
+    writes = getattr(_unit_of_work, 'writes', None)
+    mark = len(writes) if writes is not None else 0
+    
+    if conn is not None:
+        conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except BaseException:
+        if conn is not None:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+        if writes is not None:
+            del writes[mark:]
+        raise
+    if conn is not None:
+        conn.execute(f"RELEASE {name}")
+
+
+@contextmanager
+def capture_writes() -> Iterator[List[Tuple[str, Any, bool]]]:
+    """
+    Queue writes made through execute_write() instead of running them.
+    
+    Used by parallel workers, which only read; the queued (sql, params, many)
+    statements are applied later by a single writer with apply_writes().
+    """
+    previous = getattr(_unit_of_work, 'writes', None)
+    _unit_of_work.writes = []
+    try:
+        yield _unit_of_work.writes
+    finally:
+        _unit_of_work.writes = previous
+
+
+def execute_write(sql: str, params: Any, many: bool = False) -> int:
+    """
+    Run a write statement, or queue it if capture_writes() is active.
+    
+    Returns:
+        Number of rows affected; queued writes report one row per parameter set
+    """
+    writes = getattr(_unit_of_work, 'writes', None)
+    if writes is not None:
+        writes.append((sql, params, many))
+        return len(params) if many else 1
+        
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    
+    if many:
+        cursor.executemany(sql, params)
+    else:
+        cursor.execute(sql, params)
+    
+    updated = cursor.rowcount
+    release_connection(conn)
+    return updated
+
+
+def apply_writes(writes: List[Tuple[str, Any, bool]]) -> None:
+    """Run writes queued by capture_writes(), in order."""
+    for sql, params, many in writes:
+        execute_write(sql, params, many)
+
+
+@timed_query
 def get_mapped_bills(limit: Optional[int] = None) -> List[Dict]:
     """Get all provider bills with MAPPED status."""
-    conn = get_db_connection()
+    conn = acquire_connection()
     query = """
         SELECT * FROM ProviderBill 
         WHERE status = 'MAPPED'
@@ -27,13 +165,39 @@ def get_mapped_bills(limit: Optional[int] = None) -> List[Dict]:
     cursor = conn.cursor()
     cursor.execute(query)
     bills = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    release_connection(conn)
     return bills
 
 
+@timed_query
+def get_bill_statuses(statuses: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """
+    Get (bill_id, status) for every provider bill, optionally only in some statuses.
+
+    Args:
+        statuses: Statuses to include; all bills if omitted
+
+    Returns:
+        List of (bill_id, status) tuples, oldest bill first
+    """
+    conn = acquire_connection()
+    query = "SELECT id, status FROM ProviderBill"
+    params = []
+
+    if statuses:
+        query += f" WHERE status IN ({', '.join(['?'] * len(statuses))})"
+        params = list(statuses)
+    query += " ORDER BY created_at"
+
+    rows = [(row[0], row[1]) for row in conn.execute(query, params).fetchall()]
+    release_connection(conn)
+    return rows
+
+
+@timed_query
 def get_bill_with_line_items(bill_id: str) -> Tuple[Dict, List[Dict]]:
     """Get a bill with all its line items."""
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     # Get the bill
@@ -48,13 +212,14 @@ def get_bill_with_line_items(bill_id: str) -> Tuple[Dict, List[Dict]]:
     """, (bill_id,))
     line_items = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
+    release_connection(conn)
     return bill, line_items
 
 
+@timed_query
 def get_order_details(order_id: str) -> Dict:
     """Get all details for a specific order."""
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -68,13 +233,14 @@ def get_order_details(order_id: str) -> Dict:
     # Log the provider_id for debugging
     logging.getLogger(__name__).debug(f"Order {order_id} provider_id: {order.get('provider_id')}")
     
-    conn.close()
+    release_connection(conn)
     return order
 
 
+@timed_query
 def get_order_line_items(order_id: str) -> List[Dict]:
     """Get all line items for a specific order."""
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -84,13 +250,14 @@ def get_order_line_items(order_id: str) -> List[Dict]:
     """, (order_id,))
     line_items = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
+    release_connection(conn)
     return line_items
 
 
+@timed_query
 def get_provider_details(provider_id: str) -> Dict:
     """Get provider details using provider_id."""
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -107,47 +274,165 @@ def get_provider_details(provider_id: str) -> Dict:
     row = cursor.fetchone()
     provider = dict(row) if row else {}
     
-    conn.close()
+    release_connection(conn)
     return provider
 
 
-def get_cpt_categories(cpt_codes: List[str]) -> Dict[str, Tuple[str, str]]:
+def _chunks(values: List[Any], size: int = 900) -> List[List[Any]]:
+    """Split values into chunks that stay under SQLite's bound-parameter limit."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+@timed_query
+def get_bills_with_line_items(bill_ids: List[str]) -> Dict[str, Tuple[Dict, List[Dict]]]:
     """
-    Get category and subcategory for multiple CPT codes.
-    Returns a dictionary mapping CPT codes to (category, subcategory) tuples.
+    Get many bills with their line items using set-based queries.
+    Returns a dictionary mapping bill IDs to (bill, line_items) tuples.
+    Bills that do not exist are left out of the result.
     """
-    if not cpt_codes:
+    if not bill_ids:
         return {}
         
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
-    # Create parameter placeholders for SQL query
-    placeholders = ', '.join(['?'] * len(cpt_codes))
+    results = {}
+    for chunk in _chunks(bill_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        
+        cursor.execute(f"SELECT * FROM ProviderBill WHERE id IN ({placeholders})", chunk)
+        for row in cursor.fetchall():
+            results[row['id']] = (dict(row), [])
+        
+        cursor.execute(f"""
+            SELECT * FROM BillLineItem
+            WHERE provider_bill_id IN ({placeholders})
+            ORDER BY provider_bill_id, date_of_service
+        """, chunk)
+        for row in cursor.fetchall():
+            if row['provider_bill_id'] in results:
+                results[row['provider_bill_id']][1].append(dict(row))
     
-    cursor.execute(f"""
-        SELECT proc_cd, category, subcategory
-        FROM dim_proc
-        WHERE proc_cd IN ({placeholders})
-    """, cpt_codes)
+    release_connection(conn)
+    return results
+
+
+@timed_query
+def get_orders_details(order_ids: List[str]) -> Dict[str, Dict]:
+    """Get details for many orders, keyed by Order_ID."""
+    if not order_ids:
+        return {}
+        
+    conn = acquire_connection()
+    cursor = conn.cursor()
     
     results = {}
-    for row in cursor.fetchall():
-        results[row['proc_cd']] = (row['category'], row['subcategory'])
+    for chunk in _chunks(order_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            SELECT o.*, p.PrimaryKey as provider_primary_key
+            FROM orders o
+            LEFT JOIN providers p ON o.provider_id = p.PrimaryKey
+            WHERE o.Order_ID IN ({placeholders})
+        """, chunk)
+        for row in cursor.fetchall():
+            # Keep the first row per order, matching get_order_details
+            results.setdefault(row['Order_ID'], dict(row))
     
-    conn.close()
+    release_connection(conn)
     return results
 
 
+@timed_query
+def get_orders_line_items(order_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Get line items for many orders, keyed by Order_ID."""
+    if not order_ids:
+        return {}
+        
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    
+    results = {order_id: [] for order_id in order_ids}
+    for chunk in _chunks(order_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            SELECT * FROM order_line_items
+            WHERE Order_ID IN ({placeholders})
+            ORDER BY Order_ID, line_number
+        """, chunk)
+        for row in cursor.fetchall():
+            results.setdefault(row['Order_ID'], []).append(dict(row))
+    
+    release_connection(conn)
+    return results
+
+
+@timed_query
+def get_providers_details(provider_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Get provider details for many providers.
+    Returns a dictionary keyed by str(PrimaryKey), since orders.provider_id
+    and providers.PrimaryKey are not guaranteed to share a column type.
+    """
+    if not provider_ids:
+        return {}
+        
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    
+    results = {}
+    for chunk in _chunks(provider_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            SELECT 
+                PrimaryKey,
+                "DBA Name Billing Name", "Billing Name", 
+                "Address Line 1", "Address Line 2", "City", "State", "Postal Code", 
+                "Billing Address 1", "Billing Address 2", "Billing Address City", 
+                "Billing Address State", "Billing Address Postal Code", 
+                "Phone", "Fax Number", "TIN", "NPI", 
+                "Provider Network", "Provider Type", "Provider Status"
+            FROM providers
+            WHERE PrimaryKey IN ({placeholders})
+        """, chunk)
+        for row in cursor.fetchall():
+            provider = dict(row)
+            # Match the column set returned by get_provider_details
+            primary_key = provider.pop('PrimaryKey')
+            results.setdefault(str(primary_key), provider)
+    
+    release_connection(conn)
+    return results
+
+
+@timed_query
+def get_cpt_categories(cpt_codes: List[str]) -> Dict[str, Tuple[str, str]]:
+    """
+    Get category and subcategory for multiple CPT codes.
+    Returns a dictionary mapping CPT codes to (category, subcategory) tuples.
+    Lookups are served from the cached dim_proc map in reference_cache.
+    """
+    if not cpt_codes:
+        return {}
+        
+    conn = acquire_connection()
+    categories = get_cpt_category_map(conn)
+    release_connection(conn)
+    
+    return {cpt: categories[cpt] for cpt in cpt_codes if cpt in categories}
+
+
 def clean_tin(tin: str) -> str:
     """Clean TIN by removing dashes and spaces."""
     return tin.replace('-', '').replace(' ', '').strip()
 
 
+@timed_query
 def get_in_network_rate(tin: str, cpt_code: str, modifier: Optional[str] = None) -> Optional[float]:
     """Get in-network rate for a specific provider and CPT code."""
     logger = logging.getLogger(__name__)
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     # Clean the TIN
@@ -157,29 +442,37 @@ def get_in_network_rate(tin: str, cpt_code: str, modifier: Optional[str] = None)
     effective_modifier = modifier if modifier in ['TC', '26'] else None
     logger.info(f"Looking up in-network rate for TIN {clean_tin_value}, CPT {cpt_code}, modifier {effective_modifier}")
     
-    if effective_modifier:
-        # If we have a TC or 26 modifier, only look for that specific rate
-        cursor.execute("""
-            SELECT rate
-            FROM ppo
-            WHERE REPLACE(REPLACE(TIN, '-', ''), ' ', '') = ? 
-            AND proc_cd = ? 
-            AND modifier = ?
-            LIMIT 1
-        """, (clean_tin_value, cpt_code, effective_modifier))
-    else:
-        # If no modifier or not TC/26, look for rate without modifier
-        cursor.execute("""
-            SELECT rate
-            FROM ppo
-            WHERE REPLACE(REPLACE(TIN, '-', ''), ' ', '') = ? 
-            AND proc_cd = ? 
-            AND (modifier IS NULL OR modifier = '')
-            LIMIT 1
-        """, (clean_tin_value, cpt_code))
+    ensure_ppo_tin_key(conn)
     
-    row = cursor.fetchone()
-    rate = float(row['rate']) if row and row['rate'] else None
+    if ppo_rate_cache_enabled():
+        # O(1) lookup in the process-wide rate table
+        rate = get_cached_ppo_rate(conn, clean_tin_value, cpt_code, effective_modifier)
+    else:
+        if effective_modifier:
+            # If we have a TC or 26 modifier, only look for that specific rate
+            cursor.execute("""
+                SELECT rate
+                FROM ppo
+                WHERE tin_clean = ? 
+                AND proc_cd = ? 
+                AND modifier = ?
+                ORDER BY rowid
+                LIMIT 1
+            """, (clean_tin_value, cpt_code, effective_modifier))
+        else:
+            # If no modifier or not TC/26, look for rate without modifier
+            cursor.execute("""
+                SELECT rate
+                FROM ppo
+                WHERE tin_clean = ? 
+                AND proc_cd = ? 
+                AND (modifier IS NULL OR modifier = '')
+                ORDER BY rowid
+                LIMIT 1
+            """, (clean_tin_value, cpt_code))
+        
+        row = cursor.fetchone()
+        rate = float(row['rate']) if row and row['rate'] else None
     
     if rate:
         logger.info(f"Found in-network rate {rate} for CPT {cpt_code}" + 
@@ -188,14 +481,15 @@ def get_in_network_rate(tin: str, cpt_code: str, modifier: Optional[str] = None)
         logger.warning(f"No in-network rate found for CPT {cpt_code}" + 
                       (f" with modifier {effective_modifier}" if effective_modifier else ""))
     
-    conn.close()
+    release_connection(conn)
     return rate
 
 
+@timed_query
 def get_out_of_network_rate(order_id: str, cpt_code: str, modifier: Optional[str] = None) -> Optional[float]:
     """Get out-of-network rate for a specific order and CPT code."""
     logger = logging.getLogger(__name__)
-    conn = get_db_connection()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     # Only include modifier if it's TC or 26
@@ -233,40 +527,104 @@ def get_out_of_network_rate(order_id: str, cpt_code: str, modifier: Optional[str
         logger.warning(f"No out-of-network rate found for CPT {cpt_code}" + 
                       (f" with modifier {effective_modifier}" if effective_modifier else ""))
     
-    conn.close()
+    release_connection(conn)
     return rate
 
 
-def update_bill_status(bill_id: str, status: str, action: str, error: Optional[str] = None) -> bool:
-    """Update the status, action, and error message of a provider bill."""
-    conn = get_db_connection()
+@timed_query
+def get_ppo_rates_for_tins(tins: List[str]) -> List[Dict]:
+    """
+    Get every PPO rate row for a set of cleaned TINs, in table order.
+    Used by the batch rate resolver to join rates in memory.
+    """
+    if not tins:
+        return []
+        
+    conn = acquire_connection()
     cursor = conn.cursor()
+    ensure_ppo_tin_key(conn)
     
-    cursor.execute("""
+    rows = []
+    for chunk in _chunks(tins):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            SELECT tin_clean, proc_cd, COALESCE(modifier, '') AS modifier, rate
+            FROM ppo
+            WHERE tin_clean IN ({placeholders})
+            ORDER BY rowid
+        """, chunk)
+        rows.extend(dict(row) for row in cursor.fetchall())
+    
+    release_connection(conn)
+    return rows
+
+
+@timed_query
+def get_ota_rates_for_orders(order_ids: List[str]) -> List[Dict]:
+    """
+    Get every OTA rate row for a set of orders, in table order.
+    Used by the batch rate resolver to join rates in memory.
+    """
+    if not order_ids:
+        return []
+        
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    
+    rows = []
+    for chunk in _chunks(order_ids):
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            SELECT ID_Order_PrimaryKey AS order_id, CPT AS cpt, COALESCE(modifier, '') AS modifier, rate
+            FROM ota
+            WHERE ID_Order_PrimaryKey IN ({placeholders})
+            ORDER BY rowid
+        """, chunk)
+        rows.extend(dict(row) for row in cursor.fetchall())
+    
+    release_connection(conn)
+    return rows
+
+
+@timed_query
+def update_bill_status(bill_id: str, status: str, action: str, error: Optional[str] = None) -> bool:
+    """Update the status, action, and error message of a provider bill."""
+    updated = execute_write("""
         UPDATE ProviderBill
         SET status = ?, action = ?, last_error = ?
         WHERE id = ?
     """, (status, action, error, bill_id))
-    
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    return updated > 0
 
 
+@timed_query
 def update_line_item(line_id: int, decision: str, allowed_amount: Optional[float] = None, 
                      reason_code: Optional[str] = None) -> bool:
     """Update a bill line item with decision and allowed amount."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    updated = execute_write("""
         UPDATE BillLineItem
         SET decision = ?, allowed_amount = ?, reason_code = ?
         WHERE id = ?
     """, (decision, allowed_amount, reason_code, line_id))
+    return updated > 0
+
+
+@timed_query
+def update_line_items(updates: List[Tuple[str, Optional[float], Optional[str], int]]) -> int:
+    """
+    Update decision, allowed amount and reason code for many line items in one executemany.
     
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
\ No newline at end of file
+    Args:
+        updates: (decision, allowed_amount, reason_code, line_id) tuples
+        
+    Returns:
+        Number of rows updated
+    """
+    if not updates:
+        return 0
+        
+    return execute_write("""
+        UPDATE BillLineItem
+        SET decision = ?, allowed_amount = ?, reason_code = ?
+        WHERE id = ?
+    """, updates, many=True)
@@ -1,5 +1,5 @@
 from typing import List
-from .db_queries import get_db_connection
+from .db_queries import execute_write
 
 def update_order_line_items_reviewed(order_id: str, bill_id: str, cpt_codes: List[str]) -> bool:
     """
@@ -13,19 +13,12 @@ def update_order_line_items_reviewed(order_id: str, bill_id: str, cpt_codes: Lis
     Returns:
         bool: True if update was successful
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Create parameter placeholders for SQL query
     placeholders = ', '.join(['?'] * len(cpt_codes))
     
-    cursor.execute(f"""
+    updated = execute_write(f"""
         UPDATE order_line_items
         SET BILL_REVIEWED = ?
         WHERE Order_ID = ? AND CPT IN ({placeholders})
     """, [bill_id, order_id] + cpt_codes)
-    
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success 
\ No newline at end of file
+    return updated > 0 
\ No newline at end of file
@@ -2,7 +2,11 @@
 
 from typing import List, Dict, Optional, Tuple
 import logging
-from .db_queries import get_db_connection, get_bill_with_line_items, get_order_details, get_order_line_items, get_provider_details
+from .db_queries import (
+    acquire_connection, release_connection, get_bill_with_line_items, get_order_details, get_order_line_items, get_provider_details,
+    get_bills_with_line_items, get_orders_details, get_orders_line_items, get_providers_details
+)
+from .bill_journal import load_changed_bills, PROCESS_CONSUMER
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +20,7 @@ def load_mapped_bills(limit: Optional[int] = None) -> List[Dict]:
     Returns:
         List of bill dictionaries
     """
-    conn = get_db_connection()
+    conn = acquire_connection()
     query = """
         SELECT * FROM ProviderBill 
         WHERE status = 'MAPPED'
@@ -29,12 +33,31 @@ def load_mapped_bills(limit: Optional[int] = None) -> List[Dict]:
     cursor = conn.cursor()
     cursor.execute(query)
     bills = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    release_connection(conn)
     
     logger.info(f"Loaded {len(bills)} MAPPED bills")
     return bills
 
 
+def load_changed_mapped_bills(limit: Optional[int] = None, consumer: str = PROCESS_CONSUMER) -> List[Dict]:
+    """
+    Load MAPPED bills whose status changed since the consumer's last checkpoint.
+    
+    Uses the bill_events journal instead of scanning all of ProviderBill.
+    
+    Args:
+        limit: Optional maximum number of bills to load
+        consumer: Checkpoint name in bill_event_checkpoints
+        
+    Returns:
+        List of bill dictionaries, each with a journal_event_id
+    """
+    conn = acquire_connection()
+    bills = load_changed_bills(conn, consumer, 'MAPPED', limit)
+    release_connection(conn)
+    return bills
+
+
 def load_bill_data(bill_id: str) -> Tuple[Dict, List[Dict], Dict, List[Dict], Optional[Dict]]:
     """
     Load all data needed to process a bill: bill, line items, order, order line items, provider.
@@ -85,4 +108,63 @@ def load_bill_data(bill_id: str) -> Tuple[Dict, List[Dict], Dict, List[Dict], Op
     else:
         logger.warning(f"Bill {bill_id} has no claim_id, skipping order data")
     
-    return bill, bill_items, order, order_items, provider
\ No newline at end of file
+    return bill, bill_items, order, order_items, provider
+
+
+def load_bills_batch(bill_ids: List[str]) -> Dict[str, Tuple[Dict, List[Dict], Dict, List[Dict], Optional[Dict]]]:
+    """
+    Load processing data for a whole chunk of bills with a handful of set-based queries.
+    
+    Each value has the same shape as load_bill_data() so process_bill can run
+    from memory instead of opening connections per bill.
+    
+    Args:
+        bill_ids: IDs of the provider bills to load
+        
+    Returns:
+        Dict mapping bill_id to (bill, bill_items, order, order_items, provider).
+        Bills that do not exist map to ({}, [], {}, [], None).
+    """
+    logger.debug(f"Batch loading data for {len(bill_ids)} bills")
+    
+    bills = get_bills_with_line_items(bill_ids)
+    
+    order_ids = sorted({bill['claim_id'] for bill, _ in bills.values() if bill.get('claim_id')})
+    orders = get_orders_details(order_ids)
+    order_items = get_orders_line_items(list(orders.keys()))
+    
+    provider_ids = sorted({str(order['provider_id']) for order in orders.values() if order.get('provider_id')})
+    providers = get_providers_details(provider_ids)
+    
+    results = {}
+    for bill_id in bill_ids:
+        if bill_id not in bills:
+            results[bill_id] = ({}, [], {}, [], None)
+            continue
+            
+        bill, bill_items = bills[bill_id]
+        order = {}
+        items = []
+        provider = None
+        
+        if bill.get('claim_id'):
+            order_id = bill['claim_id']
+            order = orders.get(order_id, {})
+            
+            if order:
+                items = order_items.get(order_id, [])
+                if order.get('provider_id'):
+                    provider = providers.get(str(order['provider_id']), {})
+                    if not provider:
+                        logger.warning(f"Provider details not found for provider_id: {order['provider_id']}")
+                else:
+                    logger.warning(f"Order {order_id} has no provider_id")
+            else:
+                logger.error(f"Error loading order data: order {order_id} not found")
+        else:
+            logger.warning(f"Bill {bill_id} has no claim_id, skipping order data")
+            
+        results[bill_id] = (bill, bill_items, order, items, provider)
+    
+    logger.info(f"Batch loaded {len(bills)} bills, {len(orders)} orders, {len(providers)} providers")
+    return results
@@ -0,0 +1,148 @@
+# billing/logic/process/utils/metrics.py
+
+import json
+import math
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Per-stage samples for the current run: name -> list of (seconds, queries, rows)
+_samples: Dict[str, List[List[float]]] = {}
+
+# SQL statements executed by connections that have trace_statement installed
+_statement_count = 0
+
+
+def trace_statement(statement: str) -> None:
+    """sqlite3 trace callback counting every statement a connection runs."""
+    global _statement_count
+    _statement_count += 1
+
+
+def statement_count() -> int:
+    """Get the number of statements traced so far in this process."""
+    return _statement_count
+
+
+def record(name: str, seconds: float, queries: int = 0, rows: int = 0) -> None:
+    """Add one sample to a stage."""
+    _samples.setdefault(name, []).append([seconds, queries, rows])
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block and count the statements it runs as one sample of a stage.
+
+    Usage:
+        with stage('load'):
+            bill_data = load_bill_data(bill_id)
+    """
+    start = time.perf_counter()
+    statements = _statement_count
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, _statement_count - statements)
+
+
+def _rows_touched(result: Any) -> int:
+    """Rows read or written by a DB helper, judged from its return value."""
+    if isinstance(result, int):
+        return int(result)
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 1 if result else 0
+
+
+def timed_query(func: Callable) -> Callable:
+    """Record each call of a DB helper as a sample of the db.<name> stage."""
+    name = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        statements = _statement_count
+        result = func(*args, **kwargs)
+        record(name, time.perf_counter() - start, _statement_count - statements, _rows_touched(result))
+        return result
+
+    return wrapper
+
+
+def metrics_snapshot() -> Dict[str, List[List[float]]]:
+    """Get the raw samples, e.g. to send from a pool worker to merge_metrics()."""
+    return {name: [list(sample) for sample in samples] for name, samples in _samples.items()}
+
+
+def merge_metrics(snapshot: Dict[str, List[List[float]]]) -> None:
+    """Add samples collected in another process."""
+    for name, samples in snapshot.items():
+        _samples.setdefault(name, []).extend(samples)
+
+
+def reset_metrics() -> None:
+    """Drop all samples, e.g. at the start of a run."""
+    _samples.clear()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[index]
+
+
+def metrics_summary() -> Dict[str, Dict]:
+    """
+    Summarize the samples per stage.
+
+    Returns:
+        Dict mapping stage name to calls, total seconds, p50/p95/max seconds,
+        and total queries and rows touched
+    """
+    summary = {}
+    for name, samples in sorted(_samples.items()):
+        seconds = sorted(sample[0] for sample in samples)
+        summary[name] = {
+            'calls': len(samples),
+            'total_seconds': round(sum(seconds), 6),
+            'p50': round(_percentile(seconds, 50), 6),
+            'p95': round(_percentile(seconds, 95), 6),
+            'max': round(seconds[-1], 6),
+            'queries': int(sum(sample[1] for sample in samples)),
+            'rows': int(sum(sample[2] for sample in samples)),
+        }
+    return summary
+
+
+def write_metrics_report(log_dir: Path, results: Dict, started_at: datetime) -> Path:
+    """
+    Append this run's stage summary as one JSON line next to the daily process log.
+
+    Args:
+        log_dir: Directory holding process_YYYYMMDD.log
+        results: The run_processing summary dict
+        started_at: When the run started
+
+    Returns:
+        Path of the process_YYYYMMDD_metrics.jsonl file
+    """
+    path = Path(log_dir) / f"process_{started_at.strftime('%Y%m%d')}_metrics.jsonl"
+    report = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'elapsed_seconds': round((datetime.now() - started_at).total_seconds(), 3),
+        'results': results,
+        'stages': metrics_summary(),
+    }
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(report) + "\n")
+
+    logger.info(f"Wrote stage metrics to {path}")
+    return path
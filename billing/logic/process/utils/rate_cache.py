@@ -0,0 +1,197 @@
+# billing/logic/process/utils/rate_cache.py
+
+import sqlite3
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SQL expression matching db_queries.clean_tin()
+TIN_CLEAN_SQL = "REPLACE(REPLACE(TIN, '-', ''), ' ', '')"
+
+PPO_TIN_KEY_SCHEMA = [
+    f"UPDATE ppo SET tin_clean = {TIN_CLEAN_SQL} WHERE tin_clean IS NULL AND TIN IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_ppo_tin_proc_mod ON ppo(tin_clean, proc_cd, modifier)",
+    """
+    CREATE TABLE IF NOT EXISTS ref_data_version (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO ref_data_version (table_name, version) VALUES ('ppo', 0)",
+    # Keep tin_clean populated for rows written outside this module (e.g. the webapp's add_ppo_rate)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ppo_tin_clean_insert AFTER INSERT ON ppo
+    BEGIN
+        UPDATE ppo SET tin_clean = {TIN_CLEAN_SQL.replace('TIN', 'NEW.TIN')} WHERE rowid = NEW.rowid;
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'ppo';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ppo_tin_clean_update AFTER UPDATE OF TIN ON ppo
+    BEGIN
+        UPDATE ppo SET tin_clean = {TIN_CLEAN_SQL.replace('TIN', 'NEW.TIN')} WHERE rowid = NEW.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ppo_version_update AFTER UPDATE OF TIN, proc_cd, modifier, rate ON ppo
+    BEGIN
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'ppo';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ppo_version_delete AFTER DELETE ON ppo
+    BEGIN
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'ppo';
+    END
+    """,
+]
+
+PPO_TRIGGERS = ('ppo_tin_clean_insert', 'ppo_tin_clean_update', 'ppo_version_update', 'ppo_version_delete')
+
+# Databases whose ppo table already has the tin_clean key
+_schema_ready = set()
+
+# Process-wide PPO rate table keyed by (tin_clean, proc_cd, modifier)
+_ppo_rates: Optional[Dict[Tuple[str, str, str], Optional[float]]] = None
+_ppo_version: Optional[int] = None
+_enabled = False
+
+
+def ensure_ppo_tin_key(conn: sqlite3.Connection) -> None:
+    """
+    Add the normalized, indexed tin_clean column to ppo if it is missing.
+
+    Runs once per database per process; later calls are free.
+    """
+    db_key = _database_key(conn)
+    if db_key in _schema_ready:
+        return
+
+    # Already installed, e.g. by the process that fanned out work: stay read-only
+    # so concurrent readers never need the write lock
+    if _count_triggers(conn, PPO_TRIGGERS) == len(PPO_TRIGGERS):
+        _schema_ready.add(db_key)
+        return
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(ppo)").fetchall()]
+    if 'tin_clean' not in columns:
+        logger.info("Adding normalized tin_clean column to ppo")
+        conn.execute("ALTER TABLE ppo ADD COLUMN tin_clean TEXT")
+
+    for statement in PPO_TIN_KEY_SCHEMA:
+        conn.execute(statement)
+
+    _schema_ready.add(db_key)
+
+
+def forget_ppo_tin_key() -> None:
+    """Forget which databases have the tin_clean key, e.g. after its install was rolled back."""
+    _schema_ready.clear()
+    invalidate_ppo_rates()
+
+
+def enable_ppo_rate_cache(enabled: bool = True) -> None:
+    """Turn the process-wide PPO rate cache on or off."""
+    global _enabled
+    _enabled = enabled
+    if not enabled:
+        invalidate_ppo_rates()
+
+
+def ppo_rate_cache_enabled() -> bool:
+    """Return True if in-network rate lookups should use the in-memory table."""
+    return _enabled
+
+
+def invalidate_ppo_rates() -> None:
+    """Drop the in-memory PPO rate table so the next lookup reloads it."""
+    global _ppo_rates, _ppo_version
+    _ppo_rates = None
+    _ppo_version = None
+
+
+def refresh_ppo_rates_if_stale(conn: sqlite3.Connection) -> None:
+    """
+    Reload the PPO rate table if ppo changed since it was loaded.
+
+    Writes to ppo from any process bump ref_data_version through triggers,
+    so this is a single primary-key lookup when nothing changed.
+    """
+    if _ppo_rates is None:
+        return
+    if _current_version(conn) != _ppo_version:
+        logger.info("PPO rates changed, invalidating rate cache")
+        invalidate_ppo_rates()
+
+
+def get_cached_ppo_rate(
+    conn: sqlite3.Connection,
+    tin_clean: str,
+    cpt_code: str,
+    modifier: Optional[str]
+) -> Optional[float]:
+    """
+    Look up an in-network rate from the in-memory PPO table.
+
+    Args:
+        conn: Connection used to load the table on first use
+        tin_clean: TIN with dashes and spaces removed
+        cpt_code: CPT code
+        modifier: 'TC', '26' or None for the unmodified rate
+
+    Returns:
+        The rate, or None if there is no usable rate
+    """
+    if _ppo_rates is None:
+        _load_ppo_rates(conn)
+    return _ppo_rates.get((tin_clean, cpt_code, modifier or ''))
+
+
+def _load_ppo_rates(conn: sqlite3.Connection) -> None:
+    """Load the whole ppo table into memory."""
+    global _ppo_rates, _ppo_version
+    ensure_ppo_tin_key(conn)
+
+    rates = {}
+    cursor = conn.execute("""
+        SELECT tin_clean, proc_cd, modifier, rate
+        FROM ppo
+        ORDER BY rowid
+    """)
+    for tin_clean, proc_cd, modifier, rate in cursor:
+        key = (tin_clean, proc_cd, modifier or '')
+        if key in rates:
+            continue
+        # First row wins, as with the LIMIT 1 lookup; an empty rate means no rate
+        try:
+            rates[key] = float(rate) if rate else None
+        except (TypeError, ValueError):
+            # One bad row must not take every in-network lookup down with it
+            logger.warning(f"Ignoring non-numeric PPO rate {rate!r} for TIN {tin_clean}, CPT {proc_cd}, modifier {modifier}")
+            rates[key] = None
+
+    _ppo_rates = rates
+    _ppo_version = _current_version(conn)
+    logger.info(f"Loaded {len(rates)} PPO rates into cache")
+
+
+def _current_version(conn: sqlite3.Connection) -> Optional[int]:
+    """Get the ppo version counter maintained by the triggers."""
+    row = conn.execute("SELECT version FROM ref_data_version WHERE table_name = 'ppo'").fetchone()
+    return row[0] if row else None
+
+
+def _count_triggers(conn: sqlite3.Connection, names: Tuple[str, ...]) -> int:
+    """Count how many of the named triggers exist."""
+    placeholders = ', '.join(['?'] * len(names))
+    row = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", names
+    ).fetchone()
+    return row[0]
+
+
+def _database_key(conn: sqlite3.Connection) -> str:
+    """Identify the database file behind a connection."""
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ''
@@ -1,10 +1,12 @@
 from typing import Dict, List, Optional, Tuple
 import logging
+import numpy as np
+import pandas as pd
 from .db_queries import (
     get_in_network_rate,
     get_out_of_network_rate,
-    update_line_item,
-    update_bill_status
+    get_ppo_rates_for_tins,
+    get_ota_rates_for_orders
 )
 from .validation import load_ancillary_codes
 
@@ -68,84 +70,162 @@ def validate_line_item_rate(
         
     return True, rate, None
 
-def validate_bill_rates(
-    bill_id: str,
-    bill_items: List[Dict],
-    provider: Dict,
-    order_id: str
-) -> Dict:
+
+def _rate_value(raw) -> Tuple[Optional[float], bool]:
+    """
+    (rate, readable) for a raw ppo/ota rate, read the way the single-line lookups do.
+
+    An empty, NULL or numeric zero rate means no rate; a text '0' is a $0 rate.
+    A value float() rejects is unreadable: the single-line lookup raises on it.
+    """
+    try:
+        return (float(raw) if raw else None), True
+    except (TypeError, ValueError):
+        return None, False
+
+
+def _read_rates(rates: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Replace the raw rate column with the converted rate and a <column>_unreadable flag."""
+    values = [_rate_value(raw) for raw in rates['rate']]
+    rates[column] = pd.Series([rate for rate, _ in values], index=rates.index, dtype=float)
+    rates[f'{column}_unreadable'] = [not readable for _, readable in values]
+    return rates.drop(columns=['rate'])
+
+
+def resolve_rates_batch(line_items: pd.DataFrame) -> pd.DataFrame:
     """
-    Validate rates for all line items in a bill.
+    Resolve allowed amounts for many line items at once.
+    
+    Applies the same rules as validate_line_item_rate, but joins the whole
+    frame once against ppo (cleaned TIN, CPT, modifier) and once against ota
+    (order, CPT, modifier) instead of querying per line.
     
     Args:
-        bill_id: The provider bill ID
-        bill_items: List of bill line items
-        provider: The provider record
-        order_id: The order ID
+        line_items: One row per line item with columns cpt_code, modifier,
+            network_status, tin and order_id
         
     Returns:
-        Dict containing validation results:
-        - is_valid: Whether all line items were validated successfully
-        - line_items: List of validation results for each line item
-        - error: Error message if validation failed
+        Copy of the frame with added columns:
+        - success: Whether a rate was resolved
+        - rate: The allowed amount (None if validation failed)
+        - reason: Reason code if validation failed (None on success)
+        - unreadable_rate: The line's rate row holds a value float() rejects;
+          validate_line_item_rate raises for these, so callers should rate
+          them one by one rather than trust success/reason
     """
-    results = {
-        'is_valid': True,
-        'line_items': [],
-        'error': None
-    }
+    df = line_items.copy()
+    for column in ['cpt_code', 'modifier', 'network_status', 'tin', 'order_id']:
+        df[column] = df[column].fillna('').astype(str).str.strip()
     
-    for item in bill_items:
-        success, rate, reason = validate_line_item_rate(
-            bill_id=bill_id,
-            line_item=item,
-            provider=provider,
-            order_id=order_id
-        )
-        
-        line_result = {
-            'line_id': item['id'],
-            'cpt_code': item.get('cpt_code', ''),
-            'success': success,
-            'rate': rate,
-            'reason': reason
-        }
-        results['line_items'].append(line_result)
-        
-        if not success:
-            results['is_valid'] = False
-            results['error'] = f"Rate validation failed for CPT {item.get('cpt_code', '')}: {reason}"
-            
-            # Update line item with failure
-            update_line_item(
-                line_id=item['id'],
-                decision='REJECTED',
-                allowed_amount=None,
-                reason_code=reason
-            )
-        else:
-            # Update line item with success
-            update_line_item(
-                line_id=item['id'],
-                decision='APPROVED',
-                allowed_amount=rate,
-                reason_code=None
-            )
+    # Only TC and 26 select a modifier-specific rate; everything else uses the unmodified rate
+    df['effective_modifier'] = df['modifier'].where(df['modifier'].isin(['TC', '26']), '')
+    df['tin_clean'] = df['tin'].str.replace('-', '', regex=False).str.replace(' ', '', regex=False)
     
-    # Update bill status based on validation results
-    if results['is_valid']:
-        update_bill_status(
-            bill_id=bill_id,
-            status='REVIEWED',
-            action='apply_rate',
-            error=None
-        )
-    else:
-        update_bill_status(
-            bill_id=bill_id,
-            status='FLAGGED',
-            action='review_rates',
-            error=results['error']
-        )
+    in_network = df['network_status'] == 'In Network'
+    out_network = df['network_status'] == 'Out of Network'
+    
+    # First matching row wins, as with the LIMIT 1 lookups
+    ppo = pd.DataFrame(
+        get_ppo_rates_for_tins(sorted(df.loc[in_network, 'tin_clean'].unique())),
+        columns=['tin_clean', 'proc_cd', 'modifier', 'rate']
+    ).astype({'tin_clean': str, 'proc_cd': str, 'modifier': str})
+    ppo = _read_rates(ppo.drop_duplicates(['tin_clean', 'proc_cd', 'modifier'], keep='first').rename(columns={
+        'proc_cd': 'cpt_code', 'modifier': 'effective_modifier'
+    }), 'ppo_rate')
     
-    return results
+    ota = pd.DataFrame(
+        get_ota_rates_for_orders(sorted(df.loc[out_network, 'order_id'].unique())),
+        columns=['order_id', 'cpt', 'modifier', 'rate']
+    ).astype({'order_id': str, 'cpt': str, 'modifier': str})
+    ota = _read_rates(ota.drop_duplicates(['order_id', 'cpt', 'modifier'], keep='first').rename(columns={
+        'cpt': 'cpt_code', 'modifier': 'effective_modifier'
+    }), 'ota_rate')
+    
+    df = df.merge(ppo, how='left', on=['tin_clean', 'cpt_code', 'effective_modifier'])
+    df = df.merge(ota, how='left', on=['order_id', 'cpt_code', 'effective_modifier'])
+    
+    # No matching row, or a row without a usable rate, leaves NaN
+    rate = np.where(in_network, df['ppo_rate'].to_numpy(dtype=float), df['ota_rate'].to_numpy(dtype=float))
+    unreadable = np.where(
+        in_network,
+        df['ppo_rate_unreadable'].astype('boolean').fillna(False).to_numpy(dtype=bool),
+        df['ota_rate_unreadable'].astype('boolean').fillna(False).to_numpy(dtype=bool)
+    )
+    
+    ancillary = df['cpt_code'].isin(load_ancillary_codes())
+    
+    # Checks in the same order as validate_line_item_rate
+    conditions = [
+        df['cpt_code'] == '',
+        ancillary,
+        df['network_status'] == '',
+        in_network & (df['tin'] == ''),
+        ~(in_network | out_network),
+        np.isnan(rate),
+    ]
+    reasons = [
+        'missing_cpt',
+        None,
+        'missing_network_status',
+        'missing_tin',
+        'invalid_network_status',
+        'no_rate_found',
+    ]
+    reason = pd.Series(np.select(conditions, reasons, default=None), index=df.index, dtype=object)
+    # np.select leaves NaN rather than None where no reason applies
+    df['reason'] = reason.where(reason.notna(), None)
+    df['success'] = df['reason'].isna()
+    # Only lines that got as far as the rate lookup read the rate row
+    df['unreadable_rate'] = unreadable & (df['success'] | (df['reason'] == 'no_rate_found')) & ~ancillary
+    
+    # Ancillary codes get $0 rate
+    rate = np.where(ancillary, 0.0, rate)
+    df['rate'] = pd.Series(rate, index=df.index).astype(object)
+    df.loc[~df['success'] | df['rate'].isna(), 'rate'] = None
+    
+    return df.drop(columns=['effective_modifier', 'tin_clean', 'ppo_rate', 'ota_rate',
+                            'ppo_rate_unreadable', 'ota_rate_unreadable'])
+
+
+def _line_rate_rows(bills: List[Dict]) -> List[Dict]:
+    """Flatten bills into one resolve_rates_batch() input row per line item."""
+    rows = []
+    for bill in bills:
+        provider = bill['provider'] or {}
+        for item in bill['bill_items']:
+            rows.append({
+                'bill_id': bill['bill_id'],
+                'line_id': item['id'],
+                'cpt_code': item.get('cpt_code'),
+                'modifier': item.get('modifier'),
+                'network_status': provider.get('Provider Network'),
+                'tin': provider.get('TIN'),
+                'order_id': bill['order_id'],
+            })
+    return rows
+
+
+def resolve_bills_line_rates(bills: List[Dict]) -> Dict[int, Tuple[bool, Optional[float], Optional[str]]]:
+    """
+    Resolve rates for every line item of many bills in one pass, without writing.
+    
+    Args:
+        bills: Dicts with bill_id, bill_items, provider and order_id
+        
+    Returns:
+        Dict mapping line item id to the (success, rate, reason) tuple
+        validate_line_item_rate would return. Lines whose rate row cannot be
+        read are left out, so they are rated one by one and fail the same way.
+    """
+    rows = _line_rate_rows(bills)
+    if not rows:
+        return {}
+        
+    # Keep plain Python values (e.g. int line IDs) so they bind directly in sqlite3
+    resolved = resolve_rates_batch(pd.DataFrame(rows, dtype=object))
+    return {
+        line.line_id: (bool(line.success), line.rate, line.reason)
+        for line in resolved.itertuples(index=False)
+        if not line.unreadable_rate
+    }
+
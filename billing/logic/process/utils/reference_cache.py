@@ -0,0 +1,163 @@
+# billing/logic/process/utils/reference_cache.py
+
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ANCILLARY_CODES_PATH = Path(__file__).parent.parent / 'data' / 'ancillary_codes.json'
+
+# Used when data/ancillary_codes.json is missing or unreadable
+FALLBACK_ANCILLARY_CODES = frozenset({
+    "36415", "36416", "99000", "99001", "A4550", "A4556",
+    "A4558", "A4570", "A4580", "A4590", "Q4001", "T1015"
+})
+
+DIM_PROC_VERSION_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS ref_data_version (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO ref_data_version (table_name, version) VALUES ('dim_proc', 0)",
+    """
+    CREATE TRIGGER IF NOT EXISTS dim_proc_version_insert AFTER INSERT ON dim_proc
+    BEGIN
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'dim_proc';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS dim_proc_version_update AFTER UPDATE ON dim_proc
+    BEGIN
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'dim_proc';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS dim_proc_version_delete AFTER DELETE ON dim_proc
+    BEGIN
+        UPDATE ref_data_version SET version = version + 1 WHERE table_name = 'dim_proc';
+    END
+    """,
+]
+
+DIM_PROC_TRIGGERS = ('dim_proc_version_insert', 'dim_proc_version_update', 'dim_proc_version_delete')
+
+_ancillary_codes: Optional[FrozenSet[str]] = None
+_ancillary_mtime: Optional[float] = None
+
+_cpt_categories: Optional[Dict[str, Tuple[str, str]]] = None
+_cpt_categories_version: Optional[int] = None
+
+_stats = {
+    'ancillary_hits': 0,
+    'ancillary_misses': 0,
+    'category_hits': 0,
+    'category_misses': 0,
+}
+
+
+def get_ancillary_codes() -> FrozenSet[str]:
+    """
+    Get the ancillary CPT codes, reloading the JSON file only when its mtime changes.
+
+    Returns:
+        Frozen set of ancillary CPT codes
+    """
+    global _ancillary_codes, _ancillary_mtime
+
+    try:
+        mtime = ANCILLARY_CODES_PATH.stat().st_mtime
+    except OSError:
+        mtime = None
+
+    if _ancillary_codes is not None and mtime == _ancillary_mtime:
+        _stats['ancillary_hits'] += 1
+        return _ancillary_codes
+
+    _stats['ancillary_misses'] += 1
+    try:
+        with open(ANCILLARY_CODES_PATH, 'r') as f:
+            data = json.load(f)
+            _ancillary_codes = frozenset(data.get('ignored_cpt_codes', []))
+    except (FileNotFoundError, json.JSONDecodeError):
+        _ancillary_codes = FALLBACK_ANCILLARY_CODES
+
+    _ancillary_mtime = mtime
+    logger.debug(f"Loaded {len(_ancillary_codes)} ancillary codes")
+    return _ancillary_codes
+
+
+def get_cpt_category_map(conn: sqlite3.Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    Get the full dim_proc map of CPT code to (category, subcategory).
+
+    The table is read once per process and again only after
+    refresh_reference_data() sees that dim_proc changed.
+
+    Args:
+        conn: Connection used to load the map on first use
+
+    Returns:
+        Dict mapping CPT codes to (category, subcategory) tuples
+    """
+    global _cpt_categories, _cpt_categories_version
+
+    if _cpt_categories is not None:
+        _stats['category_hits'] += 1
+        return _cpt_categories
+
+    _stats['category_misses'] += 1
+    # Skip the DDL when it is already in place so loading stays read-only
+    placeholders = ', '.join(['?'] * len(DIM_PROC_TRIGGERS))
+    installed = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+        DIM_PROC_TRIGGERS
+    ).fetchone()[0]
+    if installed < len(DIM_PROC_TRIGGERS):
+        for statement in DIM_PROC_VERSION_SCHEMA:
+            conn.execute(statement)
+
+    categories = {}
+    for proc_cd, category, subcategory in conn.execute("SELECT proc_cd, category, subcategory FROM dim_proc"):
+        categories[proc_cd] = (category, subcategory)
+
+    _cpt_categories = categories
+    _cpt_categories_version = _dim_proc_version(conn)
+    logger.info(f"Loaded {len(categories)} CPT categories from dim_proc")
+    return _cpt_categories
+
+
+def refresh_reference_data(conn: sqlite3.Connection) -> None:
+    """
+    Drop the cached CPT category map if dim_proc changed since it was loaded.
+
+    Ancillary codes check their file mtime on every call and need no refresh.
+    """
+    global _cpt_categories, _cpt_categories_version
+
+    if _cpt_categories is not None and _dim_proc_version(conn) != _cpt_categories_version:
+        logger.info("dim_proc changed, invalidating CPT category cache")
+        _cpt_categories = None
+        _cpt_categories_version = None
+
+
+def invalidate_cpt_categories() -> None:
+    """Drop the cached CPT category map so the next call reloads it."""
+    global _cpt_categories, _cpt_categories_version
+    _cpt_categories = None
+    _cpt_categories_version = None
+
+
+def reference_cache_stats() -> Dict[str, int]:
+    """Get hit/miss counters for the ancillary code and CPT category caches."""
+    return dict(_stats)
+
+
+def _dim_proc_version(conn: sqlite3.Connection) -> Optional[int]:
+    """Get the dim_proc version counter maintained by the triggers."""
+    row = conn.execute("SELECT version FROM ref_data_version WHERE table_name = 'dim_proc'").fetchone()
+    return row[0] if row else None
@@ -0,0 +1,467 @@
+# billing/logic/process/utils/rules.py
+
+import time
+import logging
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .db_queries import (
+    acquire_connection, release_connection, unit_of_work, update_bill_status,
+    update_line_items, get_bill_statuses
+)
+from .db_utils import update_order_line_items_reviewed
+from .loader import load_bill_data, load_bills_batch
+from .validation import validate_provider_info, compare_cpt_codes, validate_units, load_ancillary_codes
+from .arthrogram import is_arthrogram_order
+from .rate_validation import validate_line_item_rate, resolve_bills_line_rates
+from .reference_cache import get_cpt_category_map, invalidate_cpt_categories
+from .rate_cache import forget_ppo_tin_key
+from .metrics import stage, record, statement_count
+
+logger = logging.getLogger(__name__)
+
+# Bills loaded per chunk by dry_run_rules()
+DRY_RUN_CHUNK_SIZE = 500
+
+# Outcome when no rule stops the bill (e.g. the rates rule is disabled)
+NO_MATCH_MESSAGE = "Unexpected CPT code validation result"
+
+Rule = Tuple[str, Callable[[Dict], Optional[Dict]]]
+
+# Per-rule counters, keyed by rule name
+_rule_stats: Dict[str, Dict] = {}
+
+
+def outcome(
+    status: str,
+    message: str,
+    bill_update: Optional[Tuple[str, str, Optional[str]]] = None,
+    **extra
+) -> Dict:
+    """
+    Build a rule outcome.
+
+    Args:
+        status: process_bill result status (SUCCESS, FLAGGED, ERROR, ARTHROGRAM)
+        message: process_bill result message
+        bill_update: (status, action, error) to write to ProviderBill, or None
+        **extra: line_updates and reviewed_cpts for the rates rule
+    """
+    return {'status': status, 'message': message, 'bill_update': bill_update, **extra}
+
+
+def build_bill_context(
+    bill_id: str,
+    bill_data: Optional[Tuple] = None,
+    line_rates: Optional[Dict] = None
+) -> Dict:
+    """
+    Collect everything the rules read, so rules never touch the database.
+
+    Args:
+        bill_id: The provider bill ID
+        bill_data: Preloaded (bill, bill_items, order, order_items, provider) tuple
+            from load_bills_batch; loaded from the DB if omitted
+        line_rates: Line item rates from preload_line_rates(); lines missing
+            from it are rated one by one when the rates rule first needs them
+
+    Returns:
+        Bill context dict
+    """
+    if bill_data is None:
+        with stage('load'):
+            bill_data = load_bill_data(bill_id)
+    bill, bill_items, order, order_items, provider = bill_data
+
+    conn = acquire_connection()
+    cpt_categories = get_cpt_category_map(conn)
+    release_connection(conn)
+
+    return {
+        'bill_id': bill_id,
+        'bill': bill,
+        'bill_items': bill_items,
+        'order': order,
+        'order_items': order_items,
+        'provider': provider,
+        'ancillary_codes': load_ancillary_codes(),
+        'cpt_categories': cpt_categories,
+        'line_rates': line_rates or {},
+        # Values derived once and shared between rules
+        'derived': {}
+    }
+
+
+def preload_line_rates(batch: Dict[str, Tuple]) -> Dict:
+    """
+    Resolve line item rates for a load_bills_batch() result in one vectorized pass.
+
+    Bills that cannot reach the rates rule (no line items, order or provider)
+    are skipped.
+    """
+    bills = [
+        {
+            'bill_id': bill_id,
+            'bill_items': bill_items,
+            'provider': provider,
+            'order_id': order.get('Order_ID')
+        }
+        for bill_id, (bill, bill_items, order, order_items, provider) in batch.items()
+        if bill and bill_items and order and provider
+    ]
+    with stage('rate_lookup_batch'):
+        return resolve_bills_line_rates(bills)
+
+
+def _cpt_validation(ctx: Dict) -> Dict:
+    """compare_cpt_codes() result for the bill, computed once per context."""
+    derived = ctx['derived']
+    if 'cpt_validation' not in derived:
+        with stage('cpt_compare'):
+            derived['cpt_validation'] = compare_cpt_codes(
+                ctx['bill_items'], ctx['order_items'], category_map=ctx['cpt_categories']
+            )
+    return derived['cpt_validation']
+
+
+def _matched_cpts(ctx: Dict) -> List[str]:
+    """Non-ancillary billed CPT codes that match the order exactly or by category."""
+    derived = ctx['derived']
+    if 'matched_cpts' not in derived:
+        cpt_validation = _cpt_validation(ctx)
+        ancillary_codes = ctx['ancillary_codes']
+        derived['matched_cpts'] = [
+            match['cpt'] for match in cpt_validation['exact_matches']
+            if match['cpt'] not in ancillary_codes
+        ] + [
+            match['billed_cpt'] for match in cpt_validation['category_matches']
+            if match['billed_cpt'] not in ancillary_codes
+        ]
+    return derived['matched_cpts']
+
+
+def _line_rate(ctx: Dict, item: Dict) -> Tuple[bool, Optional[float], Optional[str]]:
+    """Preloaded (success, rate, reason) for a line item, rating it on demand if missing."""
+    line_rates = ctx['line_rates']
+    if item['id'] not in line_rates:
+        with stage('rate_lookup'):
+            line_rates[item['id']] = validate_line_item_rate(
+                bill_id=ctx['bill_id'],
+                line_item=item,
+                provider=ctx['provider'],
+                order_id=ctx['order']['Order_ID']
+            )
+    return line_rates[item['id']]
+
+
+def bill_found(ctx: Dict) -> Optional[Dict]:
+    if not ctx['bill']:
+        return outcome("ERROR", "Bill not found")
+    return None
+
+
+def has_line_items(ctx: Dict) -> Optional[Dict]:
+    if not ctx['bill_items']:
+        return outcome("ERROR", "No line items found", ("FLAGGED", "to_review", "No line items found"))
+    return None
+
+
+def has_order(ctx: Dict) -> Optional[Dict]:
+    if not ctx['order']:
+        error_msg = "No associated order found"
+        return outcome("ERROR", error_msg, ("FLAGGED", "to_review", error_msg))
+    return None
+
+
+def provider_complete(ctx: Dict) -> Optional[Dict]:
+    provider = ctx['provider']
+    if not provider:
+        error_msg = "Provider information not found"
+        return outcome("FLAGGED", "Provider validation failed", ("FLAGGED", "update_prov_info", error_msg))
+
+    validation_results = validate_provider_info(ctx['bill'], provider)
+    if validation_results['is_valid']:
+        return None
+
+    missing_fields = [
+        field.replace('_present', '').replace('_', ' ').title()
+        for field, is_present in validation_results.items()
+        if field != 'is_valid' and not is_present
+    ]
+    error_msg = "Cannot proceed: Missing required provider fields - " + ", ".join(missing_fields)
+    return outcome("FLAGGED", "Provider validation failed", ("FLAGGED", "update_prov_info", error_msg))
+
+
+def arthrogram(ctx: Dict) -> Optional[Dict]:
+    if is_arthrogram_order(ctx['order'], ctx['order_items']):
+        return outcome("ARTHROGRAM", "Routed to arthrogram processing")
+    return None
+
+
+def units(ctx: Dict) -> Optional[Dict]:
+    units_validation = validate_units(ctx['bill_items'])
+    if not units_validation['has_violations']:
+        return None
+
+    error_msg = "Units validation failed: " + "; ".join(
+        f"CPT {v['cpt']} has {v['units']} units" for v in units_validation['violations']
+    )
+    return outcome("FLAGGED", error_msg, ("FLAGGED", "to_review", error_msg))
+
+
+def exact_match_overbilling(ctx: Dict) -> Optional[Dict]:
+    overbilling = _cpt_validation(ctx)['exact_match_overbilling']
+    if not overbilling:
+        return None
+
+    error_msg = "Exact match overbilling detected: " + "; ".join(
+        f"CPT {match['cpt']}: billed {match['billed_count']} > ordered {match['ordered_count']}"
+        for match in overbilling
+    )
+    return outcome("FLAGGED", error_msg, ("FLAGGED", "exact_match_overbilling", error_msg))
+
+
+def category_overbilling(ctx: Dict) -> Optional[Dict]:
+    overbilling = _cpt_validation(ctx)['category_overbilling']
+    if not overbilling:
+        return None
+
+    error_msg = "Category overbilling detected: " + "; ".join(
+        f"Category {match['category']}/{match['subcategory']}: "
+        f"billed {match['billed_count']} > ordered {match['ordered_count']} "
+        f"(CPTs: {', '.join(match['billed_cpts'])})"
+        for match in overbilling
+    )
+    return outcome("FLAGGED", error_msg, ("FLAGGED", "category_overbilling", error_msg))
+
+
+def complete_mismatch(ctx: Dict) -> Optional[Dict]:
+    if _matched_cpts(ctx):
+        return None
+
+    error_msg = "Bill CPT codes completely mismatch with order (excluding ancillaries)"
+    return outcome("FLAGGED", error_msg, ("REVIEW_FLAG", "complete_line_item_mismatch", error_msg))
+
+
+def additional_codes(ctx: Dict) -> Optional[Dict]:
+    billed_not_ordered = _cpt_validation(ctx)['billed_not_ordered']  # already excludes ancillaries
+    if not billed_not_ordered:
+        return None
+
+    error_msg = f"Bill contains additional non-ancillary CPT codes not in order: {', '.join(billed_not_ordered)}"
+    return outcome("FLAGGED", error_msg, ("REVIEW_FLAG", "address_line_item_mismatch", error_msg))
+
+
+def rates(ctx: Dict) -> Optional[Dict]:
+    matched_cpts = _matched_cpts(ctx)
+    if not matched_cpts:
+        return None
+
+    error_msg = None
+    line_updates = []
+    for item in ctx['bill_items']:
+        success, rate, reason = _line_rate(ctx, item)
+        if success:
+            line_updates.append(('APPROVED', rate, None, item['id']))
+        else:
+            error_msg = f"Rate validation failed for CPT {item.get('cpt_code', '')}: {reason}"
+            line_updates.append(('REJECTED', None, reason, item['id']))
+
+    if error_msg:
+        return outcome(
+            "FLAGGED", error_msg, ("FLAGGED", "review_rates", error_msg),
+            line_updates=line_updates, reviewed_cpts=matched_cpts
+        )
+    return outcome(
+        "SUCCESS", "Bill processed successfully", ("REVIEWED", "apply_rate", None),
+        line_updates=line_updates, reviewed_cpts=matched_cpts
+    )
+
+
+# The process_bill validation flow, checked in order; the first rule that
+# returns an outcome decides the bill.
+DEFAULT_RULES = [
+    {'name': 'bill_found', 'check': bill_found},
+    {'name': 'has_line_items', 'check': has_line_items},
+    {'name': 'has_order', 'check': has_order},
+    {'name': 'provider_complete', 'check': provider_complete},
+    {'name': 'arthrogram', 'check': arthrogram},
+    {'name': 'units', 'check': units},
+    {'name': 'exact_match_overbilling', 'check': exact_match_overbilling},
+    {'name': 'category_overbilling', 'check': category_overbilling},
+    {'name': 'complete_mismatch', 'check': complete_mismatch},
+    {'name': 'additional_codes', 'check': additional_codes},
+    {'name': 'rates', 'check': rates},
+]
+
+
+def compile_rules(specs: List[Dict], disable: Iterable[str] = ()) -> List[Rule]:
+    """
+    Turn rule specs into the (name, check) list evaluate_rules() runs.
+
+    Args:
+        specs: Dicts with a unique name and a check(ctx) -> Optional[outcome] function
+        disable: Names of rules to leave out, e.g. to dry-run a rule change
+
+    Returns:
+        List of (name, check) tuples in spec order
+    """
+    disabled = set(disable)
+    names = [spec['name'] for spec in specs]
+
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate rule names: {', '.join(duplicates)}")
+    unknown = sorted(disabled - set(names))
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(unknown)}")
+
+    return [(spec['name'], spec['check']) for spec in specs if spec['name'] not in disabled]
+
+
+DEFAULT_RULESET = compile_rules(DEFAULT_RULES)
+
+
+def evaluate_rules(rules: List[Rule], ctx: Dict) -> Dict:
+    """
+    Run compiled rules over a bill context until one returns an outcome.
+
+    Nothing is written; pass the result to apply_outcome() to record it.
+
+    Args:
+        rules: Rules from compile_rules()
+        ctx: Context from build_bill_context()
+
+    Returns:
+        The deciding outcome, with the name of the rule that produced it
+    """
+    for name, check in rules:
+        stats = _rule_stats.setdefault(name, {'calls': 0, 'fired': 0, 'seconds': 0.0})
+        start = time.perf_counter()
+        statements = statement_count()
+        try:
+            result = check(ctx)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            record(f"rule.{name}", elapsed, statement_count() - statements)
+
+        if result is not None:
+            stats['fired'] += 1
+            result['rule'] = name
+            return result
+
+    result = outcome("ERROR", NO_MATCH_MESSAGE, ("ERROR", "to_review", NO_MATCH_MESSAGE))
+    result['rule'] = None
+    return result
+
+
+def apply_outcome(ctx: Dict, result: Dict) -> None:
+    """Write a rule outcome for the bill: reviewed order lines, line item decisions, then bill status."""
+    with stage('writes'):
+        _write_outcome(ctx, result)
+
+
+def _write_outcome(ctx: Dict, result: Dict) -> None:
+    """Run the writes for apply_outcome()."""
+    bill_id = ctx['bill_id']
+
+    reviewed_cpts = result.get('reviewed_cpts')
+    if reviewed_cpts and ctx['order'].get('Order_ID'):
+        update_order_line_items_reviewed(
+            order_id=ctx['order']['Order_ID'],
+            bill_id=bill_id,
+            cpt_codes=reviewed_cpts
+        )
+        logger.info(f"Marked {len(reviewed_cpts)} non-ancillary order line items as reviewed for bill {bill_id}")
+
+    update_line_items(result.get('line_updates') or [])
+
+    if result['bill_update']:
+        update_bill_status(bill_id, *result['bill_update'])
+
+
+def rule_stats() -> Dict[str, Dict]:
+    """Get calls, fired count and total seconds per rule since the last reset."""
+    return {name: dict(stats) for name, stats in _rule_stats.items()}
+
+
+def reset_rule_stats() -> None:
+    """Clear the per-rule counters."""
+    _rule_stats.clear()
+
+
+def dry_run_rules(
+    rules: Optional[List[Rule]] = None,
+    statuses: Optional[List[str]] = None,
+    chunk_size: int = DRY_RUN_CHUNK_SIZE
+) -> Dict:
+    """
+    Evaluate a rule set over the whole bill table without writing anything.
+
+    Bills are streamed in chunks with the same batch loaders as
+    run_processing, and each predicted status is compared with the status
+    the bill has today. The run's transaction is rolled back, including any
+    ppo/dim_proc key schema the lookups install on an unmigrated database.
+
+    Args:
+        rules: Compiled rules; DEFAULT_RULESET if omitted
+        statuses: Only evaluate bills currently in these statuses
+        chunk_size: Bills loaded per chunk
+
+    Returns:
+        Dict with:
+        - total: Number of bills evaluated
+        - current / predicted: Bill counts per status
+        - shift: predicted minus current per status
+        - transitions: Counts per "current -> predicted" pair that differ
+        - rules: rule_stats() for this run
+    """
+    rules = rules if rules is not None else DEFAULT_RULESET
+    reset_rule_stats()
+
+    current = Counter()
+    predicted = Counter()
+    transitions = Counter()
+
+    try:
+        with unit_of_work(commit=False):
+            bills = get_bill_statuses(statuses)
+            logger.info(f"Dry-running {len(rules)} rules over {len(bills)} bills")
+
+            for start in range(0, len(bills), chunk_size):
+                chunk = bills[start:start + chunk_size]
+                batch = load_bills_batch([bill_id for bill_id, _ in chunk])
+                try:
+                    line_rates = preload_line_rates(batch)
+                except Exception as e:
+                    logger.warning(f"Batch rate resolution failed, rating lines individually: {str(e)}")
+                    line_rates = {}
+
+                for bill_id, status in chunk:
+                    try:
+                        result = evaluate_rules(rules, build_bill_context(bill_id, batch[bill_id], line_rates))
+                        new_status = result['bill_update'][0] if result['bill_update'] else status
+                    except Exception as e:
+                        logger.warning(f"Bill {bill_id} raised during dry run: {str(e)}")
+                        new_status = "ERROR"
+
+                    current[status] += 1
+                    predicted[new_status] += 1
+                    if new_status != status:
+                        transitions[f"{status} -> {new_status}"] += 1
+    finally:
+        # The rolled-back run may have installed schema the caches now assume is there
+        forget_ppo_tin_key()
+        invalidate_cpt_categories()
+
+    statuses_seen = sorted(set(current) | set(predicted), key=str)
+    return {
+        'total': len(bills),
+        'current': dict(current),
+        'predicted': dict(predicted),
+        'shift': {status: predicted[status] - current[status] for status in statuses_seen},
+        'transitions': dict(transitions.most_common()),
+        'rules': rule_stats()
+    }
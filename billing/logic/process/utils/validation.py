@@ -1,32 +1,36 @@
 # billing/logic/process/utils/validation.py
 
-from typing import Dict, List, Tuple, Set, Optional
-import json
+from typing import Dict, List, Tuple, Optional, FrozenSet
 import os
-from pathlib import Path
 from .db_queries import get_cpt_categories
+from .reference_cache import get_ancillary_codes
 import logging
 
-def load_ancillary_codes() -> Set[str]:
-    """Load list of ancillary CPT codes that should be ignored in validation."""
-    data_path = Path(__file__).parent.parent / 'data' / 'ancillary_codes.json'
-    try:
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-            return set(data.get('ignored_cpt_codes', []))
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Fallback to a minimal set if file not found
-        return {
-            "36415", "36416", "99000", "99001", "A4550", "A4556", 
-            "A4558", "A4570", "A4580", "A4590", "Q4001", "T1015"
-        }
+def load_ancillary_codes() -> FrozenSet[str]:
+    """
+    Load list of ancillary CPT codes that should be ignored in validation.
+    
+    Served from the process-wide reference cache; the JSON file is only
+    re-read when it changes.
+    """
+    return get_ancillary_codes()
 
 
-def compare_cpt_codes(bill_items: List[Dict], order_items: List[Dict]) -> Dict:
+def compare_cpt_codes(
+    bill_items: List[Dict],
+    order_items: List[Dict],
+    category_map: Optional[Dict[str, Tuple[str, str]]] = None
+) -> Dict:
     """
     Flexible CPT code comparison between billed and ordered items.
     Handles many-to-many relationships between line items.
-    
+
+    Args:
+        bill_items: Bill line items
+        order_items: Order line items
+        category_map: Preloaded dim_proc map of CPT code to (category, subcategory);
+            looked up through the database helpers if omitted
+
     Returns:
         Dict containing:
         - exact_matches: CPT codes that match exactly
@@ -97,7 +101,10 @@ def compare_cpt_codes(bill_items: List[Dict], order_items: List[Dict]) -> Dict:
         }
     
     # Get category information
-    categories = get_cpt_categories(unmatched_cpts)
+    if category_map is not None:
+        categories = {cpt: category_map[cpt] for cpt in unmatched_cpts if cpt in category_map}
+    else:
+        categories = get_cpt_categories(unmatched_cpts)
     logger.info(f"Category lookup results: {categories}")
     
     # Build category mapping with counts
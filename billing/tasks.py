@@ -1,10 +1,102 @@
 # billing/tasks.py
 
-from celery import shared_task
-from billing.jobs.run_pipeline import process_bill
+import logging
+from typing import Dict, List, Optional
+
+from celery import shared_task, chord, group
+from celery.result import AsyncResult
+from django.conf import settings
+
+from billing.logic.process.main import (
+    process_bill, validate_chunk_in_worker, init_worker, prepare_parallel_run,
+    empty_results, count_result, DEFAULT_BATCH_SIZE
+)
+from billing.logic.process.utils.db_queries import unit_of_work, apply_writes
+from billing.logic.process.utils.loader import load_mapped_bills
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def run_bill_pipeline(bill_id):
-    result = process_bill(bill_id)
+    with unit_of_work():
+        result = process_bill(bill_id)
     print(f"Processed bill {bill_id}: {result['status']}")
     return result
+
+
+@shared_task
+def process_bill_chunk(bill_ids: List[str], batch_size: Optional[int] = DEFAULT_BATCH_SIZE, rate_cache: bool = True) -> List[Dict]:
+    """
+    Validate a chunk of bills, then write its outcomes in one short transaction.
+
+    Validation only reads, so chunks running on other workers never hold the
+    SQLite write lock while they work; each chunk's writes are applied at once.
+
+    Returns:
+        process_bill results in the same order as bill_ids
+    """
+    init_worker(rate_cache)
+    chunk_results, writes, _ = validate_chunk_in_worker(bill_ids, batch_size)
+
+    with unit_of_work():
+        apply_writes(writes)
+
+    logger.info(f"Processed chunk of {len(bill_ids)} bills")
+    return chunk_results
+
+
+@shared_task
+def summarize_bill_chunks(chunk_results: List[List[Dict]], total: int) -> Dict:
+    """Chord callback: fold per-chunk results into the run_processing summary dict."""
+    results = empty_results(total)
+    for chunk in chunk_results:
+        for result in chunk:
+            count_result(results, result)
+
+    logger.info(f"Processing complete: {results}")
+    return results
+
+
+def dispatch_mapped_bills(
+    limit: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    rate_cache: bool = True
+) -> AsyncResult:
+    """
+    Fan MAPPED bills out to Celery workers as a chord of chunk tasks.
+
+    Args:
+        limit: Optional maximum number of bills to process
+        chunk_size: Bills per task; defaults to settings.BILL_PROCESSING_CHUNK_SIZE
+        batch_size: Bills bulk-loaded at a time inside each task (see run_processing)
+        rate_cache: Cache the PPO fee schedule in each worker process
+
+    Returns:
+        AsyncResult whose get() is the same summary dict run_processing returns
+    """
+    chunk_size = chunk_size or settings.BILL_PROCESSING_CHUNK_SIZE
+
+    bill_ids = [bill['id'] for bill in load_mapped_bills(limit)]
+    chunks = [bill_ids[start:start + chunk_size] for start in range(0, len(bill_ids), chunk_size)]
+
+    if not chunks:
+        return summarize_bill_chunks.delay([], 0)
+
+    prepare_parallel_run()
+
+    logger.info(f"Dispatching {len(bill_ids)} bills in {len(chunks)} chunks of up to {chunk_size}")
+    header = group(process_bill_chunk.s(chunk, batch_size, rate_cache) for chunk in chunks)
+    return chord(header)(summarize_bill_chunks.s(len(bill_ids)))
+
+
+@shared_task
+def process_mapped_bills(limit: Optional[int] = None, chunk_size: Optional[int] = None) -> str:
+    """
+    Enqueue processing of all MAPPED bills, e.g. from celery beat.
+
+    Returns:
+        ID of the chord result holding the summary dict
+    """
+    return dispatch_mapped_bills(limit, chunk_size).id
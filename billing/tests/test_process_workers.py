@@ -0,0 +1,227 @@
+"""
+run_processing with workers > 1 must leave the database exactly as a serial
+run does: the same ProviderBill, BillLineItem and order line item rows, the
+same bill_events journal and the same incremental checkpoint.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+# process/main.py logs to billing/logs at import time
+(PROJECT_ROOT / 'billing' / 'logs').mkdir(exist_ok=True)
+
+import billing.logic.process.main as main
+from billing.logic.process.utils import rules
+from billing.logic.process.utils.bill_journal import PROCESS_CONSUMER, ensure_bill_journal
+from billing.logic.process.utils.rate_cache import forget_ppo_tin_key
+from billing.logic.process.utils.reference_cache import invalidate_cpt_categories
+
+PROVIDER_COLUMNS = [
+    "PrimaryKey", "DBA Name Billing Name", "Billing Name", "Address Line 1", "Address Line 2", "City", "State",
+    "Postal Code", "Billing Address 1", "Billing Address 2", "Billing Address City", "Billing Address State",
+    "Billing Address Postal Code", "Phone", "Fax Number", "TIN", "NPI", "Provider Network", "Provider Type",
+    "Provider Status",
+]
+
+
+def provider(key, network, tin, billing_name='Imaging LLC'):
+    values = dict.fromkeys(PROVIDER_COLUMNS, 'x')
+    values.update({'PrimaryKey': key, 'Billing Name': billing_name, 'Provider Network': network, 'TIN': tin})
+    return [values[column] for column in PROVIDER_COLUMNS]
+
+
+PROVIDERS = [
+    provider('p-in', 'In Network', '12-3456789'),
+    provider('p-out', 'Out of Network', '98-7654321'),
+    provider('p-incomplete', 'In Network', '12-3456789', billing_name=''),
+]
+
+# bill_id: (status, order_id, provider_id, bundle_type, [(cpt, units)], [ordered cpts])
+BILLS = {
+    'b01': ('MAPPED', 'o01', 'p-in', '', [('73721', 1), ('A4550', 1)], ['73721']),
+    'b02': ('MAPPED', 'o02', 'p-in', '', [('73721', 2)], ['73721']),
+    'b03': ('MAPPED', 'o03', 'p-incomplete', '', [('73721', 1)], ['73721']),
+    'b04': ('MAPPED', 'o04', 'p-in', 'Arthrogram', [('73721', 1)], ['73721']),
+    'b05': ('MAPPED', 'o05', 'p-in', '', [('70450', 1)], ['73721']),
+    'b06': ('MAPPED', 'o06', 'p-in', '', [('73721', 1), ('73723', 1)], ['73721', '73723']),
+    'b07': ('MAPPED', 'o07', 'p-out', '', [('70450', 1)], ['70450']),
+    'b08': ('MAPPED', 'o08', 'p-in', '', [('73721', 1)], ['73721']),
+    'b09': ('MAPPED', None, None, '', [('73721', 1)], []),
+    'b10': ('MAPPED', 'o10', 'p-in', '', [('73722', 1)], ['73721']),
+    'b11': ('PENDING', 'o11', 'p-in', '', [('73721', 1)], ['73721']),
+    'b12': ('REVIEWED', 'o12', 'p-in', '', [('73721', 1)], ['73721']),
+}
+
+# Its status write raises after its order and line item writes went through
+FAILING_BILL = 'b08'
+
+
+def build_fixture(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE ProviderBill (id TEXT PRIMARY KEY, status TEXT, action TEXT, last_error TEXT,
+                                   claim_id TEXT, created_at TEXT);
+        CREATE TABLE BillLineItem (id INTEGER PRIMARY KEY, provider_bill_id TEXT, cpt_code TEXT, modifier TEXT,
+                                   units INTEGER, date_of_service TEXT, decision TEXT, allowed_amount REAL,
+                                   reason_code TEXT);
+        CREATE TABLE orders (Order_ID TEXT, provider_id TEXT, bundle_type TEXT);
+        CREATE TABLE order_line_items (id INTEGER PRIMARY KEY, Order_ID TEXT, CPT TEXT, line_number INTEGER,
+                                       BILL_REVIEWED TEXT);
+        CREATE TABLE ppo (TIN TEXT, proc_cd TEXT, modifier TEXT, rate);
+        CREATE TABLE ota (ID_Order_PrimaryKey TEXT, CPT TEXT, modifier TEXT, rate);
+        CREATE TABLE dim_proc (proc_cd TEXT, category TEXT, subcategory TEXT);
+    """)
+    conn.execute(f"CREATE TABLE providers ({', '.join(f'{column!r}' for column in PROVIDER_COLUMNS)})")
+    conn.executemany(f"INSERT INTO providers VALUES ({', '.join(['?'] * len(PROVIDER_COLUMNS))})", PROVIDERS)
+    conn.executemany("INSERT INTO ppo VALUES (?, ?, ?, ?)", [
+        ('12-3456789', '73721', '', '250.00'),
+        ('12-3456789', '73722', '', '300'),
+    ])
+    conn.execute("INSERT INTO ota VALUES ('o07', '70450', '', '120')")
+    conn.executemany("INSERT INTO dim_proc VALUES (?, ?, ?)", [
+        ('73721', 'MRI', 'Lower Extremity'),
+        ('73722', 'MRI', 'Lower Extremity'),
+        ('73723', 'MRI', 'Lower Extremity'),
+        ('70450', 'CT', 'Head'),
+    ])
+
+    # Journal the inserts below, as the triggers do in production
+    ensure_bill_journal(conn)
+    line_id = 0
+    for n, (bill_id, (status, order_id, provider_id, bundle_type, lines, ordered)) in enumerate(BILLS.items()):
+        conn.execute("INSERT INTO ProviderBill VALUES (?, ?, NULL, NULL, ?, ?)",
+                     (bill_id, status, order_id, f"2026-01-{n + 1:02d}"))
+        for cpt_code, units in lines:
+            line_id += 1
+            conn.execute("INSERT INTO BillLineItem (id, provider_bill_id, cpt_code, modifier, units, date_of_service)"
+                         " VALUES (?, ?, ?, '', ?, '2026-01-01')", (line_id, bill_id, cpt_code, units))
+        if order_id:
+            conn.execute("INSERT INTO orders VALUES (?, ?, ?)", (order_id, provider_id, bundle_type))
+            conn.executemany("INSERT INTO order_line_items (Order_ID, CPT, line_number) VALUES (?, ?, ?)",
+                             [(order_id, cpt, i) for i, cpt in enumerate(ordered, 1)])
+
+    # Everything so far was handled by an earlier run; b11 and b02 then (re)enter MAPPED
+    conn.execute("INSERT INTO bill_event_checkpoints (consumer, last_event_id) "
+                 "SELECT ?, MAX(id) FROM bill_events", (PROCESS_CONSUMER,))
+    conn.execute("UPDATE ProviderBill SET status = 'MAPPED' WHERE id = 'b11'")
+    conn.execute("UPDATE ProviderBill SET status = 'PENDING' WHERE id = 'b02'")
+    conn.execute("UPDATE ProviderBill SET status = 'MAPPED' WHERE id = 'b02'")
+    conn.commit()
+    conn.close()
+
+
+def snapshot(db_path):
+    conn = sqlite3.connect(db_path)
+    tables = {
+        'ProviderBill': "SELECT * FROM ProviderBill ORDER BY id",
+        'BillLineItem': "SELECT * FROM BillLineItem ORDER BY id",
+        'order_line_items': "SELECT * FROM order_line_items ORDER BY id",
+        'bill_events': "SELECT id, bill_id, old_status, new_status FROM bill_events ORDER BY id",
+        'checkpoint': "SELECT consumer, last_event_id FROM bill_event_checkpoints ORDER BY consumer",
+    }
+    state = {name: conn.execute(query).fetchall() for name, query in tables.items()}
+    conn.close()
+    return state
+
+
+class ParallelMatchesSerialTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fixture_dir = tempfile.TemporaryDirectory()
+        cls.fixture = os.path.join(cls.fixture_dir.name, 'monolith.db')
+        build_fixture(cls.fixture)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fixture_dir.cleanup()
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.addCleanup(os.chdir, self.cwd)
+
+        real_update_bill_status = rules.update_bill_status
+
+        def update_bill_status(bill_id, *args, **kwargs):
+            if bill_id == FAILING_BILL:
+                raise RuntimeError("status write failed")
+            return real_update_bill_status(bill_id, *args, **kwargs)
+
+        # Patched before the pool forks, so workers fail the same bill
+        patches = [
+            mock.patch.object(rules, 'update_bill_status', update_bill_status),
+            mock.patch.object(main, 'write_metrics_report'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_copy(self, workers, **kwargs):
+        """Run run_processing on a fresh copy of the fixture; return (results, database state)."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        shutil.copy(self.fixture, tmp.name)
+        # unit_of_work() opens monolith.db in the working directory
+        os.chdir(tmp.name)
+        forget_ppo_tin_key()
+        invalidate_cpt_categories()
+
+        results = main.run_processing(workers=workers, **kwargs)
+        return results, snapshot(os.path.join(tmp.name, 'monolith.db'))
+
+    def assert_same_run(self, **kwargs):
+        serial_results, serial = self.run_copy(workers=1, **kwargs)
+        parallel_results, parallel = self.run_copy(workers=2, **kwargs)
+
+        self.assertEqual(parallel_results, serial_results)
+        for table in serial:
+            self.assertEqual(parallel[table], serial[table], table)
+        return serial_results, serial
+
+    def test_full_run(self):
+        for batch_size in (3, 0):
+            for rate_cache in (True, False):
+                with self.subTest(batch_size=batch_size, rate_cache=rate_cache):
+                    results, state = self.assert_same_run(batch_size=batch_size, rate_cache=rate_cache)
+
+                    self.assertEqual(results, {'total': 11, 'success': 3, 'flagged': 5, 'error': 2, 'arthrogram': 1})
+                    statuses = {row[0]: row[1] for row in state['ProviderBill']}
+                    self.assertEqual(statuses['b01'], 'REVIEWED')
+                    self.assertEqual(statuses['b07'], 'REVIEWED')
+                    self.assertEqual(statuses['b11'], 'REVIEWED')
+                    self.assertEqual(statuses['b04'], 'MAPPED')
+                    self.assertEqual(statuses['b12'], 'REVIEWED')
+
+    def test_failed_bill_keeps_none_of_its_writes(self):
+        _, state = self.assert_same_run(batch_size=3)
+
+        bill = next(row for row in state['ProviderBill'] if row[0] == FAILING_BILL)
+        self.assertEqual(bill[1:4], ('ERROR', 'to_review', 'Processing error: status write failed'))
+        # The order line and line item writes queued before the failure were dropped
+        self.assertEqual([row[6:] for row in state['BillLineItem'] if row[1] == FAILING_BILL], [(None, None, None)])
+        self.assertEqual([row[4] for row in state['order_line_items'] if row[1] == 'o08'], [None])
+        # while the bill before it in the same chunk kept its writes
+        self.assertEqual([row[4] for row in state['order_line_items'] if row[1] == 'o07'], ['b07'])
+
+    def test_incremental_run(self):
+        before = snapshot(self.fixture)['bill_events']
+        results, state = self.assert_same_run(batch_size=1, incremental=True)
+
+        # Only the bills that (re)entered MAPPED after the checkpoint were processed
+        self.assertEqual(results['total'], 2)
+        self.assertEqual(sorted(row[1] for row in state['bill_events'][len(before):]), ['b02', 'b11'])
+        # The checkpoint stops at the last MAPPED event, not at the events the run itself wrote
+        last_mapped = max(row[0] for row in before if row[3] == 'MAPPED')
+        self.assertEqual(state['checkpoint'], [(PROCESS_CONSUMER, last_mapped)])
+
+if __name__ == '__main__':
+    unittest.main()
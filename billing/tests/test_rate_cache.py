@@ -0,0 +1,45 @@
+"""
+The in-memory PPO rate table must load past a bad rate row, so only the
+lines that hit that row go without a rate.
+"""
+
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+from billing.logic.process.utils import rate_cache
+
+
+class LoadPpoRatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("CREATE TABLE ppo (TIN TEXT, proc_cd TEXT, modifier TEXT, rate TEXT)")
+        self.conn.executemany("INSERT INTO ppo (TIN, proc_cd, modifier, rate) VALUES (?, ?, ?, ?)", [
+            ('12-3456789', '73721', '', '250.00'),
+            ('12-3456789', '73721', 'TC', 'abc'),
+            ('12-3456789', '73721', '26', '0'),
+            ('12-3456789', '73722', None, ''),
+            ('98 7654321', '70450', '', '99.5'),
+        ])
+        rate_cache.invalidate_ppo_rates()
+        self.addCleanup(rate_cache.invalidate_ppo_rates)
+        self.addCleanup(self.conn.close)
+
+    def test_bad_row_does_not_fail_the_load(self):
+        with self.assertLogs(rate_cache.logger, level='WARNING'):
+            bad = rate_cache.get_cached_ppo_rate(self.conn, '123456789', '73721', 'TC')
+        self.assertIsNone(bad)
+
+        self.assertEqual(rate_cache.get_cached_ppo_rate(self.conn, '123456789', '73721', None), 250.0)
+        self.assertEqual(rate_cache.get_cached_ppo_rate(self.conn, '123456789', '73721', '26'), 0.0)
+        self.assertIsNone(rate_cache.get_cached_ppo_rate(self.conn, '123456789', '73722', None))
+        self.assertEqual(rate_cache.get_cached_ppo_rate(self.conn, '987654321', '70450', None), 99.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+resolve_bills_line_rates (the batch path) must give every line the same
+(success, rate, reason) tuple as validate_line_item_rate (the per-line path).
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+from billing.logic.process.utils import rate_cache, rate_validation
+from billing.logic.process.utils.db_queries import unit_of_work
+
+ANCILLARY = frozenset({'A4550'})
+
+IN_NETWORK = {'Provider Network': 'In Network', 'TIN': '12-345 6789'}
+OUT_OF_NETWORK = {'Provider Network': 'Out of Network', 'TIN': ''}
+
+PPO_ROWS = [
+    ('123456789', '73721', None, '250.00'),
+    ('123456789', '73721', 'TC', '75'),
+    ('123456789', '73721', '26', '0'),      # text zero is a $0 rate
+    ('123456789', '73722', '', ''),         # empty rate is no rate
+    ('123456789', '73723', '', None),       # NULL rate is no rate
+    ('123456789', '73724', '', 0),          # numeric zero is no rate
+    ('123456789', '73725', '', '410.5'),
+    ('123456789', '73725', '', '999'),      # first row wins
+    ('123456789', '73726', '', 'abc'),      # unreadable
+]
+OTA_ROWS = [
+    ('order-2', '70450', '', '120'),
+    ('order-2', '70450', 'TC', '0'),
+    ('order-2', '70460', None, ''),
+    ('order-2', '70470', '', 'n/a'),        # unreadable
+]
+
+LINES = {
+    'bill-1': (IN_NETWORK, 'order-1', [
+        ('73721', ''), ('73721', 'TC'), ('73721', '26'), ('73721', '59'), ('73722', ''), ('73723', ''),
+        ('73724', ''), ('73725', ''), ('73727', ''), ('A4550', ''), ('', ''), ('73726', ''),
+    ]),
+    'bill-2': (OUT_OF_NETWORK, 'order-2', [
+        ('70450', ''), ('70450', 'TC'), ('70450', '26'), ('70460', ''), ('A4550', ''), ('70470', ''),
+    ]),
+    'bill-3': ({'Provider Network': 'In Network', 'TIN': ''}, 'order-3', [('73721', '')]),
+    'bill-4': ({'Provider Network': '', 'TIN': '123456789'}, 'order-4', [('73721', '')]),
+    'bill-5': ({'Provider Network': 'Pending', 'TIN': '123456789'}, 'order-5', [('73721', '')]),
+}
+
+# Lines whose rate row float() rejects
+UNREADABLE = {('73726', ''), ('70470', '')}
+
+
+def fixture_bills():
+    bills, line_id = [], 0
+    for bill_id, (provider, order_id, lines) in LINES.items():
+        items = []
+        for cpt_code, modifier in lines:
+            line_id += 1
+            items.append({'id': line_id, 'cpt_code': cpt_code, 'modifier': modifier})
+        bills.append({'bill_id': bill_id, 'bill_items': items, 'provider': provider, 'order_id': order_id})
+    return bills
+
+
+class BatchMatchesPerLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'monolith.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE ppo (TIN TEXT, proc_cd TEXT, modifier TEXT, rate)")
+        conn.execute("CREATE TABLE ota (ID_Order_PrimaryKey TEXT, CPT TEXT, modifier TEXT, rate)")
+        conn.executemany("INSERT INTO ppo VALUES (?, ?, ?, ?)", PPO_ROWS)
+        conn.executemany("INSERT INTO ota VALUES (?, ?, ?, ?)", OTA_ROWS)
+        conn.commit()
+        conn.close()
+
+        patch = mock.patch.object(rate_validation, 'load_ancillary_codes', return_value=ANCILLARY)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(rate_cache.enable_ppo_rate_cache, False)
+
+    def per_line(self, bill, item):
+        return rate_validation.validate_line_item_rate(
+            bill_id=bill['bill_id'], line_item=item, provider=bill['provider'], order_id=bill['order_id']
+        )
+
+    def test_batch_matches_per_line(self):
+        for cache in (False, True):
+            with self.subTest(rate_cache=cache), unit_of_work(self.db_path):
+                rate_cache.enable_ppo_rate_cache(cache)
+                bills = fixture_bills()
+                batch = rate_validation.resolve_bills_line_rates(bills)
+
+                for bill in bills:
+                    for item in bill['bill_items']:
+                        if (item['cpt_code'], item['modifier']) in UNREADABLE:
+                            # Left to the per-line path, which decides how it fails
+                            self.assertNotIn(item['id'], batch)
+                            continue
+                        expected = self.per_line(bill, item)
+                        self.assertEqual(batch[item['id']], expected, (bill['bill_id'], item))
+                        self.assertIs(type(batch[item['id']][2]), type(expected[2]))
+
+    def test_unreadable_rate_fails_only_its_line(self):
+        bills = fixture_bills()
+        unreadable = [
+            (bill, item) for bill in bills for item in bill['bill_items']
+            if (item['cpt_code'], item['modifier']) in UNREADABLE
+        ]
+        with unit_of_work(self.db_path):
+            rate_cache.enable_ppo_rate_cache(False)
+            for bill, item in unreadable:
+                with self.assertRaises(ValueError):
+                    self.per_line(bill, item)
+
+
+if __name__ == '__main__':
+    unittest.main()
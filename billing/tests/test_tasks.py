@@ -0,0 +1,94 @@
+"""
+Eager-mode check that the Celery fan-out in billing/tasks.py produces the
+same summary dict as run_processing for the same MAPPED bills.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+sys.path.append(str(PROJECT_ROOT / 'billing' / 'webapp'))
+
+HAS_CELERY = all(importlib.util.find_spec(name) for name in ('celery', 'django'))
+
+# Every outcome bucket, spread over several chunks
+OUTCOMES = {
+    f"bill-{i:02d}": status
+    for i, status in enumerate(['SUCCESS', 'FLAGGED', 'ARTHROGRAM', 'ERROR', 'SUCCESS', 'FLAGGED', 'SUCCESS'] * 3)
+}
+
+
+def fake_process_bill(bill_id, bill_data=None, line_rates=None):
+    return {"status": OUTCOMES[bill_id], "message": "test"}
+
+
+@unittest.skipUnless(HAS_CELERY, "celery and django are required")
+class DispatchMappedBillsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cdx_ehr.settings')
+        # Run tasks in-process with an in-memory broker and results: no Redis needed
+        os.environ['CELERY_TASK_ALWAYS_EAGER'] = '1'
+        os.environ.setdefault('CELERY_BROKER_URL', 'memory://')
+        os.environ.setdefault('CELERY_RESULT_BACKEND', 'cache+memory://')
+        # process/main.py logs to billing/logs at import time
+        (PROJECT_ROOT / 'billing' / 'logs').mkdir(exist_ok=True)
+
+        # Creates the project's Celery app, which the shared tasks bind to
+        import cdx_ehr.celery  # noqa: F401
+
+        import billing.tasks as tasks
+        import billing.logic.process.main as main
+        cls.tasks, cls.main = tasks, main
+
+    def setUp(self):
+        # unit_of_work() opens monolith.db in the working directory
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+        bills = [{'id': bill_id} for bill_id in OUTCOMES]
+        load = mock.Mock(side_effect=lambda limit=None: bills[:limit] if limit else bills)
+        patches = [
+            mock.patch.object(self.main, 'load_mapped_bills', load),
+            mock.patch.object(self.tasks, 'load_mapped_bills', load),
+            mock.patch.object(self.main, 'process_bill', fake_process_bill),
+            mock.patch.object(self.main, 'refresh_ppo_rates_if_stale'),
+            mock.patch.object(self.main, 'refresh_reference_data'),
+            mock.patch.object(self.main, 'ensure_ppo_tin_key'),
+            mock.patch.object(self.main, 'get_cpt_category_map'),
+            mock.patch.object(self.main, 'write_metrics_report'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_summary_matches_run_processing(self):
+        expected = self.main.run_processing(batch_size=None, rate_cache=False)
+
+        for chunk_size in (1, 4, len(OUTCOMES)):
+            with self.subTest(chunk_size=chunk_size):
+                result = self.tasks.dispatch_mapped_bills(chunk_size=chunk_size, batch_size=None, rate_cache=False)
+                self.assertEqual(result.get(), expected)
+
+    def test_limit_and_empty_run(self):
+        expected = self.main.run_processing(limit=5, batch_size=None, rate_cache=False)
+        self.assertEqual(self.tasks.dispatch_mapped_bills(limit=5, chunk_size=2, batch_size=None).get(), expected)
+
+        with mock.patch.object(self.tasks, 'load_mapped_bills', return_value=[]):
+            self.assertEqual(self.tasks.dispatch_mapped_bills().get(), self.main.empty_results(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
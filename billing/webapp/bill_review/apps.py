@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from .utils import register_order_key_functions
+
+
+def register_sql_functions(sender, connection, **kwargs):
+    """Order searches call the order key functions on every SQLite connection."""
+    if connection.vendor == 'sqlite':
+        register_order_key_functions(connection.connection)
 
 
 class BillReviewConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bill_review"
+
+    def ready(self):
+        connection_created.connect(register_sql_functions)
@@ -36,6 +36,21 @@ def normalize_date(date_str: str) -> Optional[datetime.date]:
             continue
     return None
 
+def order_dos_key(dos: str) -> str:
+    """DOS as stored in order_line_items.dos_iso: YYYY-MM-DD, or '' if it cannot be parsed."""
+    d = normalize_date(dos)
+    return d.isoformat() if d else ''
+
+def register_order_key_functions(conn) -> None:
+    """
+    Make the order key functions callable from SQL on a sqlite3 connection.
+
+    The preprocess pipeline stores these keys (order_keys.py); the order
+    searches use the functions for rows it has not keyed yet.
+    """
+    conn.create_function('order_name_key', 1, clean_name, deterministic=True)
+    conn.create_function('order_dos_key', 1, order_dos_key, deterministic=True)
+
 def similar(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
@@ -6,7 +6,8 @@ from django.http import HttpResponseRedirect, HttpResponse, Http404
 from django.contrib import messages
 import logging
 from .forms import BillUpdateForm, LineItemUpdateForm, OTARateForm, PPORateForm, BillMappingForm, AddLineItemForm
-from .utils import extract_last_name, normalize_date, similar
+from .utils import extract_last_name, normalize_date, similar, clean_name
+from config.s3_utils import find_bill_keys, get_s3_client
 from django.contrib.auth.decorators import login_required
 import boto3
 import os
@@ -15,6 +16,7 @@ from botocore.exceptions import ClientError
 from django.views.decorators.http import require_GET, require_http_methods
 import uuid
 from datetime import date, timedelta, datetime
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -715,6 +717,31 @@ def dashboard(request):
         messages.error(request, "An error occurred while loading the dashboard.")
         return render(request, 'bill_review/dashboard.html', {})
 
+# Order match keys are filled by the preprocess pipeline (order_keys.py). Rows it has
+# not reached yet (NULL keys) are keyed on the fly with the SQL functions registered in
+# apps.py, and DOS values it could not parse ('') fall back to the raw DOS.
+ORDER_DOS_SQL = "COALESCE(NULLIF(COALESCE(oli.dos_iso, order_dos_key(oli.DOS)), ''), oli.DOS)"
+
+# DOS between two bounds, each bound passed twice: the indexed dos_iso range, then the
+# fallback for rows without a usable key
+ORDER_DOS_RANGE_SQL = (
+    f"(oli.dos_iso >= %s AND oli.dos_iso <= %s"
+    f" OR (oli.dos_iso IS NULL OR oli.dos_iso = '') AND {ORDER_DOS_SQL} >= %s AND {ORDER_DOS_SQL} <= %s)"
+)
+
+def order_name_filter(key_column, raw_column, name):
+    """
+    Prefix match of the cleaned name on an indexed key column, as (sql, params).
+
+    Unkeyed rows are matched on the same cleaned form of their raw column.
+    """
+    key = clean_name(name) or name.lower()
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+    sql = (f"({key_column} >= %s AND {key_column} < %s"
+           f" OR {key_column} IS NULL AND order_name_key({raw_column}) >= %s AND order_name_key({raw_column}) < %s)")
+    return sql, [key, upper, key, upper]
+
+@lru_cache(maxsize=4096)
 def normalize_date(date_str):
     if not date_str:
         return None
@@ -802,47 +829,52 @@ def bill_detail(request, bill_id):
                             date_from = mapping_form.cleaned_data.get('date_from')
                             date_to = mapping_form.cleaned_data.get('date_to')
                             
+                            last_name_sql, last_name_params = order_name_filter(
+                                'o.patient_last_key', 'o.Patient_Last_Name', patient_last_name)
+
                             # Build the query based on available date parameters
-                            query = """
+                            query = f"""
                                 SELECT DISTINCT 
                                     o.Order_ID,
                                     o.Patient_Last_Name,
                                     o.Patient_First_Name,
                                     o.Patient_DOB,
-                                    MIN(oli.DOS) as earliest_dos,
-                                    MAX(oli.DOS) as latest_dos,
+                                    MIN({ORDER_DOS_SQL}) as earliest_dos,
+                                    MAX({ORDER_DOS_SQL}) as latest_dos,
                                     COUNT(oli.CPT) as cpt_count,
                                     GROUP_CONCAT(DISTINCT oli.CPT) as cpt_codes,
-                                    MIN(ABS(julianday(oli.DOS) - julianday(%s))) as min_date_diff
+                                    MIN(ABS(julianday({ORDER_DOS_SQL}) - julianday(%s))) as min_date_diff
                                 FROM orders o
                                 JOIN order_line_items oli ON o.Order_ID = oli.Order_ID
-                                WHERE o.Patient_Last_Name LIKE %s
+                                WHERE {last_name_sql}
                             """
-                            params = [date.today().strftime('%Y-%m-%d'), f'%{patient_last_name}%']
+                            params = [date.today().strftime('%Y-%m-%d'), *last_name_params]
                             
                             # Add first name condition if provided
                             if patient_first_name:
-                                query += " AND o.Patient_First_Name LIKE %s"
-                                params.append(f'%{patient_first_name}%')
+                                first_name_sql, first_name_params = order_name_filter(
+                                    'o.patient_first_key', 'o.Patient_First_Name', patient_first_name)
+                                query += f" AND {first_name_sql}"
+                                params.extend(first_name_params)
                                 logger.info(f"Adding first name search: {patient_first_name}")
                             
                             # Handle date range logic
                             if date_from and date_to:
                                 # Both dates provided - use exact range
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
-                                params.extend([date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
+                                params.extend(2 * [date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
                                 logger.info(f"Using exact date range: {date_from} to {date_to}")
                             elif date_from:
                                 # Only start date - search forward 30 days
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
                                 end_date = date_from + timedelta(days=30)
-                                params.extend([date_from.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
+                                params.extend(2 * [date_from.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
                                 logger.info(f"Using forward date range from {date_from} to {end_date}")
                             elif date_to:
                                 # Only end date - search backward 30 days
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
                                 start_date = date_to - timedelta(days=30)
-                                params.extend([start_date.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
+                                params.extend(2 * [start_date.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
                                 logger.info(f"Using backward date range from {start_date} to {date_to}")
                             else:
                                 # No dates provided - no date restrictions
@@ -1301,47 +1333,52 @@ def bill_detail(request, bill_id):
                         with connection.cursor() as search_cursor:
                             logger.info(f"Searching for: '{search_last_name}' with date range: {date_from} to {date_to}")
                             
+                            last_name_sql, last_name_params = order_name_filter(
+                                'o.patient_last_key', 'o.Patient_Last_Name', search_last_name)
+
                             # Build the query based on available date parameters
-                            query = """
+                            query = f"""
                                 SELECT DISTINCT 
                                     o.Order_ID,
                                     o.Patient_Last_Name,
                                     o.Patient_First_Name,
                                     o.Patient_DOB,
-                                    MIN(oli.DOS) as earliest_dos,
-                                    MAX(oli.DOS) as latest_dos,
+                                    MIN({ORDER_DOS_SQL}) as earliest_dos,
+                                    MAX({ORDER_DOS_SQL}) as latest_dos,
                                     COUNT(oli.CPT) as cpt_count,
                                     GROUP_CONCAT(DISTINCT oli.CPT) as cpt_codes,
-                                    MIN(ABS(julianday(oli.DOS) - julianday(%s))) as min_date_diff
+                                    MIN(ABS(julianday({ORDER_DOS_SQL}) - julianday(%s))) as min_date_diff
                                 FROM orders o
                                 JOIN order_line_items oli ON o.Order_ID = oli.Order_ID
-                                WHERE o.Patient_Last_Name LIKE %s
+                                WHERE {last_name_sql}
                             """
-                            params = [target_date.strftime('%Y-%m-%d'), f'%{search_last_name}%']
+                            params = [target_date.strftime('%Y-%m-%d'), *last_name_params]
                             
                             # Add first name condition if provided
                             if search_first_name:
-                                query += " AND o.Patient_First_Name LIKE %s"
-                                params.append(f'%{search_first_name}%')
+                                first_name_sql, first_name_params = order_name_filter(
+                                    'o.patient_first_key', 'o.Patient_First_Name', search_first_name)
+                                query += f" AND {first_name_sql}"
+                                params.extend(first_name_params)
                                 logger.info(f"Adding first name search: {search_first_name}")
                             
                             # Handle date range logic
                             if date_from and date_to:
                                 # Both dates provided - use exact range
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
-                                params.extend([date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
+                                params.extend(2 * [date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
                                 logger.info(f"Using exact date range: {date_from} to {date_to}")
                             elif date_from:
                                 # Only start date - search forward 30 days
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
                                 end_date = date_from + timedelta(days=30)
-                                params.extend([date_from.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
+                                params.extend(2 * [date_from.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
                                 logger.info(f"Using forward date range from {date_from} to {end_date}")
                             elif date_to:
                                 # Only end date - search backward 30 days
-                                query += " AND oli.DOS >= %s AND oli.DOS <= %s"
+                                query += f" AND {ORDER_DOS_RANGE_SQL}"
                                 start_date = date_to - timedelta(days=30)
-                                params.extend([start_date.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
+                                params.extend(2 * [start_date.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')])
                                 logger.info(f"Using backward date range from {start_date} to {date_to}")
                             else:
                                 # No dates provided - no date restrictions
@@ -1625,14 +1662,6 @@ def update_bill(request, bill_id):
 def view_bill_pdf(request, bill_id):
     """Generate a pre-signed URL for the bill PDF in S3."""
     try:
-        # Initialize S3 client
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-2')
-        )
-        
         # Define S3 bucket
         bucket_name = os.environ.get('S3_BUCKET', 'bill-review-prod')
         
@@ -1647,57 +1676,36 @@ def view_bill_pdf(request, bill_id):
             order_id = row[0] if row else None
             logger.info(f"Bill {bill_id} has order_id: {order_id}")
         
-        # First, try to find the PDF by searching the entire bucket
-        logger.info(f"Searching for PDF with bill_id {bill_id} anywhere in bucket")
-        
+        # Look the PDF up in the S3 object index, by bill_id and then by order_id
         try:
-            paginator = s3_client.get_paginator('list_objects_v2')
-            for page in paginator.paginate(Bucket=bucket_name, Prefix=''):
-                if 'Contents' not in page:
+            for lookup_id in [bill_id, order_id]:
+                if not lookup_id:
                     continue
-                for obj in page['Contents']:
-                    key = obj['Key']
-                    if bill_id in key and key.lower().endswith('.pdf'):
-                        logger.info(f"Found potential PDF: {key}")
-                        pdf_key = key
-                        url = s3_client.generate_presigned_url(
-                            'get_object',
-                            Params={
-                                'Bucket': bucket_name,
-                                'Key': pdf_key,
-                                'ResponseContentType': 'application/pdf'
-                            },
-                            ExpiresIn=3600  # URL expires in 1 hour
-                        )
-                        logger.info(f"Successfully generated pre-signed URL for: {pdf_key}")
-                        return HttpResponseRedirect(url)
-            
-            # If no match found with bill_id, try with order_id if available
-            if order_id:
-                logger.info(f"Searching for PDF with order_id {order_id} anywhere in bucket")
-                
-                for page in paginator.paginate(Bucket=bucket_name, Prefix=''):
-                    if 'Contents' not in page:
-                        continue
-                    for obj in page['Contents']:
-                        key = obj['Key']
-                        if order_id in key and key.lower().endswith('.pdf'):
-                            logger.info(f"Found potential PDF with order_id: {key}")
-                            pdf_key = key
-                            url = s3_client.generate_presigned_url(
-                                'get_object',
-                                Params={
-                                    'Bucket': bucket_name,
-                                    'Key': pdf_key,
-                                    'ResponseContentType': 'application/pdf'
-                                },
-                                ExpiresIn=3600
-                            )
-                            logger.info(f"Successfully generated pre-signed URL for: {pdf_key}")
-                            return HttpResponseRedirect(url)
-                        
+                pdf_keys = find_bill_keys(lookup_id, suffix='.pdf', bucket=bucket_name)
+                if not pdf_keys:
+                    continue
+                pdf_key = pdf_keys[0]
+                logger.info(f"Found PDF for {lookup_id}: {pdf_key}")
+                url = get_s3_client().generate_presigned_url(
+                    'get_object',
+                    Params={
+                        'Bucket': bucket_name,
+                        'Key': pdf_key,
+                        'ResponseContentType': 'application/pdf'
+                    },
+                    ExpiresIn=3600  # URL expires in 1 hour
+                )
+                logger.info(f"Successfully generated pre-signed URL for: {pdf_key}")
+                return HttpResponseRedirect(url)
+
+            # Only the stage prefixes are indexed, so a PDF stored anywhere else misses both lookups
+            logger.warning(
+                f"No PDF indexed for bill {bill_id} or order {order_id}; if it exists it is outside "
+                f"the tracked S3 prefixes (locate it with file_id_debug.py --full-scan)"
+            )
+
         except Exception as e:
-            logger.error(f"Error searching bucket for PDF: {str(e)}")
+            logger.error(f"Error looking up PDF in S3 object index: {str(e)}")
         
         # If we get here, none of the searches worked
         logger.error(f"Failed to find PDF for bill {bill_id} in bucket {bucket_name}")
@@ -0,0 +1,33 @@
+# billing/webapp/cdx_ehr/celery.py
+# Celery configuration for the cdx_ehr project.
+# Start a worker from billing/webapp with: celery -A cdx_ehr.celery worker
+
+import os
+import sys
+from pathlib import Path
+from celery import Celery
+
+# billing.tasks is imported from the repo root
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+sys.path.append(str(PROJECT_ROOT))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cdx_ehr.settings')
+
+app = Celery('cdx_ehr')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+# billing is not a Django app, so name its tasks package explicitly
+app.autodiscover_tasks(['billing'])
+
+
+@app.on_after_configure.connect
+def create_filesystem_broker_folders(sender, **kwargs):
+    """The filesystem:// transport expects its folders to exist already."""
+    if not str(sender.conf.broker_url or '').startswith('filesystem://'):
+        return
+    options = sender.conf.broker_transport_options or {}
+    folders = [options.get('data_folder_in'), options.get('data_folder_processed')]
+    backend = str(sender.conf.result_backend or '')
+    if backend.startswith('file://'):
+        folders.append(backend[len('file://'):])
+    for folder in filter(None, folders):
+        Path(folder).mkdir(parents=True, exist_ok=True)
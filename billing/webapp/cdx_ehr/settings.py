@@ -1,11 +1,17 @@
 # billing/webapp/cdx_ehr/settings.py
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The views use the S3 helpers in the repo-level config package
+PROJECT_ROOT = BASE_DIR.parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
 # Load environment variables from .env file in the root directory
 load_dotenv(BASE_DIR.parent.parent / '.env')
 
@@ -108,4 +114,30 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Celery, read by the project's celery.py under the CELERY_ namespace
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+
+# Run tasks in-process (tests, local debugging) with CELERY_TASK_ALWAYS_EAGER=1
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER') == '1'
+
+# CELERY_BROKER_URL=filesystem:// stands in for Redis on a single machine,
+# keeping queued messages and results under celery_data/ in the repo root;
+# celery.py creates the folders when the app is configured
+CELERY_DATA_DIR = BASE_DIR.parent.parent / 'celery_data'
+if CELERY_BROKER_URL.startswith('filesystem://'):
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': str(CELERY_DATA_DIR / 'queue'),
+        'data_folder_out': str(CELERY_DATA_DIR / 'queue'),
+        'data_folder_processed': str(CELERY_DATA_DIR / 'processed'),
+        'store_processed': False,
+    }
+    CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', f"file://{CELERY_DATA_DIR / 'results'}")
+
+# Bills per task when billing.tasks.dispatch_mapped_bills fans out processing
+BILL_PROCESSING_CHUNK_SIZE = int(os.getenv('BILL_PROCESSING_CHUNK_SIZE', '200'))
@@ -0,0 +1,247 @@
+"""
+Local index of bill artifacts stored in S3.
+
+The s3_object_index table maps each object key to the bill it belongs to
+and the pipeline stage its prefix represents, so "where is bill X's PDF?"
+is an indexed query instead of a paginated listing of the whole bucket.
+The s3_utils upload/move/delete helpers record their changes here as they
+make them; reconcile() relists the known stage prefixes to pick up objects
+written by anything else and to drop ones that have disappeared.
+"""
+import os
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+#   …/monolith/config/s3_index.py → …/monolith/billing/cache
+S3_INDEX_PATH = Path(os.getenv(
+    'S3_INDEX_PATH',
+    str(Path(__file__).resolve().parents[1] / 'billing' / 'cache' / 's3_object_index.db')
+))
+
+# Stage prefixes in the bill review bucket; the longest matching prefix names a key's stage
+STAGE_PREFIXES = {
+    'data/ProviderBills/pdf/': 'pdf',
+    'data/ProviderBills/pdf/archive/': 'pdf_archive',
+    'data/ProviderBills/txt/': 'txt',
+    'data/ProviderBills/txt/archive/': 'txt_archive',
+    'data/ProviderBills/json/': 'json',
+    'data/ProviderBills/json/archive/': 'json_archive',
+    'backup_pdfs/': 'backup_pdf',
+    'backup_ocr_files/': 'backup_ocr',
+}
+
+
+def stage_for_key(key: str) -> Optional[str]:
+    """Stage of the deepest known prefix directly containing key, or None for untracked keys."""
+    parent = key.rsplit('/', 1)[0] + '/' if '/' in key else ''
+    return STAGE_PREFIXES.get(parent)
+
+
+def bill_id_for_key(key: str) -> str:
+    """Bill artifacts are named after their ProviderBill ID: <prefix>/<bill_id>.<ext>."""
+    return Path(key).stem
+
+
+def _timestamp(value) -> str:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat()
+    return value or datetime.now(timezone.utc).isoformat()
+
+
+class S3ObjectIndex:
+    """SQLite table of (bill_id, stage, key, size, etag, last_modified) per tracked S3 object."""
+
+    def __init__(self, path: Union[str, Path] = S3_INDEX_PATH):
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS s3_object_index (
+                    bucket TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    bill_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    size INTEGER,
+                    etag TEXT,
+                    last_modified TEXT,
+                    PRIMARY KEY (bucket, key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_s3_object_index_bill
+                    ON s3_object_index (bill_id, stage);
+                CREATE TABLE IF NOT EXISTS s3_index_reconcile (
+                    bucket TEXT NOT NULL,
+                    prefix TEXT NOT NULL,
+                    reconciled_at TEXT NOT NULL,
+                    PRIMARY KEY (bucket, prefix)
+                );
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def record(self, bucket: str, key: str, size: int = None, etag: str = None, last_modified=None):
+        """Add or update one object; keys outside the stage prefixes are ignored."""
+        self.record_many(bucket, [{'Key': key, 'Size': size, 'ETag': etag, 'LastModified': last_modified}])
+
+    def record_many(self, bucket: str, objects: Iterable[dict]):
+        """Add or update objects given as list_objects_v2 'Contents' entries."""
+        rows = [
+            (bucket, obj['Key'], bill_id_for_key(obj['Key']), stage, obj.get('Size'),
+             (obj.get('ETag') or '').strip('"') or None, _timestamp(obj.get('LastModified')))
+            for obj in objects
+            for stage in [stage_for_key(obj['Key'])]
+            if stage
+        ]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("""
+                INSERT OR REPLACE INTO s3_object_index
+                    (bucket, key, bill_id, stage, size, etag, last_modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+
+    def remove_many(self, bucket: str, keys: Iterable[str]):
+        rows = [(bucket, key) for key in keys]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM s3_object_index WHERE bucket = ? AND key = ?", rows)
+            conn.commit()
+
+    def find(self, bill_id: str, bucket: str, stages: Iterable[str] = None,
+             suffix: str = None) -> List[str]:
+        """
+        Keys indexed for a bill, optionally limited to some stages and a file extension.
+
+        Input-stage keys sort before archived ones, so the first key is the
+        live copy when a bill is in both.
+        """
+        sql = "SELECT key FROM s3_object_index WHERE bucket = ? AND bill_id = ?"
+        params: list = [bucket, bill_id]
+        if stages:
+            stages = list(stages)
+            sql += f" AND stage IN ({','.join('?' * len(stages))})"
+            params += stages
+        if suffix:
+            sql += " AND key LIKE ?"
+            params.append(f"%{suffix}")
+        sql += " ORDER BY stage LIKE '%archive', key"
+        with self._lock:
+            return [row[0] for row in self._connection().execute(sql, params)]
+
+    def keys_in_stage(self, stage: str, bucket: str) -> List[str]:
+        """Every indexed key of one stage."""
+        with self._lock:
+            return [row[0] for row in self._connection().execute(
+                "SELECT key FROM s3_object_index WHERE bucket = ? AND stage = ? ORDER BY key",
+                (bucket, stage)
+            )]
+
+    def locations(self, bucket: str, suffix: str = None) -> Dict[str, List[str]]:
+        """bill_id -> indexed keys, in one pass over the table."""
+        sql = "SELECT bill_id, key FROM s3_object_index WHERE bucket = ?"
+        params: list = [bucket]
+        if suffix:
+            sql += " AND key LIKE ?"
+            params.append(f"%{suffix}")
+        result: Dict[str, List[str]] = {}
+        with self._lock:
+            for bill_id, key in self._connection().execute(sql + " ORDER BY key", params):
+                result.setdefault(bill_id, []).append(key)
+        return result
+
+    def reconciled_at(self, bucket: str, prefix: str) -> Optional[datetime]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT reconciled_at FROM s3_index_reconcile WHERE bucket = ? AND prefix = ?",
+                (bucket, prefix)
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def reconcile(self, client, bucket: str, prefixes: Iterable[str] = None,
+                  max_age_seconds: float = None) -> Dict[str, int]:
+        """
+        Bring the index in line with S3 for the given stage prefixes.
+
+        Each prefix is listed on its own (with Delimiter='/', so the archive
+        below pdf/ is not listed twice) rather than the whole bucket. Only rows
+        whose size or ETag changed are rewritten, and rows for keys that are
+        gone are deleted. Prefixes reconciled less than max_age_seconds ago
+        are skipped, so callers can reconcile on every run cheaply.
+
+        Args:
+            client: boto3 S3 client
+            bucket: Bucket to reconcile
+            prefixes: Stage prefixes to relist (defaults to all of STAGE_PREFIXES)
+            max_age_seconds: Skip prefixes reconciled more recently than this
+
+        Returns:
+            dict with counts of 'listed', 'added', 'updated', 'removed' and 'skipped' prefixes
+        """
+        counts = {'listed': 0, 'added': 0, 'updated': 0, 'removed': 0, 'skipped': 0}
+        now = datetime.now(timezone.utc)
+        paginator = client.get_paginator('list_objects_v2')
+
+        for prefix in (prefixes or STAGE_PREFIXES):
+            stage = STAGE_PREFIXES[prefix]
+            last = self.reconciled_at(bucket, prefix)
+            if max_age_seconds is not None and last and (now - last).total_seconds() < max_age_seconds:
+                counts['skipped'] += 1
+                continue
+
+            listed = {
+                obj['Key']: obj
+                for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/')
+                for obj in page.get('Contents', [])
+            }
+            counts['listed'] += len(listed)
+
+            with self._lock:
+                known = {
+                    key: (size, etag)
+                    for key, size, etag in self._connection().execute(
+                        "SELECT key, size, etag FROM s3_object_index WHERE bucket = ? AND stage = ?",
+                        (bucket, stage)
+                    )
+                }
+            changed = []
+            for key, obj in listed.items():
+                if key not in known:
+                    counts['added'] += 1
+                    changed.append(obj)
+                elif known[key] != (obj.get('Size'), obj.get('ETag', '').strip('"')):
+                    counts['updated'] += 1
+                    changed.append(obj)
+            gone = [key for key in known if key not in listed]
+            counts['removed'] += len(gone)
+
+            self.record_many(bucket, changed)
+            self.remove_many(bucket, gone)
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO s3_index_reconcile (bucket, prefix, reconciled_at) VALUES (?, ?, ?)",
+                    (bucket, prefix, now.isoformat())
+                )
+                conn.commit()
+
+        logger.info(f"Reconciled s3://{bucket} index: {counts}")
+        return counts
+
+
+# Process-wide index shared by the s3_utils helpers and the lookup tools
+object_index = S3ObjectIndex()
@@ -1,22 +1,77 @@
 """
 S3 utility functions for interacting with AWS S3.
+
+All helpers share one cached, thread-safe client with a connection pool
+sized for the *_many batch functions. Set S3_ENDPOINT_URL to point them at
+a local S3 stand-in (e.g. moto server); call reset_s3_client() after
+changing credentials or starting a mock.
+
+Writes, moves and deletes are also recorded in the local S3 object index
+(config/s3_index.py), which find_bill_keys() queries instead of listing
+the bucket.
 """
 import os
+import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from pathlib import Path
+from config.s3_index import STAGE_PREFIXES, object_index
 
 logger = logging.getLogger(__name__)
 
+# Concurrent transfers per *_many call; the pool leaves headroom for other threads
+S3_MAX_WORKERS = int(os.getenv('S3_MAX_WORKERS', '16'))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', str(2 * S3_MAX_WORKERS)))
+
+# Most keys delete_objects accepts per request
+DELETE_BATCH_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
 def get_s3_client():
-    """Get an S3 client with credentials from environment variables."""
-    return boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-2')
-    )
+    """Get the shared S3 client, created once with credentials from environment variables."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.session.Session().client(
+                    's3',
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                    region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-2'),
+                    endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                    config=Config(
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        retries={'max_attempts': 5, 'mode': 'adaptive'}
+                    )
+                )
+    return _s3_client
+
+def reset_s3_client():
+    """Drop the shared client so the next call builds a new one."""
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = None
+
+def _update_index(method: str, *args):
+    """Apply a change to the object index; a failure there never fails the S3 call."""
+    try:
+        getattr(object_index, method)(*args)
+    except Exception as e:
+        logger.warning(f"Could not update S3 object index ({method}): {str(e)}")
+
+def _run_many(func: Callable[..., bool], items: List[Tuple], max_workers: int) -> List[bool]:
+    """Call func(*item) for every item on a thread pool; results in item order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        return list(pool.map(lambda item: func(*item), items))
 
 def upload(file_path: str, s3_key: str, bucket: str = None) -> bool:
     """
@@ -36,12 +91,129 @@ def upload(file_path: str, s3_key: str, bucket: str = None) -> bool:
     try:
         s3_client = get_s3_client()
         s3_client.upload_file(file_path, bucket, s3_key)
+        _update_index('record', bucket, s3_key, os.path.getsize(file_path))
         logger.info(f"Successfully uploaded {file_path} to s3://{bucket}/{s3_key}")
         return True
     except ClientError as e:
         logger.error(f"Error uploading {file_path} to s3://{bucket}/{s3_key}: {str(e)}")
         return False
 
+def put_bytes(data: bytes, s3_key: str, bucket: str = None, content_type: str = None) -> bool:
+    """
+    Upload in-memory bytes to S3 without writing a local file.
+    
+    Args:
+        data: Object contents
+        s3_key: S3 key (path) where the object will be stored
+        bucket: S3 bucket name (defaults to S3_BUCKET env var)
+        content_type: Optional Content-Type for the object
+    
+    Returns:
+        bool: True if upload was successful, False otherwise
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    
+    try:
+        extra = {'ContentType': content_type} if content_type else {}
+        response = get_s3_client().put_object(Bucket=bucket, Key=s3_key, Body=data, **extra)
+        _update_index('record', bucket, s3_key, len(data), response.get('ETag'))
+        logger.info(f"Successfully uploaded {len(data)} bytes to s3://{bucket}/{s3_key}")
+        return True
+    except ClientError as e:
+        logger.error(f"Error uploading bytes to s3://{bucket}/{s3_key}: {str(e)}")
+        return False
+
+def get_bytes(s3_key: str, bucket: str = None) -> Optional[bytes]:
+    """
+    Read an S3 object straight into memory.
+    
+    Returns:
+        bytes: Object contents, or None if it could not be read
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    
+    try:
+        response = get_s3_client().get_object(Bucket=bucket, Key=s3_key)
+        return response['Body'].read()
+    except ClientError as e:
+        logger.error(f"Error reading s3://{bucket}/{s3_key}: {str(e)}")
+        return None
+
+def put_json(data: Any, s3_key: str, bucket: str = None) -> bool:
+    """Serialize data as indented JSON and upload it from memory."""
+    body = json.dumps(data, indent=2).encode('utf-8')
+    return put_bytes(body, s3_key, bucket, content_type='application/json')
+
+def get_json(s3_key: str, bucket: str = None) -> Any:
+    """
+    Read and parse a JSON object from S3.
+    
+    Returns:
+        Parsed JSON, or None if the object could not be read
+    """
+    body = get_bytes(s3_key, bucket)
+    return None if body is None else json.loads(body)
+
+class S3LogWriter:
+    """
+    Buffered writer that appends lines to a log object in S3.
+    
+    Lines are collected in memory and added to the end of the existing
+    object once flush_every lines are waiting and on flush()/close(), instead
+    of uploading one object per error. Use it as a context manager.
+    """
+    
+    def __init__(self, s3_key: str, bucket: str = None, flush_every: int = 50):
+        self.s3_key = s3_key
+        self.bucket = bucket
+        self.flush_every = flush_every
+        self._lines: List[str] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+    
+    def write(self, line: str):
+        with self._lock:
+            self._lines.append(line.rstrip('\n'))
+            full = len(self._lines) >= self.flush_every
+        if full:
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Append the buffered lines to the log object; False (lines kept) if the upload failed."""
+        # One read-modify-write at a time, or concurrent flushes would overwrite each other's lines
+        with self._flush_lock:
+            with self._lock:
+                if not self._lines:
+                    return True
+                lines, self._lines = self._lines, []
+            
+            existing = b''
+            try:
+                response = get_s3_client().get_object(Bucket=self.bucket or os.getenv('S3_BUCKET'), Key=self.s3_key)
+                existing = response['Body'].read()
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                    logger.error(f"Error reading log s3://{self.bucket}/{self.s3_key}: {str(e)}")
+            if existing and not existing.endswith(b'\n'):
+                existing += b'\n'
+            
+            if put_bytes(existing + ('\n'.join(lines) + '\n').encode('utf-8'), self.s3_key, self.bucket, 'text/plain'):
+                return True
+            with self._lock:
+                self._lines = lines + self._lines
+            return False
+    
+    def close(self):
+        self.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
 def download(s3_key: str, local_path: str, bucket: str = None) -> bool:
     """
     Download a file from S3.
@@ -81,46 +253,221 @@ def list_objects(prefix: str, bucket: str = None) -> list:
         bucket = os.getenv('S3_BUCKET')
     
     try:
-        s3_client = get_s3_client()
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        return [obj['Key'] for obj in response.get('Contents', [])]
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        return [
+            obj['Key']
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
     except ClientError as e:
         logger.error(f"Error listing objects in s3://{bucket}/{prefix}: {str(e)}")
         return []
 
 def move(source_key: str, dest_key: str, bucket: str = None) -> bool:
+    """
+    Move an object within a bucket with a server-side copy and a delete.
+    
+    copy_object only returns once the destination is written (and raises if
+    the source is missing), so its response is the confirmation.
+    
+    Returns:
+        bool: True if the move was successful, False otherwise
+    """
     if bucket is None:
         bucket = os.getenv('S3_BUCKET')
     
     try:
         s3_client = get_s3_client()
-        
-        # First, verify source exists
-        try:
-            s3_client.head_object(Bucket=bucket, Key=source_key)
-        except ClientError:
-            logger.error(f"Source object does not exist: s3://{bucket}/{source_key}")
-            return False
-        
-        # Copy to new location
-        s3_client.copy_object(
+        response = s3_client.copy_object(
             Bucket=bucket,
             CopySource={'Bucket': bucket, 'Key': source_key},
             Key=dest_key
         )
-        
-        # Verify the copy was successful before deleting
-        try:
-            s3_client.head_object(Bucket=bucket, Key=dest_key)
-        except ClientError:
-            logger.error(f"Copy verification failed for: s3://{bucket}/{dest_key}")
-            return False
-        
-        # Only delete after successful copy verification
         s3_client.delete_object(Bucket=bucket, Key=source_key)
+        copied = response.get('CopyObjectResult', {})
+        _update_index('record', bucket, dest_key, None, copied.get('ETag'), copied.get('LastModified'))
+        _update_index('remove_many', bucket, [source_key])
         logger.info(f"Successfully moved s3://{bucket}/{source_key} to s3://{bucket}/{dest_key}")
         return True
         
     except ClientError as e:
         logger.error(f"Error moving s3://{bucket}/{source_key} to s3://{bucket}/{dest_key}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+def _copy(source_key: str, dest_key: str, bucket: str) -> bool:
+    try:
+        response = get_s3_client().copy_object(
+            Bucket=bucket,
+            CopySource={'Bucket': bucket, 'Key': source_key},
+            Key=dest_key
+        )
+        copied = response.get('CopyObjectResult', {})
+        _update_index('record', bucket, dest_key, None, copied.get('ETag'), copied.get('LastModified'))
+        return True
+    except ClientError as e:
+        logger.error(f"Error copying s3://{bucket}/{source_key} to s3://{bucket}/{dest_key}: {str(e)}")
+        return False
+
+def delete_many(keys: Iterable[str], bucket: str = None) -> Dict[str, bool]:
+    """
+    Delete objects with delete_objects, up to 1,000 keys per call.
+    
+    Returns:
+        dict: key -> True if that object was deleted
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    
+    keys = list(keys)
+    results = {key: True for key in keys}
+    s3_client = get_s3_client()
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        chunk = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            response = s3_client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+            )
+            for error in response.get('Errors', []):
+                results[error['Key']] = False
+                logger.error(f"Error deleting s3://{bucket}/{error['Key']}: {error.get('Message')}")
+        except ClientError as e:
+            logger.error(f"Error deleting {len(chunk)} objects in s3://{bucket}: {str(e)}")
+            results.update((key, False) for key in chunk)
+    _update_index('remove_many', bucket, [key for key, ok in results.items() if ok])
+    return results
+
+def upload_many(files: Iterable[Tuple[str, str]], bucket: str = None,
+                max_workers: int = S3_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Upload many files concurrently.
+    
+    Args:
+        files: (local file path, S3 key) pairs
+        bucket: S3 bucket name (defaults to S3_BUCKET env var)
+        max_workers: Uploads in flight at once
+    
+    Returns:
+        dict: S3 key -> True if that upload was successful
+    """
+    items = [(file_path, s3_key, bucket) for file_path, s3_key in files]
+    return {item[1]: ok for item, ok in zip(items, _run_many(upload, items, max_workers))}
+
+def download_many(files: Iterable[Tuple[str, str]], bucket: str = None,
+                  max_workers: int = S3_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Download many files concurrently.
+    
+    Args:
+        files: (S3 key, local file path) pairs
+        bucket: S3 bucket name (defaults to S3_BUCKET env var)
+        max_workers: Downloads in flight at once
+    
+    Returns:
+        dict: S3 key -> True if that download was successful
+    """
+    items = [(s3_key, local_path, bucket) for s3_key, local_path in files]
+    return {item[0]: ok for item, ok in zip(items, _run_many(download, items, max_workers))}
+
+def move_many(moves: Iterable[Tuple[str, str]], bucket: str = None,
+              max_workers: int = S3_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Move many objects: concurrent server-side copies, then batched deletes.
+    
+    Each successful copy_object response confirms its destination, and only
+    those sources are removed, with one delete_objects call per 1,000 keys.
+    N moves take N copies plus ceil(N / 1000) deletes instead of 4N calls.
+    
+    Args:
+        moves: (source key, destination key) pairs
+        bucket: S3 bucket name (defaults to S3_BUCKET env var)
+        max_workers: Copies in flight at once
+    
+    Returns:
+        dict: source key -> True if that object was moved
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    
+    items = [(source_key, dest_key, bucket) for source_key, dest_key in moves]
+    copied = {item[0]: ok for item, ok in zip(items, _run_many(_copy, items, max_workers))}
+    deleted = delete_many([key for key, ok in copied.items() if ok], bucket)
+    
+    results = {key: ok and deleted.get(key, False) for key, ok in copied.items()}
+    moved = sum(results.values())
+    logger.info(f"Moved {moved}/{len(results)} objects in s3://{bucket}")
+    return results
+
+def archive_many(keys: Iterable[str], archive_prefix: str, bucket: str = None,
+                 max_workers: int = S3_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Move objects under archive_prefix, keeping their file names.
+    
+    Returns:
+        dict: source key -> True if that object was archived
+    """
+    return move_many(((key, f"{archive_prefix}{Path(key).name}") for key in keys), bucket, max_workers)
+
+def reconcile_index(prefixes: Iterable[str] = None, bucket: str = None,
+                    max_age_seconds: float = None) -> Dict[str, int]:
+    """
+    Relist the stage prefixes and sync the local object index with them.
+    
+    Picks up objects written outside these helpers (console uploads, other
+    hosts) and drops ones that are gone. See S3ObjectIndex.reconcile().
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    return object_index.reconcile(get_s3_client(), bucket, prefixes, max_age_seconds)
+
+def find_bill_keys(bill_id: str, stages: Iterable[str] = None, suffix: str = None,
+                   bucket: str = None) -> List[str]:
+    """
+    Keys of a bill's artifacts, from the object index.
+    
+    The first key, the one callers open, is confirmed with head_object, since
+    an index row can outlive an object deleted or moved by something else. A
+    missing key's row is dropped and the next key is checked. When the index
+    has nothing (left) for the bill, the PDF input and archive keys are probed
+    with head_object (two requests, independent of bucket size) and recorded
+    if they exist, so a bill uploaded before the index existed is still found
+    without a reconcile.
+    
+    Args:
+        bill_id: ProviderBill ID the artifacts are named after
+        stages: Limit to these stages (see STAGE_PREFIXES), e.g. ['pdf', 'pdf_archive']
+        suffix: Limit to keys ending with this, e.g. '.pdf'
+        bucket: S3 bucket name (defaults to S3_BUCKET env var)
+    
+    Returns:
+        list: Matching keys, live (input) copies before archived ones
+    """
+    if bucket is None:
+        bucket = os.getenv('S3_BUCKET')
+    
+    keys = object_index.find(bill_id, bucket, stages, suffix)
+    while keys:
+        try:
+            get_s3_client().head_object(Bucket=bucket, Key=keys[0])
+            return keys
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', 'NotFound', '404'):
+                logger.warning(f"Could not confirm s3://{bucket}/{keys[0]}: {str(e)}")
+                return keys
+        logger.info(f"Dropping stale S3 object index entry s3://{bucket}/{keys[0]}")
+        _update_index('remove_many', bucket, [keys[0]])
+        keys = keys[1:]
+    
+    if suffix and not '.pdf'.endswith(suffix):
+        return []
+    
+    for prefix, stage in STAGE_PREFIXES.items():
+        if stage not in ('pdf', 'pdf_archive') or (stages and stage not in stages):
+            continue
+        key = f"{prefix}{bill_id}.pdf"
+        try:
+            head = get_s3_client().head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            continue
+        object_index.record(bucket, key, head.get('ContentLength'), head.get('ETag'), head.get('LastModified'))
+    return object_index.find(bill_id, bucket, stages, suffix)